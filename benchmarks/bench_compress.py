@@ -0,0 +1,109 @@
+'''
+Benchmark for ``compress_algo='auto'`` in :mod:`keybase.keybase`.
+
+Encrypts a mixed corpus -- text, JSON, random bytes standing in for media,
+a zlib stream standing in for an archive, and a compressible header in
+front of an incompressible body -- with the default ``ZIP`` compression
+and with ``'auto'``, and reports the time taken, the output size and what
+the chooser decided for each. It only uses the golden test key so it
+doesn't need network access::
+
+    python benchmarks/bench_compress.py --size 4194304 --iterations 5
+
+'''
+
+#pylint: disable=C0301
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN = os.path.join(HERE, os.pardir, 'test', 'golden')
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from keybase import keybase  # pylint: disable=C0413
+
+KEY_FINGERPRINT = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+
+WORDS = ('keybase', 'public', 'key', 'signature', 'verify', 'encrypt', 'the', 'a',
+         'user', 'proof', 'twitter', 'github', 'release', 'archive', 'of', 'and')
+
+def corpus(size):
+    '''
+    Returns the payloads to benchmark, by name, each about ``size`` bytes.
+    '''
+    rng = random.Random(42)
+    text = ' '.join(rng.choice(WORDS) for _ in range(size // 4)).encode('ascii')[:size]
+    records = []
+    while sum(len(record) for record in records) < size:
+        records.append(json.dumps({'id': len(records), 'user': rng.choice(WORDS), 'score': rng.random()}))
+    noise = os.urandom(size)
+    return {
+        'text': text,
+        'json': '\n'.join(records).encode('ascii')[:size],
+        'random': noise,
+        'zlib_archive': zlib.compress(os.urandom(size // 2) + text[:size // 2], 6),
+        'text_header_random_body': text[:size // 16] + noise[:size - size // 16],
+    }
+
+def timed(func, iterations):
+    '''
+    Calls ``func`` ``iterations`` times and returns the mean seconds per
+    call and the last result.
+    '''
+    start = time.time()
+    for _ in range(iterations):
+        result = func()
+    return ((time.time() - start) / iterations, result)
+
+def run(size, iterations):
+    '''
+    Runs every benchmark and returns the results as a dictionary.
+    '''
+    with open(os.path.join(GOLDEN, 'irc.public.key'), 'r') as fobj:
+        pkey = keybase.KeybasePublicKey(bundle=fobj.read(), key_fingerprint=KEY_FINGERPRINT)
+    results = {'size': size, 'iterations': iterations, 'payloads': {}}
+    totals = {'ZIP': 0.0, 'auto': 0.0}
+    for (name, data) in sorted(corpus(size).items()):
+        row = {'input_bytes': len(data)}
+        for mode in ('ZIP', 'auto'):
+            before = keybase.compression_chooser.stats()['decisions']
+            (seconds, encrypted) = timed(lambda: pkey.encrypt_bytes(data, compress_algo=mode), iterations)
+            row['{}_seconds'.format(mode)] = seconds
+            row['{}_output_bytes'.format(mode)] = len(encrypted)
+            totals[mode] += seconds
+            if mode == 'auto':
+                after = keybase.compression_chooser.stats()['decisions']
+                row['auto_choice'] = [algo for algo in after if after[algo] != before.get(algo, 0)]
+        results['payloads'][name] = row
+    results['total_seconds'] = totals
+    results['chooser'] = keybase.compression_chooser.stats()
+    pkey.close()
+    return results
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--size', type=int, default=1024 * 1024,
+                        help='bytes per payload (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=5,
+                        help='encryptions per payload and mode (default: %(default)s)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+    results = run(args.size, args.iterations)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
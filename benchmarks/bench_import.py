@@ -0,0 +1,95 @@
+'''
+Import-time benchmark for ``from keybase import keybase``.
+
+Runs a fresh interpreter with ``-X importtime`` several times, reports the
+median cumulative import time of :mod:`keybase.keybase` and exits with a
+non-zero status if it's over the regression threshold or if any of the
+heavy dependencies were pulled in by the import::
+
+    python benchmarks/bench_import.py --runs 15 --threshold-ms 25
+
+'''
+
+#pylint: disable=C0301
+
+from __future__ import print_function
+
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Modules that must only be loaded on first use, never at import time.
+LAZY_MODULES = ('gnupg', 'requests', 'subprocess', 'shutil', 'tempfile')
+
+PROBE = '''
+import sys
+from keybase import keybase
+print(','.join(m for m in {0!r} if m in sys.modules))
+'''.format(LAZY_MODULES)
+
+def measure():
+    '''
+    Imports the module in a fresh interpreter. Returns a tuple of the
+    cumulative import time in microseconds and the list of lazy modules
+    that were loaded anyway.
+
+    The interpreter runs with ``-S`` so that whatever ``site`` happens to
+    import on this machine doesn't hide what the import itself pulls in.
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT
+    proc = subprocess.Popen(
+        [sys.executable, '-S', '-X', 'importtime', '-c', PROBE],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        cwd=ROOT)
+    (out, err) = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(err.decode('utf-8', 'replace'))
+    cumulative = None
+    for line in err.decode('utf-8', 'replace').splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == 'keybase.keybase':
+            cumulative = int(fields[1])
+    loaded = [name for name in out.decode('utf-8').strip().split(',') if name]
+    return (cumulative, loaded)
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--runs', type=int, default=15,
+                        help='number of fresh interpreters to time (default: %(default)s)')
+    parser.add_argument('--threshold-ms', type=float, default=25.0,
+                        help='fail if the median import time is above this (default: %(default)s)')
+    args = parser.parse_args()
+    # Time the import the way it happens in a deployed package, from
+    # up-to-date byte code, rather than timing the compiler.
+    compileall.compile_dir(os.path.join(ROOT, 'keybase'), quiet=1)
+    timings = []
+    loaded = set()
+    for _ in range(args.runs):
+        (cumulative, modules) = measure()
+        timings.append(cumulative)
+        loaded.update(modules)
+    timings.sort()
+    median_ms = timings[len(timings) // 2] / 1000.0
+    print('keybase.keybase import: median {0:.2f} ms, min {1:.2f} ms, max {2:.2f} ms over {3} runs'.format(
+        median_ms, timings[0] / 1000.0, timings[-1] / 1000.0, len(timings)))
+    failed = False
+    if loaded:
+        print('FAIL: imported eagerly: {0}'.format(', '.join(sorted(loaded))))
+        failed = True
+    if median_ms > args.threshold_ms:
+        print('FAIL: median import time is over the {0:.2f} ms threshold'.format(args.threshold_ms))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
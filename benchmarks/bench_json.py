@@ -0,0 +1,141 @@
+'''
+Decoding benchmark for large keybase.io API responses.
+
+Builds a user/lookup.json style response with ``--users`` copies of the
+golden user and measures, for every available decoder:
+
+* the time to decode the whole body in one go, which is what
+  ``_get_json_from_url`` does,
+* the time until the first user comes out of the incremental parser used
+  by ``iter_lookup`` and the time to get all of them, feeding the body in
+  ``--chunk-size`` pieces the way a streamed response arrives,
+* the peak memory allocated by both, as seen by tracemalloc.
+
+It only uses the golden test data so it doesn't need network access::
+
+    python benchmarks/bench_json.py --users 500
+
+'''
+
+#pylint: disable=C0301
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN = os.path.join(HERE, os.pardir, 'test', 'golden')
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from keybase import keybase  # pylint: disable=C0413
+
+def response_body(users):
+    '''
+    Returns a lookup response body with ``users`` user objects in it.
+    '''
+    with open(os.path.join(GOLDEN, 'irc.public.key'), 'r') as fobj:
+        bundle = fobj.read()
+    user = {
+        'basics': {'username': 'irc'},
+        'profile': {'full_name': 'Ian Chesal', 'location': 'Bay Area, California'},
+        'public_keys': {'primary': {'bundle': bundle, 'key_fingerprint': '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'}},
+    }
+    document = {'status': {'code': 0, 'name': 'OK'}, 'them': [user] * users}
+    return json.dumps(document).encode('utf-8')
+
+def decoders():
+    '''
+    Returns the available decoders by name.
+    '''
+    available = {'json': keybase._stdlib_json_decoder}
+    try:
+        import orjson
+        available['orjson'] = orjson.loads
+    except ImportError:
+        pass
+    return available
+
+def whole(body, decoder):
+    '''
+    Decodes ``body`` in one go.
+    '''
+    return decoder(body)['them']
+
+def streamed(body, decoder, chunk_size, on_first=None):
+    '''
+    Feeds ``body`` to the incremental parser a chunk at a time, dropping
+    each user once it's decoded. Calls ``on_first`` when the first user
+    comes out.
+    '''
+    parser = keybase._JSONArrayStream('them', decoder)
+    for offset in range(0, len(body), chunk_size):
+        for _ in parser.feed(body[offset:offset + chunk_size]):
+            if on_first is not None:
+                on_first()
+                on_first = None
+    return parser.close()
+
+def timed(func):
+    '''
+    Returns the milliseconds ``func`` takes to run.
+    '''
+    start = time.time()
+    func()
+    return (time.time() - start) * 1000.0
+
+def peak_bytes(func):
+    '''
+    Returns the peak bytes allocated while ``func`` runs. It's measured
+    separately from the timings because tracing allocations slows Python
+    code down a lot more than it slows down the C decoders.
+    '''
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def run(users, chunk_size):
+    '''
+    Runs every benchmark and returns the results as a dictionary.
+    '''
+    body = response_body(users)
+    results = {'users': users, 'body_bytes': len(body), 'chunk_size': chunk_size, 'decoders': {}}
+    for (name, decoder) in sorted(decoders().items()):
+        first = []
+        start = time.time()
+        streamed_ms = timed(lambda: streamed(
+            body, decoder, chunk_size, lambda: first.append((time.time() - start) * 1000.0)))
+        results['decoders'][name] = {
+            'whole_ms': timed(lambda: whole(body, decoder)),
+            'whole_peak_bytes': peak_bytes(lambda: whole(body, decoder)),
+            'streamed_first_item_ms': first[0],
+            'streamed_ms': streamed_ms,
+            'streamed_peak_bytes': peak_bytes(lambda: streamed(body, decoder, chunk_size)),
+        }
+    return results
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--users', type=int, default=200,
+                        help='user objects in the response (default: %(default)s)')
+    parser.add_argument('--chunk-size', type=int, default=keybase.JSON_STREAM_CHUNK_SIZE,
+                        help='bytes fed to the incremental parser at a time (default: %(default)s)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+    results = run(args.users, args.chunk_size)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''
+Benchmark for building keyrings with :class:`keybase.KeybaseKeyring`.
+
+Generates a number of throwaway ed25519 keys with gpg and then times
+loading them the way a KeybasePublicKey per user does it -- a keyring and
+an import per key -- against one KeybaseKeyring holding all of them. It
+doesn't need network access::
+
+    python benchmarks/bench_keyring.py --keys 500
+
+'''
+
+#pylint: disable=C0301
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from keybase import keybase  # pylint: disable=C0413
+
+def generate(count, homedir):
+    '''
+    Generates ``count`` keys in ``homedir`` with one gpg run and returns a
+    list of ``(fingerprint, bundle)`` tuples.
+    '''
+    params = ''.join(
+        'Key-Type: eddsa\nKey-Curve: ed25519\nName-Real: Bench {0}\nName-Email: bench{0}@example.com\nExpire-Date: 0\n%no-protection\n%commit\n'.format(i)
+        for i in range(count))
+    gpg = [keybase.gpg(), '--homedir', homedir, '--batch']
+    subprocess.run(gpg + ['--gen-key'], input=params.encode('ascii'), stderr=subprocess.DEVNULL, check=True)
+    listing = subprocess.check_output(gpg + ['--with-colons', '--list-keys'], stderr=subprocess.DEVNULL).decode('ascii')
+    prints = [line.split(':')[9].lower() for line in listing.splitlines() if line.startswith('fpr:')]
+    return [(fpr, subprocess.check_output(gpg + ['--armor', '--export', fpr], stderr=subprocess.DEVNULL).decode('ascii'))
+            for fpr in prints]
+
+def run(count):
+    '''
+    Runs the benchmark and returns the results as a dictionary.
+    '''
+    homedir = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        keys = generate(count, homedir)
+        results = {'keys': len(keys), 'generate_seconds': time.time() - start}
+    finally:
+        subprocess.call(['gpgconf', '--homedir', homedir, '--kill', 'all'], stderr=subprocess.DEVNULL)
+        shutil.rmtree(homedir, ignore_errors=True)
+    start = time.time()
+    for (fpr, bundle) in keys:
+        keybase.KeybasePublicKey(bundle=bundle, key_fingerprint=fpr).close()
+    results['per_key_seconds'] = time.time() - start
+    start = time.time()
+    with keybase.KeybaseKeyring(dict((fpr, bundle) for (fpr, bundle) in keys)) as keyring:
+        results['keyring_seconds'] = time.time() - start
+        results['keyring_imported'] = len(keyring.fingerprints)
+        results['keyring_rejected'] = len(keyring.rejected)
+    results['speedup'] = results['per_key_seconds'] / results['keyring_seconds']
+    return results
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--keys', type=int, default=200,
+                        help='number of keys to load (default: %(default)s)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+    results = run(args.keys)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
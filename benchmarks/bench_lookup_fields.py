@@ -0,0 +1,90 @@
+'''
+Payload benchmark for field-selective user lookups.
+
+Fetches the same users from user/lookup.json with the complete user object
+and with only the sections named by ``--fields``, then reports the bytes
+transferred and the time spent parsing the JSON for each. Unlike the other
+benchmarks this one talks to the keybase.io API (or whatever ``--base-url``
+points at), so it needs network access::
+
+    python benchmarks/bench_lookup_fields.py irc chris max
+    python benchmarks/bench_lookup_fields.py --fields profile,public_keys --output fields.json irc
+
+'''
+
+#pylint: disable=C0301
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from keybase import keybase  # pylint: disable=C0413
+
+def fetch(usernames, fields):
+    '''
+    Fetches ``usernames`` in one user/lookup.json request and returns the
+    raw response body.
+    '''
+    import requests
+    params = {'usernames': ','.join(usernames)}
+    if fields:
+        params['fields'] = fields
+    response = requests.get(keybase._build_url('user/lookup.json'), params=params)
+    response.raise_for_status()
+    return response.content
+
+def parse_time(body, iterations):
+    '''
+    Returns the mean number of milliseconds it takes to parse ``body``.
+    '''
+    text = body.decode('utf-8')
+    start = time.time()
+    for _ in range(iterations):
+        json.loads(text)
+    return (time.time() - start) * 1000.0 / iterations
+
+def run(usernames, fields, iterations):
+    '''
+    Runs the benchmark and returns the results as a dictionary.
+    '''
+    results = {'usernames': usernames, 'fields': fields, 'iterations': iterations}
+    for (name, wanted) in (('full', None), ('fields', fields)):
+        body = fetch(usernames, wanted)
+        results[name] = {
+            'bytes': len(body),
+            'parse_ms': parse_time(body, iterations),
+        }
+    results['bytes_ratio'] = float(results['fields']['bytes']) / results['full']['bytes']
+    results['parse_ratio'] = results['fields']['parse_ms'] / results['full']['parse_ms']
+    return results
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--fields', default='profile,public_keys',
+                        help='sections to request (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=50,
+                        help='times to parse each response (default: %(default)s)')
+    parser.add_argument('--base-url', help='API base URL to use instead of keybase.io')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('usernames', nargs='*', default=['irc'])
+    args = parser.parse_args()
+    if args.base_url:
+        keybase.KEYBASE_BASE_URL = args.base_url
+    results = run(args.usernames, args.fields, args.iterations)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
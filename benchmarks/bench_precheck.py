@@ -0,0 +1,114 @@
+'''
+Benchmark for the structural pre-checks in :mod:`keybase.openpgp`.
+
+Measures how many calls per second :func:`keybase.openpgp.precheck_signature`
+handles for good and bad inputs, and how many junk inputs per second
+:func:`keybase.KeybasePublicKey.verify_bytes` can reject with the pre-check
+turned on compared to handing them all to gpg. It only uses the golden test
+data so it doesn't need network access::
+
+    python benchmarks/bench_precheck.py --iterations 200
+
+'''
+
+#pylint: disable=C0301
+
+from __future__ import print_function
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN = os.path.join(HERE, os.pardir, 'test', 'golden')
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from keybase import keybase  # pylint: disable=C0413
+from keybase import openpgp  # pylint: disable=C0413
+
+KEY_FINGERPRINT = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+
+def golden(fname, mode='rb'):
+    '''
+    Returns the contents of the golden file ``fname``.
+    '''
+    with open(os.path.join(GOLDEN, fname), mode) as fobj:
+        return fobj.read()
+
+def inputs():
+    '''
+    Returns the good and bad inputs to benchmark, by name.
+    '''
+    sig = golden('helloworld.txt.sig')
+    def armor(checksum):
+        return b''.join([
+            b'-----BEGIN PGP SIGNATURE-----\n\n', base64.encodebytes(sig),
+            b'=', base64.b64encode(checksum.to_bytes(3, 'big')),
+            b'\n-----END PGP SIGNATURE-----\n'])
+    armored = armor(openpgp.crc24(sig))
+    return {
+        'good_binary_message': golden('helloworld.txt.gpg'),
+        'good_detached_sig': sig,
+        'good_clearsigned': b'-----BEGIN PGP SIGNED MESSAGE-----\nHash: SHA1\n\nHello, world!\n' + armored,
+        'junk_text_64k': b'x' * 64 * 1024,
+        'junk_binary_64k': os.urandom(64 * 1024),
+        'junk_bad_crc': armor(openpgp.crc24(sig) ^ 1),
+    }
+
+def timed(func, iterations):
+    '''
+    Calls ``func`` ``iterations`` times and returns the calls per second.
+    '''
+    start = time.time()
+    for _ in range(iterations):
+        func()
+    elapsed = time.time() - start
+    return iterations / elapsed if elapsed > 0 else float('inf')
+
+def quietly(func, *args):
+    '''
+    Calls ``func`` and swallows the OpenPGPError it may raise.
+    '''
+    try:
+        func(*args)
+    except openpgp.OpenPGPError:
+        pass
+
+def run(iterations):
+    '''
+    Runs every benchmark and returns the results as a dictionary.
+    '''
+    pkey = keybase.KeybasePublicKey(bundle=golden('irc.public.key', 'r'), key_fingerprint=KEY_FINGERPRINT)
+    allowed = pkey.key_ids
+    results = {'iterations': iterations, 'precheck_per_second': {}, 'verify_per_second': {}}
+    for (name, data) in sorted(inputs().items()):
+        results['precheck_per_second'][name] = timed(
+            lambda: quietly(openpgp.precheck_signature, data, allowed), iterations)
+        for enabled in (False, True):
+            keybase.PRECHECK_SIGNATURES = enabled
+            label = '{}_{}'.format(name, 'precheck' if enabled else 'gpg_only')
+            results['verify_per_second'][label] = timed(lambda: pkey.verify_bytes(data), max(1, iterations // 10))
+    keybase.PRECHECK_SIGNATURES = True
+    pkey.close()
+    return results
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='pre-check calls per input; verify makes a tenth as many (default: %(default)s)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+    results = run(args.iterations)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
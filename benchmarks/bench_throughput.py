@@ -0,0 +1,131 @@
+'''
+Throughput benchmark for the gpg-backed operations in :mod:`keybase.keybase`.
+
+Measures how many ``verify``, ``verify_file`` and ``encrypt`` calls per
+second a single :class:`keybase.KeybasePublicKey` can sustain. It only
+uses the golden test data so it doesn't need network access.
+
+It sticks to APIs and syntax that exist on both sides of the Python 3 port
+so the same script can measure a Python 2 checkout of the library (the
+"before" numbers) and the current tree (the "after" numbers)::
+
+    python2 benchmarks/bench_throughput.py --output before.json
+    python3 benchmarks/bench_throughput.py --output after.json
+    python3 benchmarks/bench_throughput.py --compare before.json after.json
+
+'''
+
+#pylint: disable=C0301
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN = os.path.join(HERE, os.pardir, 'test', 'golden')
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from keybase import keybase  # pylint: disable=C0413
+
+KEY_FINGERPRINT = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+
+def golden(fname):
+    '''
+    Returns the full path to the golden test file ``fname``.
+    '''
+    return os.path.join(GOLDEN, fname)
+
+def timed(func, iterations):
+    '''
+    Calls ``func`` ``iterations`` times and returns the number of calls per
+    second it achieved.
+    '''
+    start = time.time()
+    for _ in range(iterations):
+        func()
+    elapsed = time.time() - start
+    return iterations / elapsed if elapsed > 0 else float('inf')
+
+def run(iterations, size):
+    '''
+    Runs every benchmark and returns the results as a dictionary.
+    '''
+    with open(golden('irc.public.key'), 'r') as fobj:
+        bundle = fobj.read()
+    pkey = keybase.KeybasePublicKey(bundle=bundle, key_fingerprint=KEY_FINGERPRINT)
+    with open(golden('helloworld.txt.gpg'), 'rb') as fobj:
+        signed = fobj.read()
+    plaintext = 'x' * size
+    results = {
+        'python': platform.python_version(),
+        'iterations': iterations,
+        'payload_bytes': size,
+        'ops_per_second': {
+            'verify': timed(lambda: pkey.verify(signed), iterations),
+            'verify_file_embedded': timed(
+                lambda: pkey.verify_file(golden('helloworld.txt.gpg')),
+                iterations),
+            'verify_file_detached': timed(
+                lambda: pkey.verify_file(golden('helloworld.txt'), golden('helloworld.txt.sig')),
+                iterations),
+            'encrypt': timed(lambda: pkey.encrypt(plaintext), iterations),
+        },
+    }
+    if hasattr(keybase, 'set_verify_cache'):
+        previous = keybase.set_verify_cache(keybase.KeybaseVerifyCache())
+        try:
+            results['ops_per_second']['verify_cached'] = timed(lambda: pkey.verify(signed), iterations)
+        finally:
+            keybase.set_verify_cache(previous)
+    return results
+
+def compare(before, after):
+    '''
+    Prints a side-by-side comparison of two result files.
+    '''
+    print('{0:<24} {1:>12} {2:>12} {3:>8}'.format(
+        'operation (ops/s)',
+        'py' + before['python'],
+        'py' + after['python'],
+        'ratio'))
+    for name in sorted(after['ops_per_second']):
+        old = before['ops_per_second'].get(name)
+        new = after['ops_per_second'][name]
+        if old:
+            print('{0:<24} {1:>12.1f} {2:>12.1f} {3:>7.2f}x'.format(name, old, new, new / old))
+        else:
+            print('{0:<24} {1:>12} {2:>12.1f} {3:>8}'.format(name, '-', new, '-'))
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='calls to make per operation (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=64 * 1024,
+                        help='plaintext size for encrypt in bytes (default: %(default)s)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two result files instead of running')
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0], 'r') as fobj:
+            before = json.load(fobj)
+        with open(args.compare[1], 'r') as fobj:
+            after = json.load(fobj)
+        compare(before, after)
+        return
+    results = run(args.iterations, args.size)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+'''
+Transport benchmark for keybase.io API requests.
+
+Looks up the same users through each of the transports that can be
+installed with :func:`keybase.set_transport` and reports, for each one,
+how long the lookups took, how many response body bytes crossed the wire
+and how many connections were opened. The API is a fake one served from
+localhost that gzips its responses when asked to, so no network access is
+needed::
+
+    python benchmarks/bench_transport.py
+    python benchmarks/bench_transport.py --lookups 400 --jobs 16 --batch-size 25 --output transport.json
+
+The ``httpx`` transport is only measured if httpx is installed. The fake
+server speaks plain HTTP/1.1, so this measures connection reuse and
+compression; HTTP/2 multiplexing only comes in to play against a TLS
+server that offers it, like keybase.io itself (see ``--base-url``).
+'''
+
+#pylint: disable=C0301
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN = os.path.join(HERE, os.pardir, 'test', 'golden')
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from keybase import keybase  # pylint: disable=C0413
+
+KEY_FINGERPRINT = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+
+class FakeAPI(object):
+    '''
+    A fake user/lookup.json endpoint on localhost that counts the
+    connections made to it and the response body bytes it sends.
+    '''
+    def __init__(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        with open(os.path.join(GOLDEN, 'irc.public.key'), 'r') as fobj:
+            bundle = fobj.read()
+        api = self
+        self.connections = 0
+        self.body_bytes = 0
+        self.lock = threading.Lock()
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with api.lock:
+                    api.connections += 1
+
+            def do_GET(self):
+                import gzip
+                from urllib.parse import parse_qs, urlparse
+                params = parse_qs(urlparse(self.path).query)
+                names = params['usernames'][0].split(',')
+                body = json.dumps({
+                    'status': {'code': 0, 'name': 'OK'},
+                    'them': [{
+                        'basics': {'username': name},
+                        'profile': {'full_name': name.title()},
+                        'public_keys': {'primary': {'bundle': bundle, 'key_fingerprint': KEY_FINGERPRINT}},
+                    } for name in names]}).encode('utf-8')
+                encoding = None
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    (body, encoding) = (gzip.compress(body, 6), 'gzip')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if encoding:
+                    self.send_header('Content-Encoding', encoding)
+                self.end_headers()
+                self.wfile.write(body)
+                with api.lock:
+                    api.body_bytes += len(body)
+
+            def log_message(self, *args):
+                pass
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:{}/_/api/'.format(self.server.server_address[1])
+
+    def reset(self):
+        '''
+        Zeroes the counters.
+        '''
+        with self.lock:
+            self.connections = 0
+            self.body_bytes = 0
+
+    def close(self):
+        '''
+        Stops the server.
+        '''
+        self.server.shutdown()
+        self.server.server_close()
+
+def transports(jobs):
+    '''
+    Returns ``(name, factory)`` pairs for the transports to measure. The
+    factories return a transport, or None for the one-off requests calls
+    used when no transport is installed.
+    '''
+    candidates = [
+        ('requests (no transport)', lambda: None),
+        ('pooled requests', lambda: keybase.KeybaseRequestsTransport(pool_size=jobs)),
+        ('pooled requests, uncompressed', lambda: keybase.KeybaseRequestsTransport(pool_size=jobs, compress=False)),
+    ]
+    try:
+        import httpx  # pylint: disable=W0611
+        candidates.append(('httpx', lambda: keybase.KeybaseHTTPXTransport(max_connections=jobs)))
+    except ImportError:
+        pass
+    return candidates
+
+def measure(factory, lookups, batch_size, jobs):
+    '''
+    Looks up ``lookups`` users, ``batch_size`` per request, from ``jobs``
+    threads with the transport made by ``factory``. Returns the wall time
+    and the sorted per-request latencies in seconds.
+    '''
+    from concurrent import futures
+    transport = factory()
+    previous = keybase.set_transport(transport)
+    latencies = list()
+    def batch(start):
+        names = ['user{}'.format(index) for index in range(start, min(lookups, start + batch_size))]
+        began = time.time()
+        users = keybase.lookup(names, batch_size=batch_size)
+        latencies.append(time.time() - began)
+        for user in users:
+            user.close()
+    try:
+        began = time.time()
+        with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(batch, range(0, lookups, batch_size)))
+        elapsed = time.time() - began
+    finally:
+        keybase.set_transport(previous)
+        if transport is not None:
+            transport.close()
+    return (elapsed, sorted(latencies))
+
+def run(lookups, batch_size, jobs, base_url=None):
+    '''
+    Runs the benchmark and returns the results as a dictionary.
+    '''
+    api = None
+    if base_url is None:
+        api = FakeAPI()
+        base_url = api.base_url
+    previous_url = keybase.KEYBASE_BASE_URL
+    keybase.KEYBASE_BASE_URL = base_url
+    results = {'lookups': lookups, 'batch_size': batch_size, 'jobs': jobs, 'transports': dict()}
+    try:
+        for (name, factory) in transports(jobs):
+            if api is not None:
+                api.reset()
+            (elapsed, latencies) = measure(factory, lookups, batch_size, jobs)
+            results['transports'][name] = {
+                'seconds': elapsed,
+                'p50_ms': latencies[len(latencies) // 2] * 1000.0,
+                'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000.0,
+                'connections': api.connections if api is not None else None,
+                'body_bytes': api.body_bytes if api is not None else None,
+            }
+    finally:
+        keybase.KEYBASE_BASE_URL = previous_url
+        if api is not None:
+            api.close()
+    return results
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--lookups', type=int, default=200,
+                        help='users to look up per transport (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=10,
+                        help='users per request (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=8,
+                        help='concurrent requests (default: %(default)s)')
+    parser.add_argument('--base-url', help='API base URL to use instead of the local fake one')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+    results = run(args.lookups, args.batch_size, args.jobs, args.base_url)
+    print('{0:<32} {1:>9} {2:>9} {3:>9} {4:>12} {5:>12}'.format(
+        'transport', 'seconds', 'p50 ms', 'p99 ms', 'connections', 'body bytes'))
+    for (name, stats) in results['transports'].items():
+        print('{0:<32} {1:>9.3f} {2:>9.1f} {3:>9.1f} {4:>12} {5:>12}'.format(
+            name, stats['seconds'], stats['p50_ms'], stats['p99_ms'],
+            '-' if stats['connections'] is None else stats['connections'],
+            '-' if stats['body_bytes'] is None else stats['body_bytes']))
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
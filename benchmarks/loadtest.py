@@ -0,0 +1,442 @@
+'''
+Concurrent load test for :mod:`keybase.keybase`.
+
+Replays a weighted mix of ``Keybase()`` lookups, ``discover``, ``verify``,
+``verify_file`` and ``encrypt`` calls from a growing number of threads or
+processes and reports, for every concurrency level, the throughput, the
+latency percentiles of each operation and how much CPU and how many file
+descriptors it took. That shows where the curve flattens out: on the GIL,
+on how fast gpg can be spawned or on keyring creation.
+
+The keybase.io API is replaced by a fake one served from a separate
+process on localhost, so no network access is needed and the server's CPU
+isn't counted against the library. Every fake user has the golden test
+key and the gpg operations use the golden signatures::
+
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --levels 1,8,64 --duration 10 --mix lookup=1,verify=4,encrypt=4
+    python benchmarks/loadtest.py --mode process --levels 1,4,16 --fresh-keys --output load.json
+
+By default the gpg operations share one :class:`keybase.KeybasePublicKey`
+per worker process; ``--fresh-keys`` looks the user up and builds a new
+key, and with it a new keyring, for every operation instead. ``--latency``
+adds a delay to every fake API response to stand in for the network.
+'''
+
+#pylint: disable=C0301
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN = os.path.join(HERE, os.pardir, 'test', 'golden')
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from keybase import keybase  # pylint: disable=C0413
+
+KEY_FINGERPRINT = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+
+OPERATIONS = ('lookup', 'discover', 'verify', 'verify_file', 'encrypt')
+
+def golden(fname):
+    '''
+    Returns the full path to the golden test file ``fname``.
+    '''
+    return os.path.join(GOLDEN, fname)
+
+def serve(conn, users, latency):
+    '''
+    Runs the fake keybase.io API until the process is terminated. Sends the
+    port it's listening on down ``conn``. Users are named ``user0`` up to
+    ``user<users - 1>`` and can be discovered by a GitHub name equal to
+    their username.
+    '''
+    try:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    except ImportError:
+        from http.server import BaseHTTPRequestHandler, HTTPServer as ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+    with open(golden('irc.public.key'), 'r') as fobj:
+        bundle = fobj.read()
+    def user_object(username):
+        return {
+            'basics': {'username': username},
+            'profile': {'full_name': username.title(), 'location': 'localhost'},
+            'public_keys': {'primary': {'bundle': bundle, 'key_fingerprint': KEY_FINGERPRINT}},
+        }
+    def known(username):
+        return username.startswith('user') and username[4:].isdigit() and int(username[4:]) < users
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = dict((key, value[0]) for (key, value) in parse_qs(url.query).items())
+            if url.path.endswith('/user/lookup.json'):
+                names = params.get('usernames', params.get('username', '')).split(',')
+                if not all(known(name) for name in names):
+                    body = {'status': {'code': 205, 'name': 'NOT_FOUND'}}
+                elif 'usernames' in params:
+                    body = {'status': {'code': 0, 'name': 'OK'}, 'them': [user_object(name) for name in names]}
+                else:
+                    body = {'status': {'code': 0, 'name': 'OK'}, 'them': user_object(names[0])}
+            elif url.path.endswith('/user/discover.json'):
+                ids = params.get(keybase.GITHUB, '').split(',')
+                body = {'status': {'code': 0, 'name': 'OK'}, 'matches': [uid for uid in ids if known(uid)]}
+            else:
+                self.send_error(404)
+                return
+            if latency:
+                time.sleep(latency)
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    conn.send(server.server_address[1])
+    server.serve_forever()
+
+class Workload(object):
+    '''
+    The operations one worker process runs. ``mix`` maps operation names to
+    their weights.
+    '''
+    def __init__(self, mix, users, fresh_keys, size):
+        self.names = [name for name in OPERATIONS if mix.get(name)]
+        self.weights = [mix[name] for name in self.names]
+        self.users = ['user{}'.format(index) for index in range(users)]
+        self.fresh_keys = fresh_keys
+        self.plaintext = os.urandom(size)
+        with open(golden('helloworld.txt.gpg'), 'rb') as fobj:
+            self.signed = fobj.read()
+        self.shared = None
+        if not fresh_keys and set(self.names) & set(('verify', 'verify_file', 'encrypt')):
+            with open(golden('irc.public.key'), 'r') as fobj:
+                self.shared = keybase.KeybasePublicKey(bundle=fobj.read(), key_fingerprint=KEY_FINGERPRINT)
+
+    def close(self):
+        '''
+        Removes the shared key's keyring.
+        '''
+        if self.shared is not None:
+            self.shared.close()
+
+    def pick(self, rng):
+        '''
+        Returns the name of the next operation to run.
+        '''
+        return rng.choices(self.names, self.weights)[0]
+
+    def run(self, name, rng):
+        '''
+        Runs the operation ``name`` once. Raises an exception if it fails.
+        '''
+        username = rng.choice(self.users)
+        if name == 'lookup':
+            keybase.Keybase(username).close()
+        elif name == 'discover':
+            users = keybase.discover(keybase.GITHUB, [username])
+            if len(users) != 1:
+                raise RuntimeError('discover found {} users'.format(len(users)))
+            users[0].close()
+        elif self.fresh_keys:
+            with keybase.Keybase(username) as kbase:
+                with kbase.get_public_key() as pkey:
+                    self.__key_operation(pkey, name)
+        else:
+            self.__key_operation(self.shared, name)
+
+    def __key_operation(self, pkey, name):
+        '''
+        Runs one of the gpg operations with ``pkey``.
+        '''
+        if name == 'verify':
+            pkey.verify(self.signed, throw_error=True)
+        elif name == 'verify_file':
+            pkey.verify_file(golden('helloworld.txt'), golden('helloworld.txt.sig'), throw_error=True)
+        elif name == 'encrypt':
+            pkey.encrypt_bytes(self.plaintext)
+
+def drive(workload, threads, deadline, seed):
+    '''
+    Runs ``workload`` from ``threads`` threads until ``deadline``. Returns
+    a dictionary mapping operation names to ``(latencies, errors)`` where
+    latencies are in seconds and errors are the descriptions of the
+    exceptions the failed calls raised.
+    '''
+    results = dict((name, ([], [])) for name in workload.names)
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        while time.time() < deadline:
+            name = workload.pick(rng)
+            start = time.time()
+            try:
+                workload.run(name, rng)
+            except Exception as err:  # pylint: disable=W0703
+                results[name][1].append('{}: {}'.format(type(err).__name__, err))
+                continue
+            results[name][0].append(time.time() - start)
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results
+
+def process_worker(conn, base_url, mix, users, fresh_keys, size, threads, duration, seed):
+    '''
+    Entry point for worker processes in ``--mode process``. Builds the
+    workload, says it's ready, waits for the start time and sends the
+    results of :func:`drive` and the CPU seconds it took down ``conn``.
+    '''
+    keybase.KEYBASE_BASE_URL = base_url
+    workload = Workload(mix, users, fresh_keys, size)
+    try:
+        conn.send('ready')
+        start = conn.recv()
+        time.sleep(max(0.0, start - time.time()))
+        cpu_before = cpu_seconds()
+        results = drive(workload, threads, start + duration, seed)
+        cpu_after = cpu_seconds()
+        conn.send((results, None if cpu_before is None else cpu_after - cpu_before))
+    finally:
+        workload.close()
+
+class Monitor(object):
+    '''
+    Samples the number of open file descriptors and threads of this
+    process and ``pids`` every ``interval`` seconds in a background thread
+    and keeps the peaks. Only works where ``/proc`` does; elsewhere the
+    peaks stay None.
+    '''
+    def __init__(self, pids=(), interval=0.05):
+        self.pids = [os.getpid()] + list(pids)
+        self.interval = interval
+        self.peak_fds = None
+        self.peak_threads = None
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__sample)
+        self.__thread.daemon = True
+
+    def __enter__(self):
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.__stop.set()
+        self.__thread.join()
+
+    def __sample(self):
+        while True:
+            try:
+                fds = sum(len(os.listdir('/proc/{}/fd'.format(pid))) for pid in self.pids)
+                threads = sum(len(os.listdir('/proc/{}/task'.format(pid))) for pid in self.pids)
+            except OSError:
+                return
+            self.peak_fds = max(fds, self.peak_fds or 0)
+            self.peak_threads = max(threads, self.peak_threads or 0)
+            if self.__stop.wait(self.interval):
+                return
+
+def cpu_seconds():
+    '''
+    Returns the user and system CPU seconds used by this process and the
+    children it has waited for, which includes every gpg process, or None
+    where the resource module isn't available.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+def percentile(ordered, fraction):
+    '''
+    Returns the nearest-rank ``fraction`` percentile of the sorted list
+    ``ordered`` in milliseconds.
+    '''
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index] * 1000.0
+
+def summarize(latencies, errors, elapsed):
+    '''
+    Returns the report for one operation, or for all of them, at one level.
+    '''
+    ordered = sorted(latencies)
+    return {
+        'ops': len(ordered),
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+        'ops_per_second': len(ordered) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(ordered, 0.50),
+        'p90_ms': percentile(ordered, 0.90),
+        'p99_ms': percentile(ordered, 0.99),
+        'max_ms': ordered[-1] * 1000.0 if ordered else None,
+    }
+
+def run_level(args, mix, level, base_url):
+    '''
+    Runs the load at concurrency ``level`` and returns its report. Keyrings
+    are set up before the clock starts and aren't counted.
+    '''
+    if args.mode == 'thread':
+        workload = Workload(mix, args.users, args.fresh_keys, args.size)
+        try:
+            with Monitor() as monitor:
+                cpu_before = cpu_seconds()
+                start = time.time()
+                results = [drive(workload, level, start + args.duration, level)]
+                elapsed = time.time() - start
+                cpu_after = cpu_seconds()
+        finally:
+            workload.close()
+        cpu = None if cpu_before is None else cpu_after - cpu_before
+    else:
+        import multiprocessing
+        workers = list()
+        for index in range(level):
+            (conn, child) = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=process_worker, args=(
+                child, base_url, mix, args.users, args.fresh_keys, args.size,
+                args.threads, args.duration, level * 1000 + index))
+            proc.start()
+            workers.append((proc, conn))
+        for (_, conn) in workers:
+            conn.recv()
+        with Monitor([proc.pid for (proc, _) in workers]) as monitor:
+            start = time.time() + 0.1
+            for (_, conn) in workers:
+                conn.send(start)
+            replies = [conn.recv() for (_, conn) in workers]
+            elapsed = time.time() - start
+        for (proc, _) in workers:
+            proc.join()
+        results = [result for (result, _) in replies]
+        cpu = None if any(seconds is None for (_, seconds) in replies) else sum(seconds for (_, seconds) in replies)
+    report = {'level': level, 'elapsed': elapsed, 'operations': dict()}
+    (everything, failures) = (list(), list())
+    for name in OPERATIONS:
+        if not mix.get(name):
+            continue
+        latencies = [value for result in results for value in result[name][0]]
+        errors = [error for result in results for error in result[name][1]]
+        report['operations'][name] = summarize(latencies, errors, elapsed)
+        everything.extend(latencies)
+        failures.extend(errors)
+    report['total'] = summarize(everything, failures, elapsed)
+    report['cpu_seconds'] = cpu
+    report['cpu_percent'] = None if cpu is None else 100.0 * cpu / elapsed
+    report['peak_fds'] = monitor.peak_fds
+    report['peak_threads'] = monitor.peak_threads
+    return report
+
+def parse_mix(text):
+    '''
+    Parses a ``name=weight,...`` operation mix.
+    '''
+    mix = dict()
+    for item in text.split(','):
+        (name, _, weight) = item.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError('unknown operation {!r}'.format(name))
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('the mix has no operations in it')
+    return mix
+
+def print_report(report):
+    '''
+    Prints one concurrency level's report as a table.
+    '''
+    def number(value, fmt='{:.1f}'):
+        return '-' if value is None else fmt.format(value)
+    print('level {level}: {ops_per_second:.1f} ops/s, cpu {cpu}%, peak fds {fds}, peak threads {threads}'.format(
+        level=report['level'], ops_per_second=report['total']['ops_per_second'],
+        cpu=number(report['cpu_percent']), fds=number(report['peak_fds'], '{}'),
+        threads=number(report['peak_threads'], '{}')))
+    print('  {0:<12} {1:>8} {2:>7} {3:>9} {4:>9} {5:>9} {6:>9} {7:>9}'.format(
+        'operation', 'ops', 'errors', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    rows = sorted(report['operations'].items()) + [('total', report['total'])]
+    for (name, stats) in rows:
+        print('  {0:<12} {1:>8} {2:>7} {3:>9.1f} {4:>9} {5:>9} {6:>9} {7:>9}'.format(
+            name, stats['ops'], stats['errors'], stats['ops_per_second'],
+            number(stats['p50_ms']), number(stats['p90_ms']),
+            number(stats['p99_ms']), number(stats['max_ms'])))
+    for error in report['total']['error_samples']:
+        print('  error: {}'.format(error))
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    import multiprocessing
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread',
+                        help='raise concurrency with threads or with processes (default: %(default)s)')
+    parser.add_argument('--levels', default='1,2,4,8,16,32,64',
+                        help='comma separated concurrency levels to sweep (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='threads per worker process in process mode (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds to run every level for (default: %(default)s)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('lookup=2,discover=1,verify=3,verify_file=2,encrypt=2'),
+                        help='operations and their weights (default: lookup=2,discover=1,verify=3,verify_file=2,encrypt=2)')
+    parser.add_argument('--users', type=int, default=1000,
+                        help='number of users the fake API knows (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=64 * 1024,
+                        help='plaintext size for encrypt in bytes (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the fake API waits before every response (default: %(default)s)')
+    parser.add_argument('--fresh-keys', action='store_true',
+                        help='look up the user and build a new key for every gpg operation')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+    (conn, child) = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(child, args.users, args.latency))
+    server.daemon = True
+    server.start()
+    base_url = 'http://127.0.0.1:{}/_/api/'.format(conn.recv())
+    keybase.KEYBASE_BASE_URL = base_url
+    results = {
+        'mode': args.mode,
+        'mix': args.mix,
+        'duration': args.duration,
+        'fresh_keys': args.fresh_keys,
+        'latency': args.latency,
+        'cpu_count': os.cpu_count(),
+        'levels': list(),
+    }
+    try:
+        for level in [int(level) for level in args.levels.split(',')]:
+            report = run_level(args, args.mix, level, base_url)
+            print_report(report)
+            sys.stdout.flush()
+            results['levels'].append(report)
+    finally:
+        server.terminate()
+        server.join()
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
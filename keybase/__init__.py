@@ -3,5 +3,5 @@
 '''
 
 __version__ = '1.0.2'
-__all__ = ['keybase']
+__all__ = ['keybase', 'cli', 'openpgp', 'manifest', 'container', 'proofs', 'sigchain']
 
@@ -0,0 +1,443 @@
+'''
+.. module:: cli
+   :platform: Unix, Windows
+   :synopsis: The keybase-py command line tool for bulk Keybase operations.
+
+.. moduleauthor:: Ian Chesal <ian.chesal@gmail.com>
+
+The ``keybase-py`` command wraps the :mod:`keybase.keybase` module for use
+in shell pipelines. Every subcommand reads its work items from the command
+line or, if none are given, one per line from stdin and writes one JSON
+object per item to stdout::
+
+    cat usernames.txt | keybase-py --jobs 8 --cache-dir ~/.cache/keybase lookup
+    keybase-py discover github ianchesal
+    find release -type f | keybase-py --jobs 16 verify --user irc --sig-suffix .sig
+    keybase-py encrypt --user irc secrets.tar
+    keybase-py --jobs 32 proofs irc
+    keybase-py --jobs 16 sigchain < tracked.txt
+    keybase-py calibrate-gpg
+    keybase-py --gpg-calibration verify --user irc release.tar.gz.asc
+
+The global ``--jobs``, ``--cache-dir`` and ``--stats`` options control how
+many items are worked on in parallel, where looked up users are cached
+between runs and whether a summary is printed to stderr when the command
+finishes. Users and ids that weren't found are remembered for
+``--negative-ttl`` seconds so repeats in the input aren't looked up again.
+``--hedge`` sends a second copy of API requests that are slower than
+usual; see :class:`keybase.KeybaseHedger`. ``--gpg-calibration`` runs gpg
+the way ``calibrate-gpg`` found to be fastest. ``--transport`` picks how API
+requests are sent: ``pooled`` (the default) shares kept-alive connections
+between them, ``http2`` multiplexes them over one HTTP/2 connection and
+``simple`` makes a new connection for every request.
+'''
+
+#pylint: disable=C0301
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from keybase import keybase
+from keybase import sigchain
+
+def main(argv=None):
+    '''
+    Entry point for the ``keybase-py`` console script. Returns the exit
+    status: 0 if every item succeeded, 1 if any of them failed.
+    '''
+    parser = _parser()
+    args = parser.parse_args(argv)
+    try:
+        transport = _transport(args.transport, args.jobs)
+        if args.gpg_calibration:
+            previous_calibration = keybase.set_gpg_calibration(None)
+            if keybase.load_gpg_calibration(args.gpg_calibration) is None:
+                keybase.set_gpg_calibration(previous_calibration)
+                parser.error('no gpg calibration found at {}'.format(args.gpg_calibration))
+    except keybase.KeybaseError as err:
+        parser.error(str(err))
+    cache = None
+    if args.cache_dir:
+        cache = keybase.KeybaseFileCache(args.cache_dir, ttl=args.cache_ttl)
+        previous_cache = keybase.set_user_cache(cache)
+    negative_cache = None
+    if args.negative_ttl > 0:
+        negative_cache = keybase.KeybaseNegativeCache(ttl=args.negative_ttl)
+        previous_negative_cache = keybase.set_negative_cache(negative_cache)
+    if transport is not None:
+        previous_transport = keybase.set_transport(transport)
+    hedger = None
+    if args.hedge:
+        hedger = keybase.KeybaseHedger(max_workers=max(2, args.jobs * 2))
+        previous_hedger = keybase.set_hedger(hedger)
+    stats = _Stats(args.command, cache, negative_cache, hedger)
+    aborted = False
+    try:
+        for record in args.handler(args, _read_items(args.items, sys.stdin)):
+            stats.count(record['ok'])
+            del record['ok']
+            sys.stdout.write(json.dumps(record, sort_keys=True) + '\n')
+    except (keybase.KeybaseError, keybase.KeybaseUserNotFound) as err:
+        sys.stderr.write('{}: error: {}\n'.format(parser.prog, err))
+        aborted = True
+    finally:
+        sys.stdout.flush()
+        if cache is not None:
+            keybase.set_user_cache(previous_cache)
+        if negative_cache is not None:
+            keybase.set_negative_cache(previous_negative_cache)
+        if hedger is not None:
+            keybase.set_hedger(previous_hedger)
+            hedger.close()
+        if transport is not None:
+            keybase.set_transport(previous_transport)
+            transport.close()
+        if args.gpg_calibration:
+            keybase.set_gpg_calibration(previous_calibration)
+        if args.stats:
+            stats.report(sys.stderr)
+    return 0 if stats.failed == 0 and not aborted else 1
+
+def _parser():
+    '''
+    Builds the argument parser for the command line tool.
+    '''
+    parser = argparse.ArgumentParser(
+        prog='keybase-py',
+        description='Bulk lookup, discovery, verification and encryption with keybase.io keys.')
+    parser.add_argument('--jobs', '-j', type=int, default=4,
+                        help='number of items to work on in parallel (default: %(default)s)')
+    parser.add_argument('--cache-dir',
+                        help='cache looked up users in this directory between runs')
+    parser.add_argument('--cache-ttl', type=int, default=86400,
+                        help='seconds before a cached user is fetched again (default: %(default)s)')
+    parser.add_argument('--negative-ttl', type=int, default=3600,
+                        help='seconds to remember users and ids that were not found, 0 to not remember them (default: %(default)s)')
+    parser.add_argument('--transport', choices=('pooled', 'http2', 'simple'), default='pooled',
+                        help='how API requests are sent (default: %(default)s)')
+    parser.add_argument('--hedge', action='store_true',
+                        help='send a second copy of API requests that are slower than usual')
+    parser.add_argument('--gpg-calibration', nargs='?', const=keybase.GPG_CALIBRATION_FILE, metavar='FILE',
+                        help='use the gpg binary and options saved by calibrate-gpg (default FILE: {})'.format(keybase.GPG_CALIBRATION_FILE))
+    parser.add_argument('--stats', action='store_true',
+                        help='print a summary of the run to stderr when done')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    cmd = commands.add_parser('lookup', help='look up users by username')
+    cmd.add_argument('--batch-size', type=int, default=keybase.LOOKUP_BATCH_SIZE,
+                     help='usernames per API request (default: %(default)s)')
+    cmd.add_argument('items', nargs='*', metavar='username')
+    cmd.set_defaults(handler=_lookup)
+
+    cmd = commands.add_parser('discover', help='find users by their other identities')
+    cmd.add_argument('idtype', choices=(
+        keybase.TWITTER, keybase.GITHUB, keybase.HACKERNEWS,
+        keybase.WEB, keybase.COINBASE, keybase.KEYFINGERPRINT))
+    cmd.add_argument('--batch-size', type=int, default=keybase.LOOKUP_BATCH_SIZE,
+                     help='identities per API request (default: %(default)s)')
+    cmd.add_argument('items', nargs='*', metavar='id')
+    cmd.set_defaults(handler=_discover)
+
+    cmd = commands.add_parser('verify', help='verify signed files with a user\'s key')
+    cmd.add_argument('--user', required=True, help='the Keybase user who signed the files')
+    cmd.add_argument('--sig-suffix',
+                     help='use detached signatures found at FILE + SIG_SUFFIX, e.g. .sig')
+    cmd.add_argument('items', nargs='*', metavar='file')
+    cmd.set_defaults(handler=_verify)
+
+    cmd = commands.add_parser('encrypt', help='encrypt files for a user')
+    cmd.add_argument('--user', required=True, help='the Keybase user to encrypt the files for')
+    cmd.add_argument('--suffix', default='.gpg',
+                     help='write FILE + SUFFIX for every FILE (default: %(default)s)')
+    cmd.add_argument('items', nargs='*', metavar='file')
+    cmd.set_defaults(handler=_encrypt)
+
+    cmd = commands.add_parser('proofs', help='check that users\' identity proofs are still live')
+    cmd.add_argument('--per-host', type=int, default=4,
+                     help='proof pages fetched from any one host at once (default: %(default)s)')
+    cmd.add_argument('items', nargs='*', metavar='username')
+    cmd.set_defaults(handler=_proofs)
+
+    cmd = commands.add_parser('sigchain', help='fetch, check and store the links added to users\' sigchains')
+    cmd.add_argument('--directory',
+                     help='keep the chains in this directory (default: {})'.format(sigchain.SIGCHAIN_DIR))
+    cmd.add_argument('--require-signatures', action='store_true',
+                     help='refuse new links whose signatures can\'t be checked with gpg')
+    cmd.add_argument('items', nargs='*', metavar='username')
+    cmd.set_defaults(handler=_sigchain)
+
+    cmd = commands.add_parser('calibrate-gpg', help='pick the fastest gpg binary and options and save the choice')
+    cmd.add_argument('--rounds', type=int, default=5,
+                     help='times to run each combination (default: %(default)s)')
+    cmd.add_argument('--output',
+                     help='save the choice to this file instead of {}'.format(keybase.GPG_CALIBRATION_FILE))
+    cmd.add_argument('items', nargs='*', metavar='binary',
+                     help='gpg binaries to try (default: {})'.format(', '.join(keybase.GPG_CANDIDATES)))
+    cmd.set_defaults(handler=_calibrate_gpg)
+    return parser
+
+def _transport(name, jobs):
+    '''
+    Returns the transport named ``name`` on the command line, or None for
+    ``simple``.
+    '''
+    if name == 'pooled':
+        return keybase.KeybaseRequestsTransport(pool_size=max(4, jobs))
+    if name == 'http2':
+        return keybase.KeybaseHTTPXTransport(max_connections=max(4, jobs))
+    return None
+
+def _read_items(items, stream):
+    '''
+    Yields the work items given on the command line or, if there weren't
+    any, the non-blank lines read from ``stream``.
+    '''
+    if items:
+        for item in items:
+            yield item
+        return
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+def _chunks(items, size):
+    '''
+    Groups the ``items`` iterable in to lists of up to ``size`` items.
+    '''
+    chunk = list()
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = list()
+    if chunk:
+        yield chunk
+
+def _imap(func, items, jobs):
+    '''
+    Like the builtin ``map()`` but runs ``func`` on up to ``jobs`` items at
+    once in a thread pool. Results come back in input order and only a
+    bounded number of items are in flight at any time, so arbitrarily long
+    input streams can be processed in constant memory.
+
+    Threads are enough to keep every core busy here: the heavy lifting is
+    done in gpg subprocesses and in network waits, neither of which holds
+    the GIL.
+    '''
+    if jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+    import collections
+    from concurrent import futures
+    pending = collections.deque()
+    with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= jobs * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _user_record(username, kbase):
+    '''
+    Returns the output record for a looked up user.
+    '''
+    if kbase is None:
+        return {'ok': False, 'username': username, 'found': False}
+    primary = kbase._section_getter('public_keys', 'primary') or dict()
+    return {
+        'ok': True,
+        'username': username,
+        'found': True,
+        'name': kbase.name,
+        'location': kbase.location,
+        'kid': primary.get('kid'),
+        'key_fingerprint': primary.get('key_fingerprint'),
+    }
+
+def _lookup(args, items):
+    '''
+    Handler for the ``lookup`` subcommand.
+    '''
+    def _batch(usernames):
+        return list(zip(usernames, keybase.lookup(usernames, batch_size=args.batch_size)))
+    for results in _imap(_batch, _chunks(items, args.batch_size), args.jobs):
+        for (username, kbase) in results:
+            yield _user_record(username, kbase)
+
+def _discover(args, items):
+    '''
+    Handler for the ``discover`` subcommand.
+    '''
+    def _batch(ids):
+        return keybase.discover(args.idtype, ids)
+    for users in _imap(_batch, _chunks(items, args.batch_size), args.jobs):
+        for kbase in users:
+            record = _user_record(kbase.username, kbase)
+            record['idtype'] = args.idtype
+            yield record
+
+def _verify(args, items):
+    '''
+    Handler for the ``verify`` subcommand.
+    '''
+    pkey = keybase.Keybase(args.user).get_public_key()
+    def _one(fname):
+        record = {'ok': False, 'file': fname, 'valid': False, 'status': None}
+        sigfname = fname + args.sig_suffix if args.sig_suffix else None
+        try:
+            record['valid'] = pkey.verify_file(fname, sigfname, throw_error=True)
+            record['ok'] = True
+        except keybase.KeybasePublicKeyVerifyError as err:
+            record['status'] = str(err)
+        except (IOError, OSError) as err:
+            record['status'] = 'error: {}'.format(err)
+        return record
+    for record in _imap(_one, items, args.jobs):
+        yield record
+
+def _encrypt(args, items):
+    '''
+    Handler for the ``encrypt`` subcommand.
+    '''
+    pkey = keybase.Keybase(args.user).get_public_key()
+    def _one(fname):
+        record = {'ok': False, 'file': fname, 'output': fname + args.suffix, 'error': None}
+        partial = '{}.{}.tmp'.format(record['output'], os.getpid())
+        try:
+            with open(fname, 'rb') as infile:
+                with open(partial, 'wb') as outfile:
+                    record['bytes'] = pkey.encrypt_bytes(infile, output=outfile)
+            os.replace(partial, record['output'])
+            record['ok'] = True
+        except keybase.KeybasePublicKeyEncryptError as err:
+            record['error'] = str(err)
+        except (IOError, OSError) as err:
+            record['error'] = 'error: {}'.format(err)
+        finally:
+            if not record['ok'] and os.path.exists(partial):
+                os.unlink(partial)
+        return record
+    for record in _imap(_one, items, args.jobs):
+        yield record
+
+def _proofs(args, items):
+    '''
+    Handler for the ``proofs`` subcommand. Users are looked up a batch at a
+    time and all of the proofs in a batch are checked at once, ``--jobs``
+    pages at a time.
+    '''
+    from keybase import proofs
+    checker = proofs.ProofChecker(max_workers=max(1, args.jobs), per_host=args.per_host)
+    for usernames in _chunks(items, keybase.LOOKUP_BATCH_SIZE):
+        users = keybase.lookup(usernames)
+        for (username, kbase) in zip(usernames, users):
+            if kbase is None:
+                yield {'ok': False, 'username': username, 'found': False}
+        for result in checker.check([kbase for kbase in users if kbase is not None]):
+            yield {
+                'ok': result.ok,
+                'username': result.username,
+                'proof_type': result.proof_type,
+                'nametag': result.nametag,
+                'proof_url': result.proof_url,
+                'status': result.status,
+            }
+        for kbase in users:
+            if kbase is not None:
+                kbase.close()
+
+def _sigchain(args, items):
+    '''
+    Handler for the ``sigchain`` subcommand. Only the links added since the
+    last run are fetched and checked. ``unverified`` counts the new links
+    whose signatures couldn't be checked.
+    '''
+    def _one(username):
+        try:
+            result = sigchain.Sigchain(username, args.directory).sync_result(require_signatures=args.require_signatures)
+        except sigchain.SigchainError as err:
+            return {'ok': False, 'username': username, 'seqno': 0, 'new': 0, 'unverified': 0, 'error': str(err)}
+        return {'ok': result.ok, 'username': username, 'seqno': result.seqno, 'new': len(result.new),
+                'unverified': len(result.unverified), 'error': result.error}
+    for record in _imap(_one, items, args.jobs):
+        yield record
+
+def _calibrate_gpg(args, items):
+    '''
+    Handler for the ``calibrate-gpg`` subcommand. The binaries to try only
+    come from the command line; ``items`` isn't read so nothing waits on
+    stdin.
+    '''
+    try:
+        calibration = keybase.calibrate_gpg(args.output, args.items or None, rounds=args.rounds)
+    except keybase.KeybaseError as err:
+        yield {'ok': False, 'error': str(err)}
+        return
+    for result in calibration['results']:
+        yield {
+            'ok': True,
+            'binary': result['binary'],
+            'options': result['options'],
+            'passed': result['ok'],
+            'seconds': result['seconds'],
+            'chosen': (result['binary'], result['options']) == (calibration['binary'], calibration['options']),
+        }
+
+class _Stats(object):
+    '''
+    Keeps count of how a run went for the ``--stats`` report.
+    '''
+    def __init__(self, command, cache=None, negative_cache=None, hedger=None):
+        self.command = command
+        self.cache = cache
+        self.negative_cache = negative_cache
+        self.hedger = hedger
+        self.succeeded = 0
+        self.failed = 0
+        self.start = time.time()
+
+    def count(self, succeeded):
+        '''
+        Records the outcome of one item.
+        '''
+        if succeeded:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+
+    def report(self, stream):
+        '''
+        Writes the summary to ``stream``.
+        '''
+        elapsed = time.time() - self.start
+        total = self.succeeded + self.failed
+        rate = total / elapsed if elapsed > 0 else 0.0
+        stream.write('{}: {} items, {} ok, {} failed in {:.2f}s ({:.1f} items/s)\n'.format(
+            self.command, total, self.succeeded, self.failed, elapsed, rate))
+        if self.cache is not None:
+            cache_stats = self.cache.stats()
+            stream.write('cache: {} hits, {} misses, {} entries\n'.format(
+                cache_stats['hits'], cache_stats['misses'], cache_stats['size']))
+        if self.negative_cache is not None:
+            cache_stats = self.negative_cache.stats()
+            stream.write('negative cache: {} hits, {} misses, {} entries, {:.4%} false positive rate\n'.format(
+                cache_stats['hits'], cache_stats['misses'], cache_stats['size'],
+                cache_stats['false_positive_rate']))
+        breaker_stats = keybase.api_breaker.stats()
+        stream.write('api: breaker {}, opened {} times, {} calls rejected\n'.format(
+            breaker_stats['state'], breaker_stats['opened'], breaker_stats['rejected']))
+        if self.hedger is not None:
+            hedge_stats = self.hedger.stats()
+            stream.write('hedging: {} requests, {} hedged, {} won by the hedge, {:.3f}s delay\n'.format(
+                hedge_stats['requests'], hedge_stats['hedged'], hedge_stats['hedge_wins'],
+                hedge_stats['delay']))
+
+if __name__ == '__main__':
+    sys.exit(main())
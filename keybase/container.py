@@ -0,0 +1,391 @@
+'''
+.. module:: container
+   :platform: Unix, Windows
+   :synopsis: Chunked, seekable encrypted containers for Keybase users.
+
+.. moduleauthor:: Ian Chesal <ian.chesal@gmail.com>
+
+A file encrypted with :func:`keybase.KeybasePublicKey.encrypt_bytes` is a
+single OpenPGP message: reading a megabyte from the middle of it means
+decrypting everything in front of that megabyte first. A container splits
+its input in to chunks that are each encrypted for the recipient on their
+own, in parallel, and records where every chunk is in an index at the end
+of the file. Whoever holds the private key can then decrypt just the
+chunks covering the bytes they want::
+
+    from keybase import container
+
+    with container.ContainerWriter('irc', open('backup.kbc', 'wb')) as writer:
+        with open('backup.tar', 'rb') as fobj:
+            for block in iter(lambda: fobj.read(1 << 20), b''):
+                writer.write(block)
+
+    # Later, on the recipient's machine, with their private key in gpg:
+    with container.ContainerReader(open('backup.kbc', 'rb'), container.gpg_decrypter()) as reader:
+        reader.seek(40 << 30)
+        block = reader.read(1 << 20)
+
+The layout is the ``MAGIC`` header, the encrypted chunks back to back, a
+JSON index, a table of the chunk lengths and a fixed-size footer that
+points at the index. Every chunk's plaintext starts with the container's
+random id, the chunk's sequence number and a flag marking the last chunk,
+so chunks can't be swapped between containers, reordered or dropped off
+the end without the reader noticing.
+'''
+
+#pylint: disable=C0301
+
+import json
+import os
+import struct
+import threading
+
+from keybase import keybase
+
+# The first bytes of every container.
+MAGIC = b'KBCHUNK1'
+
+# The last bytes of every container, after the index offset and length.
+FOOTER_MAGIC = b'KBINDEX1'
+
+# Plaintext bytes per chunk unless the writer is told otherwise. Smaller
+# chunks make small reads cheaper and the index bigger.
+CHUNK_SIZE = 1024 * 1024
+
+_FOOTER = struct.Struct('>QQ8s')
+_CHUNK_HEADER = struct.Struct('>16sQB')
+_LENGTH = struct.Struct('>I')
+_LAST = 1
+
+def gpg_decrypter(homedir=None, args=()):
+    '''
+    Returns a function that decrypts a chunk with the gpg private keys in
+    ``homedir``, or gpg's default home directory if that's None, for
+    :class:`ContainerReader`. Extra gpg ``args`` are added to the command
+    line. The keys need to be usable without a prompt, either because they
+    have no passphrase or because gpg-agent already has it.
+    '''
+    command = [keybase.gpg(), '--no-tty', '--batch', '--status-fd', '2']
+    if homedir is not None:
+        command.extend(['--homedir', homedir])
+    command.extend(args)
+    command.append('--decrypt')
+    def decrypt(data):
+        '''
+        Returns the decrypted ``data``.
+        '''
+        (returncode, result, _) = keybase._run_gpg(command, data=memoryview(data))
+        if returncode != 0:
+            raise ContainerDecryptError('unable to decrypt chunk')
+        return result
+    return decrypt
+
+def _public_key(key):
+    '''
+    Returns the :class:`keybase.KeybasePublicKey` to encrypt for: ``key``
+    itself or the primary key of a :class:`keybase.Keybase` or a username.
+    '''
+    if isinstance(key, str):
+        key = keybase.Keybase(key)
+    if isinstance(key, keybase.Keybase):
+        key = key.get_public_key()
+    return key
+
+class ContainerWriter(object):
+    '''
+    Writes a container holding everything passed to :func:`write` to the
+    binary file object ``fobj``, encrypted for ``key``: a username, a
+    :class:`keybase.Keybase` or a :class:`keybase.KeybasePublicKey`.
+
+    Input is cut in to ``chunk_size`` byte chunks which are encrypted by up
+    to ``jobs`` gpg processes at once, one per CPU by default, and written
+    out in order as they finish. Only a few chunks per job are ever held in
+    memory, so containers of any size can be written. ``compress_algo`` is
+    applied to each chunk; with the default of ``'auto'`` chunks that don't
+    compress aren't compressed.
+
+    Nothing is usable until :func:`close` writes the index, which happens
+    on leaving a ``with`` block without an error. ``fobj`` is left open.
+    '''
+    def __init__(self, key, fobj, chunk_size=CHUNK_SIZE, jobs=None, compress_algo='auto'):
+        from concurrent import futures
+        import collections
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        self.__pkey = _public_key(key)
+        self.__fobj = fobj
+        self.chunk_size = chunk_size
+        self.compress_algo = compress_algo
+        self.size = 0
+        self.__jobs = jobs or os.cpu_count() or 1
+        self.__id = os.urandom(16)
+        self.__buffer = bytearray()
+        self.__lengths = list()
+        self.__pending = collections.deque()
+        self.__executor = futures.ThreadPoolExecutor(max_workers=self.__jobs)
+        self.__closed = False
+        fobj.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.__executor.shutdown(wait=True)
+            self.__closed = True
+
+    def write(self, data):
+        '''
+        Adds ``data``, a bytes-like object, to the container. Returns the
+        number of bytes added.
+        '''
+        if self.__closed:
+            raise ContainerError('container is closed')
+        self.__buffer += data
+        self.size += len(data)
+        # The last chunk has to be flagged as such, so a full chunk is only
+        # sent off once there's at least one byte after it.
+        used = 0
+        with memoryview(self.__buffer) as view:
+            while len(view) - used > self.chunk_size:
+                self.__submit(view[used:used + self.chunk_size], last=False)
+                used += self.chunk_size
+        del self.__buffer[:used]
+        return len(data)
+
+    def close(self):
+        '''
+        Encrypts what's left, waits for every chunk to be written and
+        writes the index and footer. Calling it again does nothing.
+        '''
+        if self.__closed:
+            return
+        self.__submit(self.__buffer, last=True)
+        self.__buffer = bytearray()
+        while self.__pending:
+            self.__flush_one()
+        self.__executor.shutdown(wait=True)
+        self.__closed = True
+        index_offset = len(MAGIC) + sum(self.__lengths)
+        index = json.dumps({
+            'version': 1,
+            'id': self.__id.hex(),
+            'recipient': self.__pkey.key_fingerprint,
+            'chunk_size': self.chunk_size,
+            'size': self.size,
+            'chunks': len(self.__lengths),
+        }, sort_keys=True).encode('utf-8')
+        self.__fobj.write(index)
+        self.__fobj.write(b''.join(_LENGTH.pack(length) for length in self.__lengths))
+        self.__fobj.write(_FOOTER.pack(index_offset, len(index), FOOTER_MAGIC))
+        if hasattr(self.__fobj, 'flush'):
+            self.__fobj.flush()
+
+    def __submit(self, data, last):
+        '''
+        Queues chunk ``data`` for encryption, writing finished chunks out
+        first if too many are in flight. ``data`` is copied, so the caller
+        is free to reuse it.
+        '''
+        header = _CHUNK_HEADER.pack(self.__id, len(self.__lengths) + len(self.__pending), _LAST if last else 0)
+        while len(self.__pending) >= self.__jobs * 2:
+            self.__flush_one()
+        self.__pending.append(self.__executor.submit(
+            self.__pkey.encrypt_bytes, header + bytes(data), compress_algo=self.compress_algo))
+
+    def __flush_one(self):
+        '''
+        Waits for the oldest chunk in flight and writes it out.
+        '''
+        encrypted = self.__pending.popleft().result()
+        self.__fobj.write(encrypted)
+        self.__lengths.append(len(encrypted))
+
+class ContainerReader(object):
+    '''
+    Reads a container from the binary file object ``fobj``, which has to be
+    seekable, decrypting chunks with ``decrypt``: a function that takes the
+    encrypted bytes of one chunk and returns them decrypted, like the one
+    :func:`gpg_decrypter` returns. Reads that cover more than one chunk
+    decrypt up to ``jobs`` of them at once.
+
+    It works like a read-only binary file -- :func:`read`, :func:`seek`
+    and :func:`tell` -- and :func:`read_range` reads a range without
+    touching the position. ``size`` is the size of the decrypted contents.
+    ``fobj`` is closed along with the reader.
+
+    A ContainerFormatError is raised for anything that isn't a container
+    and for chunks that turn out not to be where the index says they are.
+    '''
+    def __init__(self, fobj, decrypt, jobs=None):
+        import itertools
+        self.__fobj = fobj
+        self.__decrypt = decrypt
+        self.__jobs = jobs or os.cpu_count() or 1
+        self.__lock = threading.Lock()
+        self.__cached = (None, None)
+        self.__position = 0
+        fobj.seek(0)
+        if fobj.read(len(MAGIC)) != MAGIC:
+            raise ContainerFormatError('not a container')
+        end = fobj.seek(0, os.SEEK_END)
+        if end < len(MAGIC) + _FOOTER.size:
+            raise ContainerFormatError('container is truncated')
+        fobj.seek(end - _FOOTER.size)
+        (index_offset, index_length, magic) = _FOOTER.unpack(fobj.read(_FOOTER.size))
+        if magic != FOOTER_MAGIC or index_offset + index_length > end - _FOOTER.size:
+            raise ContainerFormatError('container is truncated or has no index')
+        fobj.seek(index_offset)
+        try:
+            index = json.loads(fobj.read(index_length).decode('utf-8'))
+            if not isinstance(index, dict) or index.get('version') != 1:
+                raise ContainerFormatError('container index is malformed or from an unknown version')
+            self.__id = bytes.fromhex(index['id'])
+            self.recipient = index['recipient']
+            self.chunk_size = int(index['chunk_size'])
+            self.size = int(index['size'])
+            count = int(index['chunks'])
+            if self.chunk_size < 1 or self.size < 0 or count < 1:
+                raise ContainerFormatError('container index is malformed')
+        except (ValueError, KeyError, TypeError):
+            raise ContainerFormatError('container index is malformed')
+        table = fobj.read(count * _LENGTH.size)
+        if len(table) != count * _LENGTH.size or index_offset + index_length + len(table) != end - _FOOTER.size:
+            raise ContainerFormatError('container index is malformed')
+        self.__lengths = [length for (length,) in _LENGTH.iter_unpack(table)]
+        self.__offsets = list(itertools.accumulate([len(MAGIC)] + self.__lengths[:-1]))
+        if count != max(1, -(-self.size // self.chunk_size)) or len(MAGIC) + sum(self.__lengths) != index_offset:
+            raise ContainerFormatError('container index is malformed')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''
+        Closes the underlying file object.
+        '''
+        self.__fobj.close()
+
+    @property
+    def chunks(self):
+        '''
+        The number of chunks in the container.
+        '''
+        return len(self.__lengths)
+
+    def tell(self):
+        '''
+        Returns the current position in the decrypted contents.
+        '''
+        return self.__position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        '''
+        Moves the current position like :py:meth:`io.IOBase.seek` and
+        returns the new position.
+        '''
+        if whence == os.SEEK_CUR:
+            offset += self.__position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('negative seek position {}'.format(offset))
+        self.__position = offset
+        return offset
+
+    def read(self, size=-1):
+        '''
+        Reads and returns up to ``size`` bytes from the current position,
+        or everything up to the end if ``size`` is negative.
+        '''
+        if size is None or size < 0:
+            size = max(0, self.size - self.__position)
+        data = self.read_range(self.__position, size)
+        self.__position += len(data)
+        return data
+
+    def read_range(self, offset, length):
+        '''
+        Returns up to ``length`` decrypted bytes starting at ``offset``,
+        decrypting only the chunks that cover them.
+        '''
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b''
+        first = offset // self.chunk_size
+        last = (end - 1) // self.chunk_size
+        chunks = self.__chunks(range(first, last + 1))
+        data = b''.join(chunks)
+        start = offset - first * self.chunk_size
+        return data[start:start + end - offset]
+
+    def iter_chunks(self):
+        '''
+        Yields the decrypted contents of every chunk in order, decrypting
+        up to ``jobs`` chunks ahead.
+        '''
+        for start in range(0, self.chunks, self.__jobs * 2):
+            for data in self.__chunks(range(start, min(start + self.__jobs * 2, self.chunks))):
+                yield data
+
+    def __chunks(self, seqs):
+        '''
+        Returns the decrypted contents of the chunks numbered ``seqs``.
+        '''
+        if len(seqs) == 1 or self.__jobs == 1:
+            return [self.__chunk(seq) for seq in seqs]
+        from concurrent import futures
+        with futures.ThreadPoolExecutor(max_workers=min(self.__jobs, len(seqs))) as executor:
+            return list(executor.map(self.__chunk, seqs))
+
+    def __chunk(self, seq):
+        '''
+        Returns the decrypted contents of chunk ``seq``, checking that it
+        really is that chunk of this container. The last chunk decrypted is
+        kept so sequential small reads don't decrypt it over and over.
+        '''
+        with self.__lock:
+            (cached_seq, cached) = self.__cached
+            if cached_seq == seq:
+                return cached
+            self.__fobj.seek(self.__offsets[seq])
+            encrypted = self.__fobj.read(self.__lengths[seq])
+        plain = self.__decrypt(encrypted)
+        if len(plain) < _CHUNK_HEADER.size:
+            raise ContainerFormatError('chunk {} is malformed'.format(seq))
+        (ident, actual_seq, flags) = _CHUNK_HEADER.unpack_from(plain)
+        is_last = seq == self.chunks - 1
+        if ident != self.__id or actual_seq != seq or bool(flags & _LAST) != is_last:
+            raise ContainerFormatError('chunk {} does not belong here'.format(seq))
+        data = bytes(memoryview(plain)[_CHUNK_HEADER.size:])
+        expected = self.chunk_size if not is_last else self.size - seq * self.chunk_size
+        if len(data) != expected:
+            raise ContainerFormatError('chunk {} has the wrong size'.format(seq))
+        with self.__lock:
+            self.__cached = (seq, data)
+        return data
+
+class ContainerError(Exception):
+    '''
+    Base class for the errors raised by this module.
+    '''
+    pass
+
+class ContainerFormatError(ContainerError):
+    '''
+    Raised when a file isn't a container or a container has been
+    truncated or tampered with.
+    '''
+    pass
+
+class ContainerDecryptError(ContainerError):
+    '''
+    Raised by the :func:`gpg_decrypter` function when gpg can't decrypt a
+    chunk.
+    '''
+    pass
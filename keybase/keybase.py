@@ -13,13 +13,13 @@
 #pylint: disable=C0302
 #pylint: disable=W0142
 
-import datetime
-import gnupg
+# Only os is imported up front. Everything else, gnupg and requests in
+# particular, is imported where it's used so that ``from keybase import
+# keybase`` stays fast for short-lived tools that only need the constants or
+# a few lookups. None of the gpg binary probing happens until it's needed
+# either.
+
 import os
-import requests
-import shutil
-import subprocess
-import tempfile
 
 ################################################################################
 # CONSTANTS
@@ -33,9 +33,101 @@ WEB = 'web'
 COINBASE = 'coinbase'
 KEYFINGERPRINT = 'key_fingerprint'
 
+# The number of usernames sent in each user/lookup.json request made by
+# lookup().
+LOOKUP_BATCH_SIZE = 50
+
+# The sections of a user object that can be asked for with the ``fields``
+# argument to Keybase(), lookup() and discover(). Sections that aren't asked
+# for are fetched the first time something needs them.
+LOOKUP_FIELDS = ('basics', 'profile', 'public_keys', 'proofs_summary',
+                 'cryptocurrency_addresses', 'pictures', 'sigs', 'devices')
+
+# Seconds to wait for a connection to the keybase.io API and between bytes
+# of its responses before giving up on a call. See api_breaker and
+# set_hedger() for what's done about slow and failing calls.
+API_CONNECT_TIMEOUT = 3.05
+API_READ_TIMEOUT = 30
+
+# Temporary gpg home directories are named KEYRING_PREFIX + random +
+# KEYRING_SUFFIX. The prefix records the pid of the process that made the
+# directory. While a directory is in use its owner holds an flock on the
+# KEYRING_LOCK file inside it, so orphans left behind by crashed processes
+# are the directories whose lock can be taken.
+KEYRING_PREFIX = 'keybase-{}-'
+KEYRING_SUFFIX = '.keybase'
+KEYRING_LOCK = 'keybase-py.lock'
+
+# Signed input is checked for well-formed armor, packet framing and the
+# right issuer in Python before gpg is started on it. See keybase.openpgp.
+# Embedded-signature files larger than PRECHECK_MAX_FILE_SIZE bytes go
+# straight to gpg.
+PRECHECK_SIGNATURES = True
+PRECHECK_MAX_FILE_SIZE = 1024 * 1024
+
+# The user cache installed with set_user_cache(), if any.
+_USER_CACHE = None
+
+# The negative cache installed with set_negative_cache(), if any.
+_NEGATIVE_CACHE = None
+
+# Where calibrate_gpg() saves the gpg binary and options it picked and
+# where load_gpg_calibration() reads them from. Nothing is read unless
+# load_gpg_calibration() is called.
+GPG_CALIBRATION_FILE = os.path.join(os.path.expanduser('~'), '.keybase-py', 'gpg-calibration.json')
+
+# The gpg binaries, in order of preference, and the sets of extra options
+# calibrate_gpg() tries.
+GPG_CANDIDATES = ('gpg2', 'gpg', 'gpg1')
+GPG_OPTION_SETS = (
+    (),
+    ('--no-auto-check-trustdb',),
+    ('--no-auto-check-trustdb', '--trust-model', 'always'),
+    ('--no-auto-check-trustdb', '--trust-model', 'always', '--no-autostart'),
+)
+
+# The calibration installed with set_gpg_calibration(),
+# load_gpg_calibration() or calibrate_gpg(), if any.
+_GPG_CALIBRATION = None
+
+# The verification cache installed with set_verify_cache(), if any.
+_VERIFY_CACHE = None
+
+# verify_file() reads files up to this size in to memory when the
+# verification cache is on, so the bytes it hashes are the bytes gpg
+# checks. Bigger files are streamed to gpg and not cached.
+VERIFY_CACHE_MAX_FILE_SIZE = 16 * 1024 * 1024
+
+# The hedger installed with set_hedger(), if any.
+_HEDGER = None
+
+# The HTTP transport installed with set_transport(). None means a one-off
+# requests call, and so a new connection, per API request.
+_TRANSPORT = None
+
+# Answers to ``gpg --list-config`` queries, keyed by (gpg binary, config).
+_GPG_CONFIG_CACHE = dict()
+
+# Size of the scratch buffer used when streaming gpg output in to a
+# caller-supplied file-like object.
+GPG_IO_CHUNK_SIZE = 64 * 1024
+
+# The JSON decoder installed with set_json_decoder(). None means use orjson
+# if it's installed and the standard library decoder if it isn't.
+_JSON_DECODER = None
+_DEFAULT_JSON_DECODER = None
+
+# Size of the reads made from streamed API responses by iter_lookup() and
+# iter_discover().
+JSON_STREAM_CHUNK_SIZE = 16 * 1024
+
+# compress_algo='auto' guesses how well a payload compresses from up to
+# COMPRESS_SAMPLE_SIZE bytes of it. See KeybaseCompressionChooser.
+COMPRESS_SAMPLE_SIZE = 64 * 1024
+
 ################################################################################
 
-def discover(idtype, ids):
+def discover(idtype, ids, fields=None):
     '''
     Lookup Keybase accounts using other information like Twitter handles
     or Github user names. You can pass an iterable of IDs to lookup and you
@@ -47,9 +139,9 @@ def discover(idtype, ids):
     >>> type(users[0])
     <class 'keybase.keybase.Keybase'>
     >>> users[0].username
-    u'irc'
+    'irc'
     >>> users[0].get_public_key().kid
-    u'0101f56ecf27564e5bec1c50250d09efe963cad3138d4dc7f4646c77f6008c1e23cf0a'
+    '0101f56ecf27564e5bec1c50250d09efe963cad3138d4dc7f4646c77f6008c1e23cf0a'
 
     Valid types are:
 
@@ -73,11 +165,21 @@ def discover(idtype, ids):
     >>> discover('invalidtype', ['ircri'])
     Traceback (most recent call last):
     ...
-    KeybaseInvalidIdTypeError
+    keybase.keybase.KeybaseInvalidIdTypeError
+
+    The matching users are fetched with :func:`keybase.lookup` and
+    ``fields`` is passed along to it.
+
+    If a negative cache has been installed with
+    :func:`keybase.set_negative_cache` IDs it knows have no matches aren't
+    sent, and when none of the IDs match they're all added to it.
     '''
     uids = []
     if idtype not in (TWITTER, GITHUB, HACKERNEWS, WEB, COINBASE, KEYFINGERPRINT):
         raise KeybaseInvalidIdTypeError
+    ids = [uid for uid in ids if not _known_missing(idtype, uid)]
+    if not ids:
+        return tuple(uids)
     jresponse = _get_json_from_url(
         _build_url('user/discover.json'),
         {idtype : (',').join(ids), 'usernames_only' : 1, 'flatten' : 1},
@@ -86,11 +188,383 @@ def discover(idtype, ids):
         raise KeybaseError('Malformed API response to user/discover.json request')
     if not 'matches' in jresponse:
         raise KeybaseError('Malformed API response to user/discover.json request')
-    for uid in jresponse['matches']:
-        k = Keybase(uid)
-        uids.append(k)
+    if not jresponse['matches']:
+        _add_missing(idtype, ids)
+    for kbase in lookup(jresponse['matches'], fields=fields):
+        if kbase is not None:
+            uids.append(kbase)
     return tuple(uids)
 
+def iter_discover(idtype, ids, fields=None):
+    '''
+    A lazy version of :func:`keybase.discover` that yields the Keybase
+    instance for every match as soon as it has been looked up.
+
+    >>> users = iter_discover(TWITTER, ['ircri'])
+    >>> next(users).username
+    'irc'
+
+    The list of matches is parsed incrementally as the discovery response
+    arrives and the matching users are looked up with
+    :func:`keybase.iter_lookup`, a batch at a time, while the rest of the
+    matches are still being read.
+    '''
+    if idtype not in (TWITTER, GITHUB, HACKERNEWS, WEB, COINBASE, KEYFINGERPRINT):
+        raise KeybaseInvalidIdTypeError
+    ids = [uid for uid in ids if not _known_missing(idtype, uid)]
+    if not ids:
+        return
+    jresponse = dict()
+    matches = _iter_json_from_url(
+        _build_url('user/discover.json'),
+        {idtype : (',').join(ids), 'usernames_only' : 1, 'flatten' : 1},
+        'matches',
+        jresponse)
+    matched = False
+    for kbase in iter_lookup(matches, fields=fields):
+        matched = True
+        if kbase is not None:
+            yield kbase
+    if not 'status' in jresponse or not 'name' in jresponse['status']:
+        raise KeybaseError('Malformed API response to user/discover.json request')
+    if not matched:
+        _add_missing(idtype, ids)
+
+def lookup(usernames, batch_size=LOOKUP_BATCH_SIZE, fields=None):
+    '''
+    Look up many Keybase users at once. Returns a tuple with one entry for
+    every username in ``usernames``, in the same order: a Keybase instance
+    if the user exists or None if they don't.
+
+    >>> users = lookup(['irc', 'abcdefghijklmno123notauserhahaha'])
+    >>> users[0].username
+    'irc'
+    >>> users[1] is None
+    True
+
+    Users are fetched ``batch_size`` at a time, so looking up a thousand
+    users costs twenty requests instead of a thousand. If a user cache has
+    been installed with :func:`keybase.set_user_cache` users found in the
+    cache aren't fetched at all and the ones that are fetched are added to
+    it.
+
+    Pass ``fields`` to fetch only some sections of every user object, e.g.
+    ``fields=('profile', 'public_keys')``. See :class:`keybase.Keybase` for
+    how sections that weren't fetched are handled. Partial user objects
+    are never added to the user cache.
+
+    Likewise, if a negative cache has been installed with
+    :func:`keybase.set_negative_cache` users it knows don't exist aren't
+    fetched and the ones that turn out not to exist are added to it.
+    '''
+    fields = _lookup_fields(fields)
+    usernames = list(usernames)
+    found = dict()
+    missing = list()
+    absent = set()
+    seen = set()
+    for username in usernames:
+        if username in seen:
+            continue
+        seen.add(username)
+        user_object = _USER_CACHE.get(username) if _USER_CACHE is not None else None
+        if user_object is not None:
+            found[username] = (user_object, None)
+        elif _known_missing('username', username):
+            absent.add(username)
+        else:
+            missing.append(username)
+    for start in range(0, len(missing), max(1, batch_size)):
+        batch = missing[start:start + max(1, batch_size)]
+        try:
+            user_objects = _lookup_batch(batch, fields)
+        except KeybaseUnavailableError:
+            for (username, user_object) in _stale_users(batch):
+                found[username] = (user_object, None)
+            continue
+        for (username, user_object) in zip(batch, user_objects):
+            if user_object:
+                found[username] = (user_object, fields)
+                if _USER_CACHE is not None and fields is None:
+                    _USER_CACHE.put(username, user_object)
+            else:
+                _add_missing('username', (username,))
+    users = list()
+    for username in usernames:
+        if username in found:
+            (user_object, user_fields) = found[username]
+            users.append(Keybase._from_user_object(username, user_object, user_fields))
+        else:
+            users.append(None)
+    return tuple(users)
+
+def _lookup_batch(usernames, fields=None):
+    '''
+    Fetches the user objects for all of ``usernames`` with a single
+    user/lookup.json request. Returns a list with the user object, or None,
+    for every username in order.
+
+    The API rejects a whole batch if any one of the names in it is
+    unknown or malformed. When that happens the batch is split in half and
+    each half is retried, so a few bad names cost a handful of extra
+    requests rather than one request per name.
+
+    If ``fields`` is given only those sections of the user objects are
+    requested.
+    '''
+    params = {'usernames': ','.join(usernames)}
+    if fields is not None:
+        params['fields'] = ','.join(fields)
+    jresponse = _get_json_from_url(_build_url('user/lookup.json'), params, method='get')
+    if jresponse['status']['name'] in ('NOT_FOUND', 'INPUT_ERROR'):
+        if len(usernames) == 1:
+            return [None]
+        half = len(usernames) // 2
+        return _lookup_batch(usernames[:half], fields) + _lookup_batch(usernames[half:], fields)
+    if not 'them' in jresponse or len(jresponse['them']) != len(usernames):
+        raise KeybaseError('Malformed API response to user/lookup.json request')
+    return list(jresponse['them'])
+
+def iter_lookup(usernames, batch_size=LOOKUP_BATCH_SIZE, fields=None):
+    '''
+    A lazy version of :func:`keybase.lookup`. Yields a Keybase instance, or
+    None if the user doesn't exist, for every username in ``usernames`` in
+    order.
+
+    >>> users = iter_lookup(['irc', 'abcdefghijklmno123notauserhahaha'])
+    >>> next(users).username
+    'irc'
+    >>> next(users) is None
+    True
+
+    ``usernames`` can be any iterable, including a generator, and is
+    consumed ``batch_size`` names at a time. Each batch's response is
+    parsed incrementally as it arrives, so the first users are handed out
+    before the whole response has been downloaded and the raw response
+    body is never held in memory. The user cache and ``fields``
+    work the same way they do for :func:`keybase.lookup`.
+    '''
+    fields = _lookup_fields(fields)
+    batch = list()
+    for username in usernames:
+        batch.append(username)
+        if len(batch) >= max(1, batch_size):
+            for kbase in _iter_lookup_cached(batch, fields):
+                yield kbase
+            batch = list()
+    for kbase in _iter_lookup_cached(batch, fields):
+        yield kbase
+
+def _iter_lookup_cached(usernames, fields):
+    '''
+    Yields the users in ``usernames`` for :func:`keybase.iter_lookup`,
+    serving the ones it can from the user and negative caches and
+    streaming the rest from a single request.
+    '''
+    cached = dict()
+    missing = list()
+    fetched = dict()
+    seen = set()
+    for username in usernames:
+        if username in seen:
+            continue
+        seen.add(username)
+        user_object = _USER_CACHE.get(username) if _USER_CACHE is not None else None
+        if user_object is not None:
+            cached[username] = user_object
+        elif _known_missing('username', username):
+            fetched[username] = None
+        else:
+            missing.append(username)
+    responses = _iter_lookup_batch(missing, fields)
+    for username in usernames:
+        while username not in cached and username not in fetched:
+            try:
+                (fetched_name, user_object) = next(responses)
+            except KeybaseUnavailableError:
+                cached.update(_stale_users([name for name in missing if name not in fetched]))
+                break
+            fetched[fetched_name] = user_object
+            if not user_object:
+                _add_missing('username', (fetched_name,))
+            elif _USER_CACHE is not None and fields is None:
+                _USER_CACHE.put(fetched_name, user_object)
+        if username in cached:
+            yield Keybase._from_user_object(username, cached[username])
+        elif fetched[username]:
+            yield Keybase._from_user_object(username, fetched[username], fields)
+        else:
+            yield None
+
+def _iter_lookup_batch(usernames, fields=None):
+    '''
+    The streaming version of :func:`keybase._lookup_batch`. Yields a
+    ``(username, user_object)`` pair, with a user object of None for
+    unknown users, for every username in order as the response arrives.
+    '''
+    if not usernames:
+        return
+    params = {'usernames': ','.join(usernames)}
+    if fields is not None:
+        params['fields'] = ','.join(fields)
+    jresponse = dict()
+    count = 0
+    for user_object in _iter_json_from_url(_build_url('user/lookup.json'), params, 'them', jresponse):
+        if count >= len(usernames):
+            raise KeybaseError('Malformed API response to user/lookup.json request')
+        yield (usernames[count], user_object)
+        count += 1
+    if count == 0 and jresponse['status']['name'] in ('NOT_FOUND', 'INPUT_ERROR'):
+        if len(usernames) == 1:
+            yield (usernames[0], None)
+            return
+        half = len(usernames) // 2
+        for pair in _iter_lookup_batch(usernames[:half], fields):
+            yield pair
+        for pair in _iter_lookup_batch(usernames[half:], fields):
+            yield pair
+        return
+    if count != len(usernames):
+        raise KeybaseError('Malformed API response to user/lookup.json request')
+
+def _lookup_fields(fields):
+    '''
+    Normalizes the ``fields`` argument accepted by the lookup functions in
+    to a sorted tuple of section names, or None if every section is
+    wanted. ``fields`` can be an iterable of section names or a single
+    comma separated string.
+    '''
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    fields = set(field.strip() for field in fields)
+    fields.discard('')
+    return tuple(sorted(fields))
+
+def set_user_cache(cache):
+    '''
+    Installs ``cache`` as the cache consulted by :func:`keybase.lookup` and
+    by new Keybase instances before they go to the network. Pass None to
+    turn caching off. Returns the cache that was previously installed.
+
+    >>> previous = set_user_cache(KeybaseUserCache(ttl=60))
+    >>> set_user_cache(previous) is not None
+    True
+
+    See :class:`keybase.KeybaseUserCache` and
+    :class:`keybase.KeybaseFileCache`.
+    '''
+    global _USER_CACHE
+    previous = _USER_CACHE
+    _USER_CACHE = cache
+    return previous
+
+def set_negative_cache(cache):
+    '''
+    Installs ``cache`` as the cache of usernames and discovery IDs that are
+    known not to exist. Lookups and discoveries of names in it fail straight
+    away without going to the network. Pass None to turn negative caching
+    off. Returns the cache that was previously installed.
+
+    >>> previous = set_negative_cache(KeybaseNegativeCache(ttl=60))
+    >>> set_negative_cache(previous) is not None
+    True
+
+    See :class:`keybase.KeybaseNegativeCache`.
+    '''
+    global _NEGATIVE_CACHE
+    previous = _NEGATIVE_CACHE
+    _NEGATIVE_CACHE = cache
+    return previous
+
+def set_verify_cache(cache):
+    '''
+    Installs ``cache`` as the cache of signature verification outcomes
+    consulted by :func:`keybase.KeybasePublicKey.verify`,
+    :func:`keybase.KeybasePublicKey.verify_bytes` and
+    :func:`keybase.KeybasePublicKey.verify_file`. Pass None to turn it off.
+    Returns the cache that was previously installed.
+
+    >>> previous = set_verify_cache(KeybaseVerifyCache(max_entries=100))
+    >>> set_verify_cache(previous) is not None
+    True
+
+    See :class:`keybase.KeybaseVerifyCache`. Files bigger than
+    ``VERIFY_CACHE_MAX_FILE_SIZE`` bytes passed to
+    :func:`keybase.KeybasePublicKey.verify_file` are always checked by gpg.
+    '''
+    global _VERIFY_CACHE
+    previous = _VERIFY_CACHE
+    _VERIFY_CACHE = cache
+    return previous
+
+def set_hedger(hedger):
+    '''
+    Installs ``hedger`` to send a second copy of keybase.io API requests
+    that are taking longer than usual. Pass None to turn hedging off.
+    Returns the hedger that was previously installed.
+
+    >>> previous = set_hedger(KeybaseHedger())
+    >>> set_hedger(previous) is not None
+    True
+
+    See :class:`keybase.KeybaseHedger`.
+    '''
+    global _HEDGER
+    previous = _HEDGER
+    _HEDGER = hedger
+    return previous
+
+def set_transport(transport):
+    '''
+    Installs ``transport`` to send keybase.io API requests. Pass None to go
+    back to a separate :py:mod:`requests` call, with its own connection, for
+    every request. Returns the transport that was previously installed.
+
+    >>> previous = set_transport(KeybaseRequestsTransport())
+    >>> set_transport(previous).close()
+
+    See :class:`keybase.KeybaseRequestsTransport` and
+    :class:`keybase.KeybaseHTTPXTransport`. Any object with the same
+    ``request()`` method will do.
+    '''
+    global _TRANSPORT
+    previous = _TRANSPORT
+    _TRANSPORT = transport
+    return previous
+
+def _stale_users(usernames):
+    '''
+    Returns a ``(username, user_object)`` pair for each of ``usernames``
+    from the installed user cache, however old the entries are, for when
+    the API is unavailable. Raises a KeybaseUnavailableError if there's no
+    user cache or it doesn't have all of them.
+    '''
+    users = list()
+    for username in usernames:
+        user_object = _USER_CACHE.get_stale(username) if _USER_CACHE is not None else None
+        if user_object is None:
+            raise KeybaseUnavailableError('keybase.io API unavailable and {} is not cached'.format(username))
+        users.append((username, user_object))
+    return users
+
+def _known_missing(idtype, uid):
+    '''
+    Returns True if the installed negative cache knows there's nothing to
+    find for ``uid``. ``idtype`` is 'username' for lookups or one of the
+    discovery ID types.
+    '''
+    return _NEGATIVE_CACHE is not None and _NEGATIVE_CACHE.contains('{}:{}'.format(idtype, uid))
+
+def _add_missing(idtype, uids):
+    '''
+    Adds ``uids`` of type ``idtype`` to the installed negative cache.
+    '''
+    if _NEGATIVE_CACHE is not None:
+        for uid in uids:
+            _NEGATIVE_CACHE.add('{}:{}'.format(idtype, uid))
+
 def gpg(binary=None):
     '''
     Returns the full path to the gpg instance on this machine. It prefers
@@ -117,7 +591,15 @@ def gpg(binary=None):
 
     >>> gpg('notagpgbinary')
 
+    If a calibration has been installed with :func:`keybase.calibrate_gpg`,
+    :func:`keybase.load_gpg_calibration` or
+    :func:`keybase.set_gpg_calibration`, the binary it picked is returned
+    instead of searching for one.
     '''
+    if not binary:
+        calibration = _GPG_CALIBRATION
+        if calibration is not None:
+            return calibration['binary']
     if binary:
         search_list = [binary]
     else:
@@ -172,6 +654,214 @@ def _which(executable, flags=os.X_OK):
                 result.append(tpath)
     return result
 
+def calibrate_gpg(path=None, binaries=None, option_sets=None, rounds=5):
+    '''
+    Times a small verify and encrypt round with every gpg binary in
+    ``binaries`` (``keybase.GPG_CANDIDATES`` by default) that's installed,
+    run with each set of extra options in ``option_sets``
+    (``keybase.GPG_OPTION_SETS`` by default), and picks the fastest
+    combination that gets the right answers: the signature verifies as
+    made by the right key and the data is encrypted to the right key.
+    Each combination is timed ``rounds`` times and judged on the median.
+
+    The choice is installed, so :func:`keybase.gpg` returns the binary and
+    the extra options are added to the gpg command lines this module runs
+    itself, and it's saved as JSON to ``path``, ``keybase.GPG_CALIBRATION_FILE``
+    if it's None, where later runs can pick it up with
+    :func:`keybase.load_gpg_calibration`. Returns the choice as a
+    dictionary with the timings of every combination tried under
+    ``results``. A KeybaseError is raised if no combination works.
+
+    Calibration takes a second or two, most of it generating a throwaway
+    key to sign the test message with. It only needs doing again when
+    gpg is upgraded; a saved choice is ignored once the binary it names
+    has changed.
+    '''
+    import json
+    import shutil
+    import tempfile
+    import time
+    candidates = list()
+    for name in binaries or GPG_CANDIDATES:
+        found = _which(name)
+        if found and os.path.realpath(found[0]) not in candidates:
+            candidates.append(os.path.realpath(found[0]))
+    if not candidates:
+        raise KeybaseError('No gpg binary found to calibrate')
+    workdir = tempfile.mkdtemp(prefix='keybase-calibrate-')
+    try:
+        (fingerprint, bundle, signed) = _calibration_key(candidates, workdir)
+        results = list()
+        for (index, binary) in enumerate(candidates):
+            homedir = os.path.join(workdir, str(index))
+            os.mkdir(homedir, 0o700)
+            _run_gpg([binary, '--no-options', '--batch', '--homedir', homedir, '--import'], data=memoryview(bundle))
+            for options in option_sets or GPG_OPTION_SETS:
+                timings = list()
+                for _ in range(rounds):
+                    began = time.time()
+                    if not _calibration_round(binary, homedir, list(options), fingerprint, signed):
+                        break
+                    timings.append(time.time() - began)
+                results.append({
+                    'binary': binary,
+                    'options': list(options),
+                    'ok': len(timings) == rounds,
+                    'seconds': sorted(timings)[len(timings) // 2] if len(timings) == rounds else None,
+                })
+            _stop_gpg_agent(binary, homedir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    passed = [result for result in results if result['ok']]
+    if not passed:
+        raise KeybaseError('No gpg binary and options passed calibration')
+    best = min(passed, key=lambda result: result['seconds'])
+    calibration = {
+        'binary': best['binary'],
+        'binary_mtime': os.path.getmtime(best['binary']),
+        'options': best['options'],
+        'seconds': best['seconds'],
+        'calibrated': time.time(),
+        'results': results,
+    }
+    path = path or GPG_CALIBRATION_FILE
+    if path:
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        temppath = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temppath, 'w') as fobj:
+            json.dump(calibration, fobj, indent=2, sort_keys=True)
+        os.replace(temppath, path)
+    set_gpg_calibration(calibration)
+    return calibration
+
+def set_gpg_calibration(calibration):
+    '''
+    Installs ``calibration``, a dictionary like the ones
+    :func:`keybase.calibrate_gpg` returns, as the gpg binary and options
+    to use. Only its ``binary`` and ``options`` are needed. Pass None to
+    go back to searching for gpg and running it without extra options.
+    Returns the calibration that was previously in use, if any.
+    '''
+    global _GPG_CALIBRATION
+    previous = _GPG_CALIBRATION
+    _GPG_CALIBRATION = calibration
+    return previous
+
+def load_gpg_calibration(path=None):
+    '''
+    Installs the calibration saved by :func:`keybase.calibrate_gpg` in
+    ``path``, ``keybase.GPG_CALIBRATION_FILE`` if it's None, and returns
+    it. Saved calibrations are never used unless this is called.
+
+    Returns None, and leaves the gpg binary and options alone, if there's
+    no file. Raises a KeybaseError if the file can't be read, if its
+    binary isn't one of the ``keybase.GPG_CANDIDATES`` found on the PATH
+    or has changed since the calibration, or if its options aren't one of
+    the ``keybase.GPG_OPTION_SETS``.
+    '''
+    import json
+    path = path or GPG_CALIBRATION_FILE
+    try:
+        with open(path, 'r') as fobj:
+            calibration = json.load(fobj)
+    except FileNotFoundError:
+        return None
+    except (IOError, OSError, ValueError) as err:
+        raise KeybaseError('Unable to read gpg calibration {}: {}'.format(path, err))
+    try:
+        binary = calibration['binary']
+        options = tuple(calibration['options'])
+        installed = [os.path.realpath(found[0]) for found in map(_which, GPG_CANDIDATES) if found]
+        if binary not in installed or os.path.getmtime(binary) != calibration['binary_mtime']:
+            raise KeybaseError('gpg calibration {} is for a gpg binary that has changed or is not a known gpg'.format(path))
+    except (KeyError, TypeError, OSError):
+        raise KeybaseError('Malformed gpg calibration {}'.format(path))
+    if options not in [tuple(option_set) for option_set in GPG_OPTION_SETS]:
+        raise KeybaseError('gpg calibration {} has unknown options: {}'.format(path, ' '.join(map(str, options))))
+    set_gpg_calibration(calibration)
+    return calibration
+
+def _gpg_options():
+    '''
+    Returns the extra gpg options of the installed calibration.
+    '''
+    calibration = _GPG_CALIBRATION
+    if calibration is None:
+        return []
+    return list(calibration.get('options', ()))
+
+def _calibration_key(binaries, workdir):
+    '''
+    Generates a throwaway RSA key in ``workdir`` with the first of
+    ``binaries`` that manages to and signs a test message with it. RSA is
+    used so that every version of gpg can check the signature. Returns
+    the key's fingerprint, its exported public key and the signed message.
+    '''
+    parameters = b'''%no-protection
+Key-Type: RSA
+Key-Length: 2048
+Key-Usage: sign
+Subkey-Type: RSA
+Subkey-Length: 2048
+Subkey-Usage: encrypt
+Name-Real: keybase-py calibration
+Expire-Date: 0
+%commit
+'''
+    for binary in binaries:
+        homedir = os.path.join(workdir, 'key')
+        os.mkdir(homedir, 0o700)
+        base = [binary, '--no-options', '--no-tty', '--batch', '--homedir', homedir]
+        try:
+            if _run_gpg(base + ['--gen-key'], data=memoryview(parameters))[0] != 0:
+                continue
+            listing = _run_gpg(base + ['--with-colons', '--fingerprint'])[1].decode('ascii', 'replace')
+            fingerprint = [line.split(':')[9] for line in listing.splitlines() if line.startswith('fpr:')][0]
+            (returncode, signed, _) = _run_gpg(base + ['--sign'], data=memoryview(b'keybase-py gpg calibration\n'))
+            if returncode == 0 and signed:
+                return (fingerprint, _run_gpg(base + ['--export', fingerprint])[1], signed)
+        except (IndexError, OSError):
+            pass
+        finally:
+            _stop_gpg_agent(binary, homedir)
+            import shutil
+            shutil.rmtree(homedir, ignore_errors=True)
+    raise KeybaseError('Unable to generate a gpg key to calibrate with')
+
+def _calibration_round(binary, homedir, options, fingerprint, signed):
+    '''
+    Verifies ``signed`` and encrypts a few bytes to the key with
+    ``fingerprint`` with ``binary`` and ``options``. Returns True if both
+    came out right.
+    '''
+    from keybase import openpgp
+    base = [binary, '--no-options', '--no-tty', '--batch', '--status-fd', '2', '--homedir', homedir] + options
+    try:
+        (_, _, status) = _run_gpg(base + ['--verify'], data=memoryview(signed))
+        if _verify_outcome(status) != (True, 'signature valid'):
+            return False
+        if not any(keyword == 'VALIDSIG' and fingerprint in value for (keyword, value) in status):
+            return False
+        args = ['--encrypt', '--always-trust', '--recipient', fingerprint]
+        (returncode, encrypted, _) = _run_gpg(base + args, data=memoryview(b'keybase-py gpg calibration\n'))
+        if returncode != 0 or not encrypted:
+            return False
+        return next(iter(openpgp.packets(encrypted)))[0] == 1
+    except (OSError, StopIteration, openpgp.OpenPGPError):
+        return False
+
+def _stop_gpg_agent(binary, homedir):
+    '''
+    Stops any gpg-agent or keyboxd started for ``homedir``.
+    '''
+    import subprocess
+    gpgconf = os.path.join(os.path.dirname(binary), 'gpgconf')
+    if os.access(gpgconf, os.X_OK):
+        subprocess.call([gpgconf, '--homedir', homedir, '--kill', 'all'],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
 def _build_url(endpoint):
     '''
     Builds a Keybase API URL for endpoint. Returns the URL as
@@ -187,7 +877,7 @@ def _build_url(endpoint):
     >>> _build_url('')
     Traceback (most recent call last):
     ...
-    KeybaseError: Missing URL endpoint for API call
+    keybase.keybase.KeybaseError: Missing URL endpoint for API call
 
     '''
     if len(endpoint) < 1:
@@ -208,9 +898,9 @@ def _get_json_from_url(url, params, method='get'):
     >>> salt_url = 'https://keybase.io/_/api/1.0/getsalt.json'
     >>> parameters = {'email_or_username': 'bpugh'}
     >>> example = _get_json_from_url(salt_url, parameters, method='get')
-    >>> example['status'] == {u'code': 0, u'name': u'OK'}
+    >>> example['status'] == {'code': 0, 'name': 'OK'}
     True
-    >>> example['salt'] == u'e4725d30ed9df0082df4197596c4110c'
+    >>> example['salt'] == 'e4725d30ed9df0082df4197596c4110c'
     True
     >>> example['login_session'] is not None
     True
@@ -224,20 +914,693 @@ def _get_json_from_url(url, params, method='get'):
 
     Raises a KeybaseError if the response isn't well-formed Keybase JSON
     response. It will raise an HTTPError for non 200-status responses.
+
+    Calls time out after ``API_CONNECT_TIMEOUT`` seconds without a
+    connection or ``API_READ_TIMEOUT`` seconds without data. Every outcome
+    is reported to :data:`keybase.api_breaker`, and while it's open a
+    KeybaseUnavailableError is raised without making the call. GET
+    requests go through the hedger installed with
+    :func:`keybase.set_hedger`, if there is one, and every request goes
+    through the transport installed with :func:`keybase.set_transport`.
     '''
-    if method == 'get':
-        method = requests.get
-    elif method == 'post':
-        method = requests.post
-    else:
-        raise ValueError, "Method must be 'get' or 'post'"
-    resp = method(url, params=params)
+    if method not in ('get', 'post'):
+        raise ValueError("Method must be 'get' or 'post'")
+    def call():
+        return _send(method, url, params)
+    hedger = _HEDGER
+    resp = _call_api(url, call if hedger is None or method != 'get' else lambda: hedger.call(call))
     resp.raise_for_status()
-    jresponse = resp.json()
+    jresponse = _json_decoder()(resp.content)
     if not 'status' in jresponse or not 'name' in jresponse['status']:
         raise KeybaseError('Malformed API response to %s request' % url)
     return jresponse
 
+def _iter_json_from_url(url, params, key, jresponse):
+    '''
+    Streams a GET request to ``url`` and yields the items of the array
+    stored under ``key`` in the top level of the JSON response one at a
+    time as they arrive. When the response has been read the rest of it,
+    including the status, is put in the ``jresponse`` dictionary with
+    ``key`` holding an empty list.
+
+    Raises a KeybaseError if the response isn't a well-formed Keybase JSON
+    response. It will raise an HTTPError for non 200-status responses.
+    Timeouts and :data:`keybase.api_breaker` work like they do for
+    :func:`keybase._get_json_from_url`; streamed requests aren't hedged.
+    '''
+    resp = _call_api(url, lambda: _send('get', url, params, stream=True))
+    try:
+        resp.raise_for_status()
+        stream = _JSONArrayStream(key, _json_decoder())
+        for chunk in resp.iter_content(chunk_size=JSON_STREAM_CHUNK_SIZE):
+            for item in stream.feed(chunk):
+                yield item
+        jresponse.update(stream.close())
+    finally:
+        resp.close()
+    if not 'status' in jresponse or not 'name' in jresponse['status']:
+        raise KeybaseError('Malformed API response to %s request' % url)
+
+def _send(method, url, params, stream=False):
+    '''
+    Sends one API request with the installed transport or, if there isn't
+    one, with a one-off :py:mod:`requests` call. Returns the response.
+    '''
+    timeout = (API_CONNECT_TIMEOUT, API_READ_TIMEOUT)
+    if _TRANSPORT is not None:
+        return _TRANSPORT.request(method, url, params=params, stream=stream, timeout=timeout)
+    import requests
+    send = requests.get if method == 'get' else requests.post
+    return send(url, params=params, stream=stream, timeout=timeout)
+
+def _call_api(url, call):
+    '''
+    Makes an API request to ``url`` by calling ``call`` and returns the
+    response, keeping :data:`keybase.api_breaker` up to date. Connection
+    errors, timeouts, 5xx responses and 429 (too many requests) responses
+    count as failures. Raises a KeybaseUnavailableError straight away if
+    the breaker is open.
+    '''
+    import requests
+    if not api_breaker.allow():
+        raise KeybaseUnavailableError('keybase.io API is unavailable, not calling {}'.format(url))
+    try:
+        resp = call()
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        api_breaker.failure()
+        raise
+    if resp.status_code >= 500 or resp.status_code == 429:
+        api_breaker.failure()
+    else:
+        api_breaker.success()
+    return resp
+
+def set_json_decoder(decoder):
+    '''
+    Installs ``decoder`` as the function used to decode keybase.io API
+    responses. It's called with the raw response body as ``bytes``, or a
+    ``bytearray`` slice of it when responses are streamed, and must return
+    the decoded object. Pass None to go back to the default. Returns the
+    decoder that was previously installed.
+
+    >>> import json
+    >>> previous = set_json_decoder(lambda body: json.loads(bytes(body).decode('utf-8')))
+    >>> callable(set_json_decoder(previous))
+    True
+
+    By default `orjson <https://github.com/ijl/orjson>`_ is used if it's
+    installed, since it decodes the large PGP bundles in lookup responses
+    several times faster than the standard library, and the standard
+    library decoder is used if it isn't.
+    '''
+    global _JSON_DECODER
+    previous = _JSON_DECODER
+    _JSON_DECODER = decoder
+    return previous
+
+def _json_decoder():
+    '''
+    Returns the JSON decoder to use: the one installed with
+    :func:`keybase.set_json_decoder` or the default.
+    '''
+    global _DEFAULT_JSON_DECODER
+    if _JSON_DECODER is not None:
+        return _JSON_DECODER
+    if _DEFAULT_JSON_DECODER is None:
+        try:
+            import orjson
+            _DEFAULT_JSON_DECODER = orjson.loads
+        except ImportError:
+            _DEFAULT_JSON_DECODER = _stdlib_json_decoder
+    return _DEFAULT_JSON_DECODER
+
+def _stdlib_json_decoder(body):
+    '''
+    Decodes the JSON document ``body``, as bytes, with the standard library.
+    '''
+    import json
+    return json.loads(bytes(body).decode('utf-8'))
+
+def usable_keys(keys, purpose='encrypt', now=None):
+    '''
+    Returns a list of the :class:`keybase.KeybasePublicKey` objects in
+    ``keys`` that are still good for ``purpose`` at ``now``, a Unix time
+    that defaults to the current time, in their original order. For
+    ``'encrypt'`` that's keys that haven't expired or been revoked, see
+    :func:`keybase.KeybasePublicKey.usable`; for ``'verify'`` it's keys
+    that haven't been revoked, since signatures made before a key expired
+    still verify.
+
+    :class:`keybase.Keybase` objects can be passed too and are kept if
+    their primary key is. Everything is worked out from the key bundles,
+    so no gpg is run and no keyrings are built to filter the keys of
+    thousands of users in one pass.
+    '''
+    if purpose not in ('encrypt', 'verify'):
+        raise KeybaseError('Unknown key purpose: {}'.format(purpose))
+    usable = list()
+    for key in keys:
+        pkey = key
+        if isinstance(key, Keybase):
+            record = (key._section('public_keys') or dict()).get('primary')
+            if not record:
+                continue
+            pkey = KeybasePublicKey.from_dict(record)
+        if pkey.usable(now) if purpose == 'encrypt' else not pkey.revoked:
+            usable.append(key)
+    return usable
+
+def dumps(obj, serializer='json'):
+    '''
+    Serializes a :class:`keybase.Keybase` or :class:`keybase.KeybasePublicKey`
+    object to bytes that :func:`keybase.loads` turns back in to one. Only
+    the user object or key record is written, so the result is about the
+    size of the API response the object came from and is cheap to send
+    to another process or keep in a cache.
+
+    ``serializer`` is ``'json'`` or ``'msgpack'``. JSON is written with
+    orjson if it's installed. msgpack is a little more compact and quicker
+    again but needs the msgpack package; a KeybaseError is raised if it
+    isn't installed.
+
+    >>> kbase = Keybase('irc')
+    >>> loads(dumps(kbase)).username
+    'irc'
+    '''
+    if isinstance(obj, Keybase):
+        document = {'user': obj.to_dict()}
+    elif isinstance(obj, KeybasePublicKey):
+        document = {'key': obj.to_dict()}
+    else:
+        raise KeybaseError('Cannot serialize a {} object'.format(type(obj).__name__))
+    return _serializer(serializer)[0](document)
+
+def loads(data, serializer='json'):
+    '''
+    Rebuilds the :class:`keybase.Keybase` or :class:`keybase.KeybasePublicKey`
+    object serialized in ``data`` by :func:`keybase.dumps` with
+    ``serializer``. Nothing is fetched from keybase.io and no gpg is run:
+    keys build their keyrings the first time they're used.
+    '''
+    try:
+        document = _serializer(serializer)[1](data)
+        if 'user' in document:
+            return Keybase.from_dict(document['user'])
+        return KeybasePublicKey.from_dict(document['key'])
+    except (KeyError, TypeError, ValueError) as err:
+        raise KeybaseError('Malformed serialized Keybase object: {}'.format(err))
+
+def _serializer(name):
+    '''
+    Returns the ``(dump, load)`` functions for the serializer called
+    ``name``.
+    '''
+    if name == 'json':
+        try:
+            import orjson
+            return (orjson.dumps, _json_decoder())
+        except ImportError:
+            import json
+            return (lambda document: json.dumps(document, separators=(',', ':')).encode('utf-8'),
+                    _json_decoder())
+    if name == 'msgpack':
+        try:
+            import msgpack
+        except ImportError as err:
+            raise KeybaseError('The msgpack serializer needs msgpack installed: {}'.format(err))
+        return (lambda document: msgpack.packb(document, use_bin_type=True),
+                lambda data: msgpack.unpackb(data, raw=False))
+    raise KeybaseError('Unknown serializer: {}'.format(name))
+
+class _JSONArrayStream(object):
+    '''
+    An incremental parser that picks the items out of one array in a JSON
+    document as the document is fed to it in chunks.
+
+    Only the array stored under ``key`` in the top-level object is split
+    up. Each of its items is handed to ``decoder`` as soon as its last byte
+    has been fed, and the bytes it occupied are dropped, so memory use is
+    bounded by the largest single item rather than the whole document.
+    Everything outside the array is kept and decoded by :func:`close`.
+
+    The scanner only has to find the JSON structural characters, which are
+    all ASCII and can't appear inside multi-byte UTF-8 sequences, so it
+    works on the raw bytes and jumps over string contents with
+    ``bytes.find``.
+    '''
+    def __init__(self, key, decoder):
+        import re
+        self.__key = key.encode('utf-8')
+        self.__decoder = decoder
+        self.__structure = re.compile(b'[][{}",:]')
+        self.__buffer = bytearray()
+        self.__skeleton = bytearray()
+        self.__skeleton_start = 0
+        self.__pos = 0
+        self.__depth = 0
+        self.__string_start = None
+        self.__last_string = None
+        self.__current_key = None
+        self.__item_start = None
+
+    def feed(self, chunk):
+        '''
+        Adds ``chunk`` of the document and returns a list of the decoded
+        array items it completed.
+        '''
+        buf = self.__buffer
+        buf += chunk
+        items = list()
+        while self.__pos < len(buf):
+            if self.__string_start is not None:
+                end = buf.find(b'"', self.__pos)
+                if end < 0:
+                    self.__pos = len(buf)
+                    break
+                self.__pos = end + 1
+                backslashes = 0
+                while buf[end - 1 - backslashes] == 0x5c:
+                    backslashes += 1
+                if backslashes % 2:
+                    continue
+                if self.__depth == 1:
+                    self.__last_string = bytes(buf[self.__string_start + 1:end])
+                self.__string_start = None
+                continue
+            match = self.__structure.search(buf, self.__pos)
+            if match is None:
+                self.__pos = len(buf)
+                break
+            index = match.start()
+            char = buf[index:index + 1]
+            self.__pos = index + 1
+            if char == b'"':
+                self.__string_start = index
+            elif char == b':':
+                if self.__depth == 1:
+                    self.__current_key = self.__last_string
+            elif char in b'{[':
+                self.__depth += 1
+                if char == b'[' and self.__depth == 2 and self.__current_key == self.__key:
+                    self.__skeleton += buf[self.__skeleton_start:index + 1]
+                    self.__item_start = index + 1
+            elif char in b'}]':
+                if self.__item_start is not None and self.__depth == 2:
+                    self.__finish_item(index, items)
+                    self.__item_start = None
+                    self.__skeleton_start = index
+                self.__depth -= 1
+            elif char == b',':
+                if self.__item_start is not None and self.__depth == 2:
+                    self.__finish_item(index, items)
+                    self.__item_start = index + 1
+                elif self.__depth == 1:
+                    self.__current_key = None
+        if self.__item_start is not None:
+            # Everything before the item being read has been handed out.
+            del buf[:self.__item_start]
+            self.__pos -= self.__item_start
+            if self.__string_start is not None:
+                self.__string_start -= self.__item_start
+            self.__item_start = 0
+        return items
+
+    def __finish_item(self, end, items):
+        '''
+        Decodes the array item that ends just before ``end`` in to
+        ``items``.
+        '''
+        item = self.__buffer[self.__item_start:end].strip()
+        if item:
+            items.append(self.__decoder(item))
+
+    def close(self):
+        '''
+        Returns the decoded document with the array emptied out. Raises a
+        KeybaseError if the document isn't complete or isn't valid JSON.
+        '''
+        if self.__depth != 0 or self.__string_start is not None:
+            raise KeybaseError('Truncated JSON API response')
+        self.__skeleton += self.__buffer[self.__skeleton_start:]
+        try:
+            document = self.__decoder(self.__skeleton)
+        except ValueError:
+            raise KeybaseError('Malformed JSON API response')
+        if not isinstance(document, dict):
+            raise KeybaseError('Malformed JSON API response')
+        return document
+
+def _bytes_view(data):
+    '''
+    Returns a flat, byte-oriented ``memoryview`` over ``data`` without
+    copying it. ``data`` may be a ``bytes``, ``bytearray`` or ``memoryview``
+    object.
+
+    >>> _bytes_view(b'abc').tobytes() == b'abc'
+    True
+    >>> len(_bytes_view(bytearray(10)))
+    10
+
+    Raises a TypeError for anything else, including text strings, since
+    there is no single right way to turn text in to bytes:
+
+    >>> _bytes_view(42)
+    Traceback (most recent call last):
+    ...
+    TypeError: expected bytes, bytearray or memoryview, got int
+    '''
+    if isinstance(data, memoryview):
+        view = data
+    elif isinstance(data, (bytes, bytearray)):
+        view = memoryview(data)
+    else:
+        raise TypeError(
+            'expected bytes, bytearray or memoryview, got {}'.format(type(data).__name__))
+    if view.ndim != 1 or view.format != 'B':
+        view = view.cast('B')
+    return view
+
+def _fileno(fobj):
+    '''
+    Returns the OS-level file descriptor behind ``fobj`` or None if it
+    doesn't have one. Integers are assumed to already be file descriptors.
+    Pending writes in ``fobj`` are flushed so anything written to the
+    descriptor lands after them.
+    '''
+    if isinstance(fobj, int):
+        return fobj
+    try:
+        fileno = fobj.fileno()
+    except (AttributeError, ValueError, IOError, OSError):
+        return None
+    if hasattr(fobj, 'flush'):
+        fobj.flush()
+    return fileno
+
+def _write_all(stream, view):
+    '''
+    Writes everything in the memoryview ``view`` to the unbuffered
+    ``stream`` and closes it. Slicing a memoryview doesn't copy, so partial
+    writes don't cost us anything.
+
+    A gpg process that bails out early closes its end of the pipe, so
+    broken pipe errors are expected here and ignored: the real reason for
+    the failure shows up in the gpg status output.
+    '''
+    try:
+        while len(view):
+            written = stream.write(view)
+            view = view[written:]
+    except (IOError, OSError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except (IOError, OSError):
+            pass
+
+def _copy_all(stream, fobj):
+    '''
+    Copies everything that can be read from the file-like object ``fobj``
+    to the unbuffered ``stream`` through a small reusable buffer and closes
+    ``stream``. Broken pipes are ignored for the same reason they are in
+    :func:`_write_all`.
+    '''
+    chunk = memoryview(bytearray(GPG_IO_CHUNK_SIZE))
+    try:
+        while True:
+            if hasattr(fobj, 'readinto'):
+                count = fobj.readinto(chunk)
+                view = chunk[:count or 0]
+            else:
+                view = _bytes_view(fobj.read(GPG_IO_CHUNK_SIZE))
+            if not len(view):
+                break
+            while len(view):
+                view = view[stream.write(view):]
+    except (IOError, OSError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except (IOError, OSError):
+            pass
+
+def _parse_gpg_status(output):
+    '''
+    Parses the ``--status-fd`` output of a gpg run in to a list of
+    ``(keyword, value)`` tuples.
+
+    >>> _parse_gpg_status(b'gpg: noise\\n[GNUPG:] NEWSIG\\n[GNUPG:] BADSIG F56B7A6F0A32A0B9 irc\\n')
+    [('NEWSIG', ''), ('BADSIG', 'F56B7A6F0A32A0B9 irc')]
+    '''
+    status = []
+    for line in output.decode('utf-8', 'replace').splitlines():
+        if not line.startswith('[GNUPG:] '):
+            continue
+        parts = line[9:].split(' ', 1)
+        status.append((parts[0], parts[1] if len(parts) > 1 else ''))
+    return status
+
+def _run_gpg(command, data=None, output=None, inputs=()):
+    '''
+    Runs the gpg ``command`` and returns a ``(returncode, result, status)``
+    tuple where ``status`` is the parsed ``--status-fd 2`` output.
+
+    ``data`` is fed to gpg's stdin. It may be a memoryview, which is written
+    straight to the pipe without any intermediate copies, a file
+    descriptor, which gpg reads directly, or anything with a ``read()``
+    method, which is copied to the pipe a chunk at a time.
+
+    ``inputs`` are more memoryviews for gpg to read, each over a pipe of its
+    own. An integer ``n`` in ``command`` stands for the special file name
+    (``-&fd``) gpg reads ``inputs[n]`` from, so commands that use them need
+    ``--enable-special-filenames``. Pipes can't be handed down to child
+    processes like this on Windows.
+
+    Where the output of the command goes depends on ``output``:
+
+    * None -- the output is returned as ``bytes`` in ``result``.
+    * A file descriptor -- gpg writes straight in to it. ``result`` is the
+      number of bytes written if the descriptor is seekable, otherwise None.
+    * A writable memoryview -- the output is read directly in to it and
+      ``result`` is the number of bytes used. A BufferError is raised if
+      the output doesn't fit.
+    * Anything with a ``write()`` method -- the output is streamed in to it
+      through a small reusable buffer and ``result`` is the number of bytes
+      written.
+    '''
+    import subprocess
+    import threading
+    stdin = subprocess.PIPE
+    if isinstance(data, int):
+        stdin, data = data, None
+    stdout = subprocess.PIPE
+    start = None
+    if isinstance(output, int):
+        stdout = output
+        try:
+            start = os.lseek(output, 0, os.SEEK_CUR)
+        except OSError:
+            start = None
+    pipes = [os.pipe() for _ in inputs]
+    try:
+        proc = subprocess.Popen(
+            [arg if not isinstance(arg, int) else '-&{}'.format(pipes[arg][0])
+             for arg in command],
+            bufsize=0,
+            stdin=stdin,
+            stdout=stdout,
+            stderr=subprocess.PIPE,
+            pass_fds=[rfd for (rfd, _) in pipes])
+    except Exception:
+        for (_, wfd) in pipes:
+            os.close(wfd)
+        raise
+    finally:
+        for (rfd, _) in pipes:
+            os.close(rfd)
+    stderr = []
+    threads = [threading.Thread(target=lambda: stderr.append(proc.stderr.read()))]
+    if data is None:
+        if proc.stdin:
+            proc.stdin.close()
+    elif hasattr(data, 'read'):
+        threads.append(threading.Thread(target=_copy_all, args=(proc.stdin, data)))
+    else:
+        threads.append(threading.Thread(target=_write_all, args=(proc.stdin, data)))
+    for ((_, wfd), view) in zip(pipes, inputs):
+        threads.append(threading.Thread(
+            target=_write_all, args=(open(wfd, 'wb', buffering=0), view)))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    result = None
+    try:
+        if output is None:
+            result = proc.stdout.read()
+        elif isinstance(output, int):
+            pass
+        elif isinstance(output, memoryview):
+            result = 0
+            while result < len(output):
+                count = proc.stdout.readinto(output[result:])
+                if not count:
+                    break
+                result += count
+            if result == len(output) and proc.stdout.read(1):
+                proc.kill()
+                raise BufferError('output buffer too small for gpg output')
+        else:
+            result = 0
+            chunk = memoryview(bytearray(GPG_IO_CHUNK_SIZE))
+            while True:
+                count = proc.stdout.readinto(chunk)
+                if not count:
+                    break
+                output.write(chunk[:count])
+                result += count
+    finally:
+        for thread in threads:
+            thread.join()
+        if proc.stdout:
+            proc.stdout.close()
+        proc.wait()
+    if start is not None:
+        result = os.lseek(output, 0, os.SEEK_CUR) - start
+    return (proc.returncode, result, _parse_gpg_status(b''.join(stderr)))
+
+def _gpg_command(gpg_instance, args):
+    '''
+    Returns the full gpg command line to run ``args`` against the keyring
+    of the :py:class:`gnupg.GPG` instance ``gpg_instance``.
+    '''
+    command = [
+        gpg(),
+        '--no-options',
+        '--no-tty',
+        '--batch',
+        '--status-fd', '2',
+        '--homedir', gpg_instance.homedir,
+        '--no-default-keyring',
+        '--keyring', gpg_instance.keyring]
+    return command + _gpg_options() + list(args)
+
+def _verify_outcome(status):
+    '''
+    Turns the parsed gpg status output from a ``--verify`` run in to a
+    ``(valid, message)`` tuple. The messages match the ones produced by
+    :py:class:`gnupg._parsers.Verify`.
+
+    >>> _verify_outcome([('NEWSIG', ''), ('GOODSIG', 'ABC irc'), ('VALIDSIG', 'ABC')])
+    (True, 'signature valid')
+    >>> _verify_outcome([('NEWSIG', ''), ('BADSIG', 'ABC irc')])
+    (False, 'signature bad')
+    >>> _verify_outcome([('NEWSIG', ''), ('REVKEYSIG', 'ABC irc'), ('VALIDSIG', 'ABC')])
+    (False, 'key rev')
+    >>> _verify_outcome([])
+    (False, 'signature error')
+    '''
+    valid = False
+    message = None
+    for (keyword, _) in status:
+        if keyword == 'NEWSIG':
+            valid = False
+            message = None
+        elif keyword == 'VALIDSIG':
+            if message is None or message == 'signature good':
+                valid = True
+                message = 'signature valid'
+        elif keyword == 'GOODSIG':
+            message = 'signature good'
+        elif keyword in _VERIFY_FAILURES:
+            valid = False
+            message = _VERIFY_FAILURES[keyword]
+    if not valid and message in (None, 'signature good'):
+        message = 'signature error'
+    return (valid, message)
+
+# gpg status keywords that mean verification failed, mapped to the status
+# message we report for them.
+_VERIFY_FAILURES = {
+    'BADSIG': 'signature bad',
+    'ERRSIG': 'signature error',
+    'NO_PUBKEY': 'no public key',
+    'DECRYPTION_FAILED': 'decryption failed',
+    'NODATA': 'signature error',
+    'REVKEYSIG': 'key rev',
+}
+
+# gpg status keywords that say the key has been revoked. Outcomes that
+# carry one of these aren't cached and they drop everything cached for the
+# key. Expiry doesn't change gpg's verdict on a signature, so it doesn't
+# get in the way of caching.
+_VERIFY_UNCACHEABLE = ('REVKEYSIG', 'KEYREVOKED')
+
+def _verify_digest(data, signature=None):
+    '''
+    Returns the SHA-256 digest that identifies a verification of ``data``,
+    a bytes-like object or an open binary file, against the bytes-like
+    detached ``signature`` or, if there isn't one, against the signature
+    embedded in ``data``. The
+    parts are length-prefixed so no two different (data, signature) pairs
+    hash the same input.
+    '''
+    import hashlib
+    digest = hashlib.sha256()
+    if hasattr(data, 'read'):
+        chunks = iter(lambda: data.read(GPG_IO_CHUNK_SIZE), b'')
+    else:
+        chunks = (data,)
+    length = 0
+    for chunk in chunks:
+        digest.update(chunk)
+        length += len(chunk)
+    digest.update(b'\0data:%d' % length)
+    if signature is not None:
+        digest.update(b'\0detached:%d\0' % len(signature))
+        digest.update(signature)
+    return digest.digest()
+
+def _compression_sample(data):
+    '''
+    Returns a ``(sample, size)`` tuple for ``compress_algo='auto'``:
+    ``sample`` is up to ``COMPRESS_SAMPLE_SIZE`` bytes of ``data`` and
+    ``size`` is how big ``data`` is, or None if that can't be known. Large
+    in-memory payloads are sampled from their start, middle and end so a
+    compressible header doesn't hide an incompressible body. Files and
+    descriptors are sampled from their current position without moving
+    it. ``sample`` is None for things that can't be sampled, like pipes.
+    '''
+    if isinstance(data, str):
+        data = data[:COMPRESS_SAMPLE_SIZE].encode('utf-8')
+        return (data, None)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = _bytes_view(data)
+        if len(view) <= COMPRESS_SAMPLE_SIZE:
+            return (view, len(view))
+        part = COMPRESS_SAMPLE_SIZE // 3
+        middle = (len(view) - part) // 2
+        return (b''.join((view[:part], view[middle:middle + part], view[-part:])), len(view))
+    fileno = _fileno(data)
+    try:
+        if fileno is not None:
+            start = os.lseek(fileno, 0, os.SEEK_CUR)
+            size = os.fstat(fileno).st_size - start
+            if hasattr(os, 'pread'):
+                return (os.pread(fileno, COMPRESS_SAMPLE_SIZE, start), size)
+            sample = os.read(fileno, COMPRESS_SAMPLE_SIZE)
+            os.lseek(fileno, start, os.SEEK_SET)
+            return (sample, size)
+        if hasattr(data, 'read') and data.seekable():
+            start = data.tell()
+            sample = data.read(COMPRESS_SAMPLE_SIZE)
+            data.seek(start)
+            return (sample, None)
+    except (IOError, OSError):
+        pass
+    return (None, None)
+
 class Keybase(object):
     '''
     A read-only view of a keybase.io user and their publically available
@@ -258,7 +1621,30 @@ class Keybase(object):
     >>> kbase = Keybase('abcdefghijklmno123notauserhahaha')
     Traceback (most recent call last):
     ...
-    KeybaseUserNotFound: User abcdefghijklmno123notauserhahaha not found
+    keybase.keybase.KeybaseUserNotFound: User abcdefghijklmno123notauserhahaha not found
+
+    By default the complete user object is fetched. Most of it, the proofs,
+    pictures and so on, isn't needed to verify or encrypt, so ``fields`` can
+    name just the sections that should be fetched up front:
+
+    >>> kbase = Keybase('irc', fields=('profile', 'public_keys'))
+    >>> kbase.get_public_key().kid
+    '0101f56ecf27564e5bec1c50250d09efe963cad3138d4dc7f4646c77f6008c1e23cf0a'
+
+    The properties keep working when their section wasn't fetched: it's
+    fetched from keybase.io the first time it's needed. See
+    ``keybase.LOOKUP_FIELDS`` for the section names.
+
+    Keybase objects can be shared between threads. Reading data that has
+    already been fetched doesn't lock; fetching a missing section and
+    building a public key happen once, in whichever thread gets there
+    first, while the others wait for the result. The keys that are handed
+    out are thread-safe too, see :class:`keybase.KeybasePublicKey`.
+
+    Keybase objects can be pickled without going back to keybase.io: only
+    the username and the user object are carried, not the keys that have
+    been handed out, which are built again when they're asked for. See
+    :func:`keybase.dumps` for a more compact form.
 
     .. note::
 
@@ -266,11 +1652,39 @@ class Keybase(object):
         store in any way.
 
     '''
-    def __init__(self, username):
+    def __init__(self, username, fields=None):
+        import threading
         self._username = None
         self._user_object = None
+        self._fields = None
+        self.__lock = threading.RLock()
+        self.__keys = dict()
         self.__lookup_performed = False
-        self.__lookup(username)
+        self.__lookup(username, _lookup_fields(fields))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''
+        Closes every :mod:`keybase.KeybasePublicKey` this instance has
+        handed out, destroying their temporary gpg keyrings. Keybase
+        objects are context managers that do this on the way out::
+
+            with Keybase('irc') as kbase:
+                kbase.verify(message)
+
+        The instance itself stays usable: asking for a key again builds a
+        fresh one.
+        '''
+        with self.__lock:
+            keys = list(self.__keys.values())
+            self.__keys.clear()
+        for key in keys:
+            key.close()
 
     @property
     def name(self):
@@ -279,7 +1693,7 @@ class Keybase(object):
 
         >>> k = Keybase('irc')
         >>> k.name
-        u'Ian Chesal'
+        'Ian Chesal'
         '''
         return self._section_getter('profile', 'full_name')
 
@@ -291,7 +1705,7 @@ class Keybase(object):
 
         >>> k = Keybase('irc')
         >>> k.location
-        u'Bay Area, California'
+        'Bay Area, California'
         '''
         return self._section_getter('profile', 'location')
 
@@ -315,13 +1729,10 @@ class Keybase(object):
 
         >>> kbase = Keybase('irc')
         >>> kbase.public_keys
-        (u'families', u'primary', u'sibkeys', u'subkeys')
+        ('families', 'primary', 'sibkeys', 'subkeys')
         '''
-        pkeys = list()
-        if self._user_object:
-            if 'public_keys' in self._user_object:
-                pkeys = self._user_object['public_keys'].keys()
-        return tuple(sorted(pkeys))
+        pkeys = self._section('public_keys') or dict()
+        return tuple(sorted(pkeys.keys()))
 
     def _section_getter(self, section, key):
         '''
@@ -333,27 +1744,61 @@ class Keybase(object):
 
         >>> kbase = Keybase('irc')
         >>> kbase._section_getter('profile', 'full_name')
-        u'Ian Chesal'
+        'Ian Chesal'
 
         Otherwise it returns None if the section doesn't exist:
 
         >>> if not kbase._section_getter('invalidsectionname', 'full_name'):
-        ...    print 'Section not found!'
+        ...    print('Section not found!')
         Section not found!
 
         Or the key doesn't exist in the section:
 
         >>> if not kbase._section_getter('profile', 'invalidkeyname'):
-        ...    print 'Key not found!'
+        ...    print('Key not found!')
         Key not found!
 
         '''
-        if self._user_object:
-            if section in self._user_object:
-                if key in self._user_object[section]:
-                    return self._user_object[section][key]
+        values = self._section(section)
+        if values and key in values:
+            return values[key]
         return None
 
+    def _section(self, section):
+        '''
+        Returns a whole section of the user data object, or None if the
+        section doesn't exist. If this instance was built with ``fields``
+        and the section wasn't one of them it's fetched from keybase.io
+        first.
+        '''
+        if not self._user_object:
+            return None
+        if self._fields is not None and section not in self._fields:
+            with self.__lock:
+                if section not in self._fields:
+                    self.__fetch_sections((section,))
+        return self._user_object.get(section)
+
+    def __fetch_sections(self, sections):
+        '''
+        Fetches ``sections`` of this user's data object that weren't asked
+        for when the instance was built and merges them in to it. The
+        sections are added before ``_fields`` is updated so readers that
+        don't take the lock never see a section listed that isn't there.
+        '''
+        jresponse = _get_json_from_url(
+            _build_url('user/lookup.json'),
+            {'username': self._username, 'fields': ','.join(sections)},
+            method='get')
+        if jresponse['status']['name'] in ('NOT_FOUND', 'INPUT_ERROR'):
+            raise KeybaseUserNotFound('User {} not found'.format(self._username))
+        if not isinstance(jresponse.get('them'), dict):
+            raise KeybaseError('Malformed API response to user/lookup.json request')
+        for section in sections:
+            if section in jresponse['them']:
+                self._user_object[section] = jresponse['them'][section]
+        self._fields = tuple(sorted(set(self._fields).union(sections)))
+
     def get_public_key(self, keyname='primary'):
         '''
         Returns a key named keyname as a :mod:`keybase.KeybasePublicKey` object
@@ -364,18 +1809,29 @@ class Keybase(object):
         >>> kbase = Keybase('irc')
         >>> primary_key = kbase.get_public_key()
         >>> primary_key.kid
-        u'0101f56ecf27564e5bec1c50250d09efe963cad3138d4dc7f4646c77f6008c1e23cf0a'
+        '0101f56ecf27564e5bec1c50250d09efe963cad3138d4dc7f4646c77f6008c1e23cf0a'
 
         Otherwise it returns None if a key by the name of keyname doesn't
         exist for this user.
 
         >>> kbase.get_public_key('thiskeydoesnotexist')
 
+        The key is built once and handed out again on later calls, so the
+        convenience methods like :func:`keybase.Keybase.verify` don't pay
+        for a fresh keyring every time. It's closed by
+        :func:`keybase.Keybase.close`.
         '''
-        key = None
-        if keyname in self.public_keys:
-            key_data = self._user_object['public_keys'][keyname]
-            key = KeybasePublicKey(**key_data)
+        key = self.__keys.get(keyname)
+        if key is not None and not key.closed:
+            return key
+        if keyname not in self.public_keys:
+            return None
+        with self.__lock:
+            key = self.__keys.get(keyname)
+            if key is None or key.closed:
+                key_data = self._section('public_keys')[keyname]
+                key = KeybasePublicKey(**key_data)
+                self.__keys[keyname] = key
         return key
 
     def verify(self, data, throw_error=False):
@@ -417,6 +1873,26 @@ class Keybase(object):
             sigfname=sigfname,
             throw_error=throw_error)
 
+    def verify_detached(self, data, signature, throw_error=False):
+        '''
+        Equivalent to::
+
+            kbase = Keybase('irc')
+            pkey = kbase.get_public_key()
+            verified = pkey.verify_detached(data, signature)
+            assert verified
+
+        It's a convenience method on the Keybase object to do in-memory
+        detached signature verification with the primary key.
+
+        For more information see :mod:`keybase.KeybasePublicKey.verify_detached`.
+        '''
+        pkey = self.get_public_key()
+        return pkey.verify_detached(
+            data,
+            signature,
+            throw_error=throw_error)
+
     def encrypt(self, data, **kwargs):
         '''
         Equivalent to::
@@ -436,7 +1912,45 @@ class Keybase(object):
             data=data,
             **kwargs)
 
-    def __lookup(self, username):
+    def verify_bytes(self, data, throw_error=False):
+        '''
+        Equivalent to::
+
+            kbase = Keybase('irc')
+            pkey = kbase.get_public_key()
+            verified = pkey.verify_bytes(data)
+            assert verified
+
+        It's a convenience method on the Keybase object to do data
+        verification with the primary key.
+
+        For more information see :mod:`keybase.KeybasePublicKey.verify_bytes`.
+        '''
+        pkey = self.get_public_key()
+        return pkey.verify_bytes(
+            data,
+            throw_error=throw_error)
+
+    def encrypt_bytes(self, data, output=None, **kwargs):
+        '''
+        Equivalent to::
+
+            kbase = Keybase('irc')
+            pkey = kbase.get_public_key()
+            encrypted = pkey.encrypt_bytes(data, output, **kwargs)
+
+        It's a convenience method on the Keybase object to do binary
+        encryption with the primary key.
+
+        For more information see :mod:`keybase.KeybasePublicKey.encrypt_bytes`.
+        '''
+        pkey = self.get_public_key()
+        return pkey.encrypt_bytes(
+            data,
+            output=output,
+            **kwargs)
+
+    def __lookup(self, username, fields=None):
         '''
         Looks up a user in the keybase.io public directory and initializes
         this Keybase class instance with the user's public keybase.io
@@ -447,22 +1961,104 @@ class Keybase(object):
 
         If the object is already bound to a Keybase user a
         :mod:`keybase.KeybaseLookupInvalidError` exception is raised.
+
+        Only the ``fields`` sections of the user object are requested if
+        ``fields`` is given. A complete user object found in the user cache
+        is used as is and a user the negative cache knows doesn't exist
+        isn't looked up at all. While :data:`keybase.api_breaker` is open
+        the user cache's last copy of the user is used, however old it is.
         '''
         # If this object is already initialized then the user shouldn't
         # be calling this method a second time.
         if self.__lookup_performed:
             raise KeybaseLookupInvalidError(
                 'Keybase object already bound to username \'{}\''.format(self._username))
-        jresponse = _get_json_from_url(_build_url('user/lookup.json'), {'username': username}, method='get')
-        if jresponse['status']['name'] in ('NOT_FOUND', 'INPUT_ERROR'):
+        user_object = _USER_CACHE.get(username) if _USER_CACHE is not None else None
+        if user_object is None and _known_missing('username', username):
             raise KeybaseUserNotFound('User {} not found'.format(username))
-        if not 'them' in jresponse:
-            raise KeybaseError('Malformed API response to user/lookup.json request')
-        # Initialize this user from the 'them' part of the reponse.
-        self._user_object = jresponse['them']
+        if user_object is None:
+            params = {'username': username}
+            if fields is not None:
+                params['fields'] = ','.join(fields)
+            try:
+                jresponse = _get_json_from_url(_build_url('user/lookup.json'), params, method='get')
+            except KeybaseUnavailableError:
+                # The API is down: make do with the last copy in the cache.
+                (_, user_object) = _stale_users((username,))[0]
+            else:
+                if jresponse['status']['name'] in ('NOT_FOUND', 'INPUT_ERROR'):
+                    _add_missing('username', (username,))
+                    raise KeybaseUserNotFound('User {} not found'.format(username))
+                if not 'them' in jresponse:
+                    raise KeybaseError('Malformed API response to user/lookup.json request')
+                # Initialize this user from the 'them' part of the reponse.
+                user_object = jresponse['them']
+                if fields is None:
+                    if _USER_CACHE is not None:
+                        _USER_CACHE.put(username, user_object)
+                else:
+                    self._fields = fields
+        self._user_object = user_object
+        self._username = username
+        self.__lookup_performed = True
+
+    @classmethod
+    def _from_user_object(cls, username, user_object, fields=None):
+        '''
+        Builds a Keybase instance for ``username`` from a user object that
+        has already been fetched, without going back to the network. This
+        is how :func:`keybase.lookup` turns a batch response in to
+        instances. ``fields`` lists the sections the user object was
+        fetched with, None if it's complete.
+        '''
+        kbase = cls.__new__(cls)
+        kbase.__bind(username, user_object, fields)
+        return kbase
+
+    def __bind(self, username, user_object, fields):
+        import threading
         self._username = username
+        self._user_object = user_object
+        self._fields = fields
+        self.__lock = threading.RLock()
+        self.__keys = dict()
         self.__lookup_performed = True
 
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__bind(state['username'], state['them'],
+                    None if state['fields'] is None else tuple(state['fields']))
+
+    def to_dict(self):
+        '''
+        Returns this user as a dictionary that can be serialized with
+        :func:`keybase.dumps` or passed to :func:`keybase.Keybase.from_dict`:
+        the username, the user object (``them``) and the sections it was
+        fetched with (``fields``, None if it's complete).
+
+        >>> kbase = Keybase('irc')
+        >>> sorted(kbase.to_dict())
+        ['fields', 'them', 'username']
+        '''
+        with self.__lock:
+            return {
+                'username': self._username,
+                'them': dict(self._user_object),
+                'fields': None if self._fields is None else list(self._fields),
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        '''
+        Builds a Keybase instance from a dictionary returned by
+        :func:`keybase.Keybase.to_dict` without going back to keybase.io.
+        '''
+        return cls._from_user_object(
+            data['username'], data['them'],
+            None if data['fields'] is None else tuple(data['fields']))
+
 class KeybasePublicKey(object):
     '''
     A class that represents the public key side of a public/private key pair.
@@ -482,30 +2078,178 @@ class KeybasePublicKey(object):
     >>> kbase = Keybase('irc')
     >>> pkey = kbase.get_public_key()
     >>> pkey.key_fingerprint
-    u'7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+    '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
 
     If a valid GPG instance cannot be created when you initialize a KeybasePublicKey
     a KeybasePublicKeyError will be raised.
+
+    KeybasePublicKey objects are safe to share between threads. The key
+    data never changes after the object is built so the properties are
+    read without locking. Verification and binary encryption run a gpg
+    process per call and any number of them can run against the same key
+    at once; :func:`keybase.KeybasePublicKey.encrypt` goes through the
+    shared :py:class:`gnupg.GPG` instance, which isn't thread-safe, so
+    those calls are serialized per key. Only the keyring itself is
+    guarded by a lock: it's built, rebuilt and removed by one thread at a
+    time, and it's never removed while an operation is using it. Closing a
+    key that's in use makes later calls fail straight away and removes the
+    keyring when the last running call finishes.
+
+    KeybasePublicKey objects can be pickled, to hand them to worker
+    processes for example. Only the key record travels: the keyring isn't
+    copied, it's built in the receiving process the first time the key is
+    used there. See :func:`keybase.dumps` for a more compact form.
     '''
     def __init__(self, **kwargs):
+        self.__setup(kwargs)
+        with self.__lock:
+            self.__open_keyring()
+        keyring_janitor.register(self)
+        if not self.__gpg:
+            raise KeybasePublicKeyError('Unable to create Keybase public key instance')
+
+    def __setup(self, record):
+        '''
+        Sets up everything but the keyring from the keybase.io public key
+        record ``record``.
+        '''
+        import datetime
+        import threading
+        self.__record = dict(record)
         self.__data = dict()
-        for key, value in kwargs.iteritems():
+        for key, value in record.items():
             if key == 'mtime' or key == 'ctime':
                 self.__data[key] = datetime.datetime.fromtimestamp(int(value))
             else:
                 self.__data[key] = value
-        self.__cipher_algos = KeybasePublicKey.__get_gpg_config('ciphername')
-        self.__digest_algos = KeybasePublicKey.__get_gpg_config('digestname')
         self.__compress_algos = ['ZLIB', 'BZIP2', 'ZIP', 'Uncompressed']
         self.__gpg = None
-        self.__tempdir = tempfile.mkdtemp(suffix='.keybase')
-        if self.bundle:
-            self.__gpg = gnupg.GPG(
+        self.__tempdir = None
+        self.__homedir_lock = None
+        self.__closed = False
+        self.__key_ids = None
+        self.__key_family = None
+        self.__busy = 0
+        self.__lock = threading.RLock()
+        self.__gnupg_lock = threading.Lock()
+        if not self.bundle:
+            raise KeybasePublicKeyError('Missing PGP key bundle in init data')
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__setup(state)
+
+    def to_dict(self):
+        '''
+        Returns the keybase.io public key record this key was built from,
+        as a dictionary that can be serialized with :func:`keybase.dumps`
+        or passed to :func:`keybase.KeybasePublicKey.from_dict`.
+        '''
+        return dict(self.__record)
+
+    @classmethod
+    def from_dict(cls, record):
+        '''
+        Builds a key from a record returned by
+        :func:`keybase.KeybasePublicKey.to_dict`. Unlike the constructor
+        this doesn't run gpg: the keyring is built the first time the key
+        is used.
+        '''
+        pkey = cls.__new__(cls)
+        pkey.__setup(record)
+        return pkey
+
+    def __del__(self):
+        # This makes sure the keyring we created is destroyed when the object
+        # gets garbage collected. Don't rely on it though: call close(), or
+        # use the object as a context manager, to get rid of the keyring at a
+        # predictable point.
+        if getattr(self, '_KeybasePublicKey__closed', True) is False:
+            try:
+                self.close()
+            except ImportError:
+                # The interpreter is shutting down and can't import shutil
+                # any more. The janitor in the next process will sweep the
+                # keyring up.
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''
+        Destroys the temporary gpg keyring that belongs to this key. The key
+        can't be used for verification or encryption afterwards; trying to
+        raises a KeybasePublicKeyError. Calling close() more than once is
+        harmless.
+
+        KeybasePublicKey objects are also context managers that close
+        themselves on the way out::
+
+            with KeybasePublicKey(**key_data) as pkey:
+                pkey.verify(message)
+
+        If other threads are using the key when it's closed the keyring is
+        removed as soon as the last of them is done with it.
+        '''
+        with self.__lock:
+            self.__closed = True
+        keyring_janitor.unregister(self)
+        self._release_keyring()
+
+    @property
+    def closed(self):
+        '''
+        True once :func:`keybase.KeybasePublicKey.close` has been called.
+        '''
+        return self.__closed
+
+    @property
+    def busy(self):
+        '''
+        True while a gpg operation is using this key's keyring.
+        '''
+        return self.__busy > 0
+
+    @property
+    def homedir(self):
+        '''
+        The path to the temporary gpg home directory holding this key's
+        keyring, or None if there isn't one at the moment. The
+        :class:`keybase.KeybaseKeyringJanitor` may remove an idle keyring
+        to stay under its limit; it's rebuilt the next time it's needed.
+        '''
+        return self.__tempdir
+
+    def __open_keyring(self):
+        '''
+        Creates a temporary gpg home directory and imports the key bundle
+        in to it, making sure the fingerprint of what was imported matches
+        the fingerprint Keybase gave us for the key. The caller must hold
+        the keyring lock and register the key with the janitor once it has
+        let go of it.
+        '''
+        import gnupg
+        import shutil
+        import tempfile
+        keyring_janitor.startup_sweep()
+        tempdir = tempfile.mkdtemp(
+            prefix=KEYRING_PREFIX.format(os.getpid()),
+            suffix=KEYRING_SUFFIX)
+        homedir_lock = None
+        try:
+            homedir_lock = _lock_homedir(tempdir, create=True)
+            gpg_instance = gnupg.GPG(
                 binary=gpg(),
-                homedir=self.__tempdir,
+                homedir=tempdir,
                 verbose=False,
                 use_agent=False)
-            import_result = self.__gpg.import_keys(self.bundle)
+            import_result = gpg_instance.import_keys(self.bundle)
             # TODO: For some reason importing a single key results in two result
             # entries in the ImportResult.result and ImportResult.fingerprints
             # arrays. I've asked the gnupg devs why this is and I'm waiting to
@@ -516,15 +2260,74 @@ class KeybasePublicKey(object):
             for fprint in import_result.fingerprints:
                 if fprint.lower() != self.key_fingerprint:
                     raise KeybasePublicKeyError('A serious security error has occured: fingerprint mismatch on key import')
+        except:
+            shutil.rmtree(tempdir, ignore_errors=True)
+            _unlock_homedir(homedir_lock)
+            raise
+        self.__gpg = gpg_instance
+        self.__tempdir = tempdir
+        self.__homedir_lock = homedir_lock
+
+    def __acquire_keyring(self):
+        '''
+        Returns the :py:class:`gnupg.GPG` instance for this key's keyring,
+        rebuilding the keyring first if the janitor reclaimed it, and marks
+        the keyring as in use until :func:`__release_keyring` is called.
+        Raises a KeybasePublicKeyError if the key has been closed.
+        '''
+        with self.__lock:
+            if self.__closed:
+                raise KeybasePublicKeyError('KeybasePublicKey has been closed')
+            rebuilt = self.__tempdir is None
+            if rebuilt:
+                self.__open_keyring()
+            self.__busy += 1
+            gpg_instance = self.__gpg
+        # The janitor may release other keys' keyrings from here, which
+        # takes their locks, so it's only called once ours is let go.
+        if rebuilt:
+            keyring_janitor.register(self)
         else:
-            raise KeybasePublicKeyError('Missing PGP key bundle in init data')
-        if not self.__gpg:
-            raise KeybasePublicKeyError('Unable to create Keybase public key instance')
+            keyring_janitor.touch(self)
+        return gpg_instance
 
-    def __del__(self):
-        # This makes sure the keyring we created is destroyed when the object
-        # gets garbage collected.
-        shutil.rmtree(self.__tempdir, ignore_errors=True)
+    def __release_keyring(self):
+        '''
+        Marks the end of an operation started with
+        :func:`__acquire_keyring`. The last operation to finish on a closed
+        key removes its keyring.
+        '''
+        with self.__lock:
+            self.__busy -= 1
+            idle = self.__busy == 0
+            release = self.__closed and idle
+        if release:
+            self._release_keyring()
+        elif idle:
+            keyring_janitor.idle(self)
+
+    def _release_keyring(self):
+        '''
+        Removes the temporary gpg home directory, if there is one. Unlike
+        close() this leaves the key usable: the keyring is rebuilt on
+        demand. It's how the :class:`keybase.KeybaseKeyringJanitor` keeps
+        the number of live keyrings down.
+
+        Returns False, and leaves the keyring alone, if an operation is
+        using it at the moment.
+        '''
+        with self.__lock:
+            if self.__busy:
+                return False
+            tempdir = self.__tempdir
+            homedir_lock = self.__homedir_lock
+            self.__tempdir = None
+            self.__homedir_lock = None
+        if tempdir is not None:
+            import shutil
+            shutil.rmtree(tempdir, ignore_errors=True)
+            _unlock_homedir(homedir_lock)
+        return True
 
     @property
     def kid(self):
@@ -583,6 +2386,164 @@ class KeybasePublicKey(object):
         '''
         return self.__property_getter('key_fingerprint').lower()
 
+    @property
+    def key_ids(self):
+        '''
+        The 16 character key IDs of the primary key and subkeys in the
+        bundle, primary key first, as gpg would show them.
+
+        >>> kbase = Keybase('irc')
+        >>> pkey = kbase.get_public_key()
+        >>> pkey.key_ids
+        ('F56B7A6F0A32A0B9', 'EEF332670C1CC080')
+
+        An empty tuple is returned if the bundle can't be parsed.
+        '''
+        if self.__key_ids is None:
+            from keybase import openpgp
+            try:
+                self.__key_ids = openpgp.key_ids(self.bundle)
+            except openpgp.OpenPGPError:
+                self.__key_ids = tuple()
+        return self.__key_ids
+
+    @property
+    def key_family(self):
+        '''
+        The primary key and subkeys in the bundle as a tuple of
+        :class:`keybase.openpgp.OpenPGPKey` objects, primary key first. Each
+        one knows whether it can encrypt or sign, when it expires and if it
+        has been revoked, all read from the bundle without running gpg.
+
+        >>> kbase = Keybase('irc')
+        >>> pkey = kbase.get_public_key()
+        >>> [(key.key_id, key.can_encrypt) for key in pkey.key_family]
+        [('F56B7A6F0A32A0B9', True), ('EEF332670C1CC080', True)]
+
+        An empty tuple is returned if the bundle can't be parsed.
+        '''
+        if self.__key_family is None:
+            from keybase import openpgp
+            try:
+                self.__key_family = openpgp.key_family(self.bundle)
+            except openpgp.OpenPGPError:
+                self.__key_family = tuple()
+        return self.__key_family
+
+    def encryption_key(self, now=None):
+        '''
+        Returns the :class:`keybase.openpgp.OpenPGPKey` from
+        :attr:`key_family` that data is encrypted to: the newest subkey that
+        can encrypt and hasn't expired or been revoked at ``now``, a Unix
+        time that defaults to the current time, or the primary key if no
+        subkey will do. Returns None if there's no such key.
+
+        :func:`keybase.KeybasePublicKey.encrypt` and
+        :func:`keybase.KeybasePublicKey.encrypt_bytes` hand this key to gpg
+        by its fingerprint, so gpg doesn't have to list the keyring to find
+        it.
+        '''
+        from keybase import openpgp
+        return openpgp.encryption_key(self.key_family, now)
+
+    @property
+    def signing_key_ids(self):
+        '''
+        The subset of :attr:`key_ids` that signatures can come from: the
+        primary key and the subkeys that are allowed to sign. Signatures by
+        any other key are turned away before gpg runs.
+        '''
+        from keybase import openpgp
+        if not self.key_family:
+            return self.key_ids
+        signers = openpgp.signing_key_ids(self.key_family)
+        return tuple(keyid for keyid in self.key_ids if keyid in signers)
+
+    @property
+    def revoked(self):
+        '''
+        True if the primary key in the bundle has been revoked. A revoked
+        key can't be encrypted to and no signature by it verifies, so
+        :func:`keybase.KeybasePublicKey.verify` and
+        :func:`keybase.KeybasePublicKey.encrypt` turn it away without
+        running gpg.
+        '''
+        family = self.key_family
+        return bool(family) and family[0].revoked
+
+    @property
+    def expires(self):
+        '''
+        The datetime this key expires, or None if it doesn't. It's the
+        earlier of the primary key's expiry in the bundle and the
+        expiration time keybase.io has on record for the key (``etime``),
+        if there is one.
+
+        >>> kbase = Keybase('irc')
+        >>> pkey = kbase.get_public_key()
+        >>> pkey.expires is None
+        True
+        '''
+        expiry = self.__expiry()
+        if expiry is None:
+            return None
+        import datetime
+        return datetime.datetime.fromtimestamp(expiry)
+
+    def expired(self, now=None):
+        '''
+        True if the key has expired at ``now``, a Unix time that defaults to
+        the current time. Signatures it made before then still verify.
+        '''
+        expiry = self.__expiry()
+        if expiry is None:
+            return False
+        if now is None:
+            import time
+            now = time.time()
+        return now >= expiry
+
+    def __expiry(self):
+        '''
+        Returns the Unix time :attr:`expires` stands for, or None.
+        '''
+        limits = list()
+        if self.key_family and self.key_family[0].expires is not None:
+            limits.append(self.key_family[0].expires)
+        if self.__property_getter('etime'):
+            limits.append(int(self.__property_getter('etime')))
+        return min(limits) if limits else None
+
+    def usable(self, now=None):
+        '''
+        True if data can be encrypted to this key at ``now``, a Unix time
+        that defaults to the current time: the key hasn't expired or been
+        revoked and it has a key for encryption that hasn't either. It's
+        worked out from the bundle, without running gpg. Use
+        :func:`keybase.usable_keys` to filter a list of keys.
+        '''
+        return self.__encrypt_precheck(now) is None
+
+    def __encrypt_precheck(self, now=None):
+        '''
+        Returns None if this key can be encrypted to at ``now`` or the
+        status message encryption fails with if it can't: ``key rev`` for
+        a revoked key and ``key exp`` for an expired one. If the bundle
+        can't be parsed, or none of its keys can encrypt at all, gpg gets
+        the final say.
+        '''
+        if self.revoked:
+            return 'key rev'
+        if self.expired(now):
+            return 'key exp'
+        if self.key_family and self.encryption_key(now) is None:
+            capable = [key for key in self.key_family if key.can_encrypt]
+            if capable and all(key.revoked for key in capable):
+                return 'key rev'
+            if capable:
+                return 'key exp'
+        return None
+
     @property
     def cipher_algos(self):
         '''
@@ -596,7 +2557,7 @@ class KeybasePublicKey(object):
         >>> 'AES256' in pkey.cipher_algos
         True
         '''
-        return tuple(self.__cipher_algos)
+        return tuple(KeybasePublicKey.__get_gpg_config('ciphername'))
 
     @property
     def digest_algos(self):
@@ -611,7 +2572,7 @@ class KeybasePublicKey(object):
         >>> 'SHA512' in pkey.digest_algos
         True
         '''
-        return tuple(self.__digest_algos)
+        return tuple(KeybasePublicKey.__get_gpg_config('digestname'))
 
     @property
     def compress_algos(self):
@@ -635,15 +2596,23 @@ class KeybasePublicKey(object):
         installed GPG version. If the ``config`` property is a string it
         will be the only element in the list, otherwise it will be a list
         of values the property can support.
+
+        The answer only depends on the gpg binary so it's cached for the
+        life of the process. It's only asked for when the algorithms are
+        first needed, so building keys, e.g. with
+        :func:`keybase.KeybasePublicKey.from_dict`, never runs gpg.
         '''
-        values = list()
-        command = [gpg(), '--with-colons', '--list-config', config]
-        output = subprocess.check_output(command)
-        output = output.strip()
-        (cfg, configname, clist) = output.strip().split(':', 2)
-        if cfg == 'cfg' and configname == config and clist:
-            values = clist.split(';')
-        return values
+        binary = gpg()
+        if (binary, config) not in _GPG_CONFIG_CACHE:
+            import subprocess
+            values = list()
+            command = [binary, '--with-colons', '--list-config', config]
+            output = subprocess.check_output(command).decode('utf-8')
+            (cfg, configname, clist) = output.strip().split(':', 2)
+            if cfg == 'cfg' and configname == config and clist:
+                values = clist.split(';')
+            _GPG_CONFIG_CACHE[(binary, config)] = tuple(values)
+        return list(_GPG_CONFIG_CACHE[(binary, config)])
 
     def __property_getter(self, prop):
         '''
@@ -665,6 +2634,9 @@ class KeybasePublicKey(object):
         with a status message that tells you more about why verification
         failed.
 
+        Text strings are encoded as UTF-8 before they're handed to gpg.
+        ``bytes`` are passed through untouched.
+
         Failure status messages are:
 
         * invalid gpg key
@@ -676,7 +2648,9 @@ class KeybasePublicKey(object):
         * key rev
 
         For more information what these messages mean please see the
-        :py:class:`gnupg._parsers.Verify` manual page.
+        :py:class:`gnupg._parsers.Verify` manual page. Signatures by a
+        revoked key, and ones dated after the key that made them expired,
+        fail with ``key rev`` and ``key exp`` without running gpg.
 
         >>> message_good = """
         ... -----BEGIN PGP SIGNED MESSAGE-----
@@ -721,18 +2695,15 @@ class KeybasePublicKey(object):
         >>> pkey.verify(message_bad, throw_error=True)
         Traceback (most recent call last):
         ...
-        KeybasePublicKeyVerifyError: signature bad
+        keybase.keybase.KeybasePublicKeyVerifyError: signature bad
 
         If you want to verify the signature on a file (either embedded
         or detached) please see :func:`keybase.KeybasePublicKey.verify_file`
         method.
         '''
-        vobj = self.__gpg.verify(data)
-        if vobj.valid:
-            return True
-        if throw_error:
-            raise KeybasePublicKeyVerifyError('{}'.format(vobj.status))
-        return False
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.encode('utf-8')
+        return self.verify_bytes(data, throw_error=throw_error)
 
     def verify_file(self, fname, sigfname=None, throw_error=False):
         '''
@@ -785,14 +2756,80 @@ class KeybasePublicKey(object):
             verified = pkey.verify_file(fname, signame)
             assert verified
         '''
-        vobj = None
-        with open(fname, 'r') as fobj:
-            vobj = self.__gpg.verify_file(fobj, sigfname)
-        if vobj.valid:
-            return True
-        if throw_error:
-            raise KeybasePublicKeyVerifyError('{}'.format(vobj.status))
-        return False
+        with open(fname, 'rb') as fobj:
+            if _VERIFY_CACHE is not None and os.fstat(fobj.fileno()).st_size <= VERIFY_CACHE_MAX_FILE_SIZE:
+                # Check the very bytes that are hashed for the cache; the
+                # files could change between reading them and running gpg.
+                data = fobj.read()
+                if not sigfname:
+                    return self.verify_bytes(data, throw_error)
+                with open(sigfname, 'rb') as sigfobj:
+                    signature = sigfobj.read()
+                return self.verify_detached(data, signature, throw_error)
+            args = ['--verify']
+            if sigfname:
+                args.extend(['--', sigfname, '-'])
+            return self.__verify(
+                lambda: self.__run_gpg(args, data=fobj.fileno())[2],
+                None,
+                throw_error,
+                lambda: self.__precheck_file(fobj, sigfname))
+
+    def verify_detached(self, data, signature, throw_error=False):
+        '''
+        Verify the detached ``signature`` on ``data`` without either of
+        them having to be on disk. ``data`` may be a ``bytes``,
+        ``bytearray`` or ``memoryview`` object or an open binary file
+        object, which is read from its current position. ``signature`` may
+        be any of those too, or a text string holding an ASCII armored
+        signature.
+
+        Both are streamed to gpg over pipes: the data over its stdin and the
+        signature over a pipe gpg inherits, so nothing is written to a
+        temporary file. Windows can't hand pipes down like that and writes
+        the signature, but never the data, to a temporary file instead.
+
+        Returns True if the signature is verifiable with the key, False if
+        it is not. Supplying ``throw_error=True`` raises a
+        KeybasePublicKeyVerifyError on failure instead. The failure status
+        messages are the same as the ones described in
+        :func:`keybase.KeybasePublicKey.verify`.
+
+        An example::
+
+            kbase = Keybase('irc')
+            pkey = kbase.get_public_key()
+            verified = pkey.verify_detached(request.body, request.headers['X-Signature'])
+            assert verified
+        '''
+        if hasattr(signature, 'read'):
+            signature = signature.read()
+        if not isinstance(signature, (bytes, bytearray, memoryview)):
+            signature = signature.encode('utf-8')
+        signature = _bytes_view(signature)
+        source = _fileno(data)
+        digest = None
+        if source is not None:
+            start = data.tell()
+            if _VERIFY_CACHE is not None:
+                digest = _verify_digest(data, signature=signature)
+                data.seek(start)
+            os.lseek(source, start, os.SEEK_SET)
+        elif hasattr(data, 'read'):
+            source = data
+            if _VERIFY_CACHE is not None and data.seekable():
+                start = data.tell()
+                digest = _verify_digest(data, signature=signature)
+                data.seek(start)
+        else:
+            source = _bytes_view(data)
+            if _VERIFY_CACHE is not None:
+                digest = _verify_digest(source, signature=signature)
+        return self.__verify(
+            lambda: self.__verify_detached_status(source, signature),
+            digest,
+            throw_error,
+            lambda: self.__precheck(signature))
 
     def encrypt(
             self,
@@ -809,11 +2846,17 @@ class KeybasePublicKey(object):
         will be a
         `gnupg._parsers.Crypt object <https://python-gnupg.readthedocs.org/en/latest/gnupg.html#gnupg._parsers.Crypt>`_.
 
-        If encryption fails a KeybasePublicKeyEncryptError is raised.
+        If encryption fails a KeybasePublicKeyEncryptError is raised. A key
+        that has been revoked or has expired fails with ``key rev`` or
+        ``key exp`` straight away, without running gpg.
 
         If it succeeds data object is returned. Assuming ``armor=True`` the
         returned data is just plain old ASCII text as a ``str()``.
 
+        If you want raw binary output as ``bytes``, or want the ciphertext
+        written straight in to a buffer or file, see
+        :func:`keybase.KeybasePublicKey.encrypt_bytes`.
+
         .. note::
 
             The remaining options are supplied for maximum flexibility with GPG
@@ -834,7 +2877,10 @@ class KeybasePublicKey(object):
         If ``compress_algo`` is supplied it should be the name of a compression
         algorithm to use. The default is ``ZIP`` and you can get a list of
         available algorithms from the
-        :func:`keybase.KeybasePublicKey.compress_algos` parameter.
+        :func:`keybase.KeybasePublicKey.compress_algos` parameter. Pass
+        ``'auto'`` to have :data:`keybase.compression_chooser` pick one
+        based on a sample of ``data``: payloads that are already compressed
+        or encrypted aren't compressed again.
 
         For more information on how encryption works please see the
         :py:class:`gnupg.encrypt` manual page.
@@ -849,39 +2895,1679 @@ class KeybasePublicKey(object):
             assert not encrypted.isspace()
             assert encrypted != instring
         '''
+        failure = self.__encrypt_precheck()
+        if failure is not None:
+            raise KeybasePublicKeyEncryptError(failure)
         # For a list of things we can put in kwargs see:
         # https://python-gnupg.readthedocs.org/en/latest/gnupg.html#gnupg.GPG.encrypt
-        kwargs = dict()
+        kwargs = self.__encrypt_options(cipher_algo, digest_algo, compress_algo, data)
+        kwargs['armor'] = armor
+        kwargs['encrypt'] = True
+        kwargs['symmetric'] = False
+        kwargs['always_trust'] = True
+        gpg_instance = self.__acquire_keyring()
+        try:
+            with self.__gnupg_lock:
+                encrypted = gpg_instance.encrypt(
+                    data,
+                    self.__recipient(exact=False),
+                    **kwargs)
+        finally:
+            self.__release_keyring()
+        if not encrypted:
+            raise KeybasePublicKeyEncryptError('unable to encrypt data')
+        if armor:
+            encrypted = str(encrypted)
+        return encrypted
+
+    def encrypt_bytes(
+            self,
+            data,
+            output=None,
+            cipher_algo=None,
+            digest_algo=None,
+            compress_algo=None):
+        '''
+        Encrypt ``data`` for the owner of this KeybasePublicKey instance and
+        produce raw, binary (non-armored) OpenPGP output. This is the method
+        to use when the ciphertext is headed for storage rather than an
+        email body: it skips the 33% size overhead of ASCII armor and never
+        converts the data to or from text.
+
+        ``data`` can be a ``bytes``, ``bytearray`` or ``memoryview`` object,
+        which is handed to gpg without being copied, or an open file object
+        (or raw file descriptor) which gpg reads from directly.
+
+        If ``output`` is None the ciphertext is returned as ``bytes``.
+        Otherwise the ciphertext is written in to ``output`` and the number
+        of bytes written is returned. ``output`` can be:
+
+        * A writable ``bytearray`` or ``memoryview``. The ciphertext is read
+          directly in to it. A KeybasePublicKeyEncryptError is raised if it
+          is too small.
+        * An open file object or raw file descriptor. gpg writes directly to
+          it. If the descriptor isn't seekable (a pipe or socket, say) the
+          number of bytes written can't be known and None is returned.
+        * Any other object with a ``write()`` method, like
+          :py:class:`io.BytesIO`.
+
+        The ``cipher_algo``, ``digest_algo`` and ``compress_algo`` options
+        work exactly like they do for :func:`keybase.KeybasePublicKey.encrypt`,
+        including ``compress_algo='auto'``. Files and descriptors are
+        sampled from their current position without moving it; pipes can't
+        be sampled and get ``ZIP``.
+
+        If encryption fails a KeybasePublicKeyEncryptError is raised. A key
+        that has been revoked or has expired fails with ``key rev`` or
+        ``key exp`` straight away, without running gpg.
+
+        A simple example::
+
+            kbase = Keybase('irc')
+            pkey = kbase.get_public_key()
+            encrypted = pkey.encrypt_bytes(b'Hello, world!')
+            with open('hello.gpg', 'wb') as fobj:
+                pkey.encrypt_bytes(b'Hello, world!', output=fobj)
+        '''
+        failure = self.__encrypt_precheck()
+        if failure is not None:
+            raise KeybasePublicKeyEncryptError(failure)
+        options = self.__encrypt_options(cipher_algo, digest_algo, compress_algo, data)
+        args = ['--encrypt', '--always-trust', '--recipient', self.__recipient(exact=True)]
+        args.extend(['--cipher-algo', options.get('cipher_algo', 'AES256')])
+        args.extend(['--compress-algo', options['compress_algo']])
+        if 'digest_algo' in options:
+            args.extend(['--digest-algo', options['digest_algo']])
+        source = _fileno(data)
+        if source is None:
+            source = _bytes_view(data)
+        target = output
+        if output is not None and not isinstance(output, (bytearray, memoryview)):
+            target = _fileno(output)
+            if target is None:
+                target = output
+        elif output is not None:
+            target = _bytes_view(output)
+            if target.readonly:
+                raise KeybasePublicKeyEncryptError('output buffer is read-only')
+        try:
+            (returncode, result, _) = self.__run_gpg(
+                args,
+                data=source,
+                output=target)
+        except BufferError:
+            raise KeybasePublicKeyEncryptError('output buffer too small for encrypted data')
+        if returncode != 0:
+            raise KeybasePublicKeyEncryptError('unable to encrypt data')
+        return result
+
+    def verify_bytes(self, data, throw_error=False):
+        '''
+        Verify the embedded or clear-text signature on ``data``, a ``bytes``,
+        ``bytearray`` or ``memoryview`` object, or an open binary file
+        object. The data is handed to gpg as-is; it is never decoded or
+        copied in to a text string, so it works for binary signed messages
+        as well as clear-signed text.
+
+        Returns True if the signature was verified with the key, False if
+        it was not. Supplying ``throw_error=True`` raises a
+        KeybasePublicKeyVerifyError on failure instead. The failure status
+        messages are the same as the ones described in
+        :func:`keybase.KeybasePublicKey.verify`.
+
+        An example::
+
+            kbase = Keybase('irc')
+            pkey = kbase.get_public_key()
+            with open('helloworld.txt.gpg', 'rb') as fobj:
+                verified = pkey.verify_bytes(fobj.read())
+            assert verified
+        '''
+        source = _fileno(data)
+        digest = None
+        precheck = None
+        if source is None:
+            source = _bytes_view(data)
+            if _VERIFY_CACHE is not None:
+                digest = _verify_digest(source)
+            precheck = lambda: self.__precheck(source)
+        return self.__verify(
+            lambda: self.__run_gpg(['--verify'], data=source)[2],
+            digest,
+            throw_error,
+            precheck)
+
+    def __verify(self, run, digest, throw_error, precheck=None):
+        '''
+        Works out the outcome of a verification, either from the
+        verification cache, if one is installed and ``digest`` is given,
+        or by calling ``run`` to run gpg and get its status output. If
+        ``precheck`` is given it's called first and gpg isn't run if it
+        returns a failure message. Nothing signed by a revoked key
+        verifies, so gpg isn't run and the cache isn't consulted for one.
+        '''
+        outcome = None
+        cache = _VERIFY_CACHE
+        if self.revoked:
+            outcome = (False, 'key rev')
+        elif cache is not None and digest is not None:
+            outcome = cache.get(self.key_fingerprint, self.mtime, digest)
+        if outcome is None and precheck is not None and PRECHECK_SIGNATURES:
+            message = precheck()
+            if message is not None:
+                outcome = (False, message)
+        if outcome is None:
+            status = run()
+            outcome = _verify_outcome(status)
+            if cache is not None:
+                if any(keyword in _VERIFY_UNCACHEABLE for (keyword, _) in status):
+                    cache.invalidate(self.key_fingerprint)
+                elif digest is not None:
+                    cache.put(self.key_fingerprint, self.mtime, digest, outcome)
+        (valid, message) = outcome
+        if valid:
+            return True
+        if throw_error:
+            raise KeybasePublicKeyVerifyError(message)
+        return False
+
+    def __verify_detached_status(self, source, signature):
+        '''
+        Runs gpg to verify the detached ``signature`` on ``source`` for
+        :func:`keybase.KeybasePublicKey.verify_detached` and returns its
+        status output.
+        '''
+        if os.name != 'nt':
+            args = ['--enable-special-filenames', '--verify', '--', 0, '-']
+            return self.__run_gpg(args, data=source, inputs=(signature,))[2]
+        import tempfile
+        (handle, sigfname) = tempfile.mkstemp(suffix='.sig')
+        try:
+            with os.fdopen(handle, 'wb') as fobj:
+                fobj.write(signature)
+            return self.__run_gpg(['--verify', sigfname, '-'], data=source)[2]
+        finally:
+            os.remove(sigfname)
+
+    def __precheck(self, data):
+        '''
+        Runs the structural checks in :mod:`keybase.openpgp` on the signed
+        ``data``. Returns None if it passes or the verification status
+        message gpg would have failed it with: ``signature error`` for
+        malformed input, ``no public key`` for a signature by someone
+        else's key, ``key rev`` for one by a revoked subkey and ``key exp``
+        for one made after the key that made it had expired.
+        '''
+        from keybase import openpgp
+        try:
+            openpgp.precheck_signature(data, self.signing_key_ids or None, self.key_family)
+        except openpgp.OpenPGPIssuerError:
+            return 'no public key'
+        except openpgp.OpenPGPRevokedError:
+            return 'key rev'
+        except openpgp.OpenPGPExpiredError:
+            return 'key exp'
+        except openpgp.OpenPGPError:
+            return 'signature error'
+        return None
+
+    def __recipient(self, exact):
+        '''
+        Returns the ``--recipient`` argument for gpg: the fingerprint of the
+        key :func:`keybase.KeybasePublicKey.encryption_key` picked, with a
+        ``!`` on the end if ``exact`` is True so gpg uses that exact key
+        rather than looking for one itself. If no key was picked the
+        primary key's fingerprint is used and gpg gets the final say.
+        '''
+        key = self.encryption_key()
+        if key is None:
+            return self.key_fingerprint.upper()
+        if exact:
+            return key.fingerprint + '!'
+        return key.fingerprint
+
+    def __precheck_file(self, fobj, sigfname):
+        '''
+        :func:`__precheck` for :func:`keybase.KeybasePublicKey.verify_file`:
+        checks the detached signature in ``sigfname`` or, if there isn't
+        one, the signed file open as ``fobj`` as long as it's no bigger
+        than ``PRECHECK_MAX_FILE_SIZE``.
+        '''
+        if sigfname:
+            with open(sigfname, 'rb') as sigfobj:
+                return self.__precheck(sigfobj.read())
+        if os.fstat(fobj.fileno()).st_size > PRECHECK_MAX_FILE_SIZE:
+            return None
+        try:
+            return self.__precheck(fobj.read())
+        finally:
+            fobj.seek(0)
+
+    def __encrypt_options(self, cipher_algo, digest_algo, compress_algo, data=None):
+        '''
+        Checks the requested algorithms against the ones gpg supports and
+        returns them as a dictionary of :py:meth:`gnupg.GPG.encrypt` options.
+        Raises a KeybasePublicKeyEncryptError for unsupported algorithms.
+        ``compress_algo='auto'`` is resolved by sampling ``data``.
+        '''
+        options = dict()
+        if compress_algo == 'auto':
+            (sample, size) = _compression_sample(data)
+            compress_algo = compression_chooser.choose(sample, self.__compress_algos, size)
         if cipher_algo:
-            if cipher_algo not in self.__cipher_algos:
+            if cipher_algo not in self.cipher_algos:
                 raise KeybasePublicKeyEncryptError(
                     'cipher algorithm {} unrecognized'.format(cipher_algo))
-            kwargs['cipher_algo'] = cipher_algo
+            options['cipher_algo'] = cipher_algo
         if digest_algo:
-            if digest_algo not in self.__digest_algos:
+            if digest_algo not in self.digest_algos:
                 raise KeybasePublicKeyEncryptError(
                     'digest algorithm {} unrecognized'.format(digest_algo))
-            kwargs['digest_algo'] = digest_algo
+            options['digest_algo'] = digest_algo
         if compress_algo:
             if compress_algo not in self.__compress_algos:
                 raise KeybasePublicKeyEncryptError(
                     'compression algorithm {} unrecognized'.format(compress_algo))
-            kwargs['compress_algo'] = compress_algo
+            options['compress_algo'] = compress_algo
         else:
-            kwargs['compress_algo'] = 'ZIP'
-        kwargs['armor'] = armor
-        kwargs['encrypt'] = True
-        kwargs['symmetric'] = False
-        kwargs['always_trust'] = True
-        encrypted = self.__gpg.encrypt(
-            data,
-            self.__gpg.list_keys()[0]['keyid'],
-            **kwargs)
-        if not encrypted:
+            options['compress_algo'] = 'ZIP'
+        return options
+
+    def __run_gpg(self, args, data=None, output=None, inputs=()):
+        '''
+        Runs gpg with ``args`` against the keyring that belongs to this
+        instance, holding on to the keyring while it runs. See
+        :func:`keybase._run_gpg` for ``data``, ``output``, ``inputs`` and
+        the return value. Raises a KeybasePublicKeyError if the key has
+        been closed.
+        '''
+        gpg_instance = self.__acquire_keyring()
+        try:
+            return _run_gpg(
+                _gpg_command(gpg_instance, args),
+                data=data, output=output, inputs=inputs)
+        finally:
+            self.__release_keyring()
+
+class KeybaseKeyring(object):
+    '''
+    One gpg keyring holding the public keys of many Keybase users, built
+    with a single ``gpg --import``. Giving every user their own
+    :class:`keybase.KeybasePublicKey` costs a home directory and a gpg run
+    per user, which takes minutes for thousands of users; a keyring takes
+    seconds.
+
+    ``keys`` is an iterable of :class:`keybase.Keybase` users, whose
+    primary keys are used, :class:`keybase.KeybasePublicKey` objects and
+    raw armored key bundles, or a dictionary mapping labels of your own to
+    any of those. Users are labelled by username, keys by fingerprint and
+    bundles by their position in ``keys`` unless a dictionary says
+    otherwise::
+
+        users = keybase.lookup(usernames)
+        with keybase.KeybaseKeyring(user for user in users if user) as keyring:
+            print(keyring.rejected)
+            encrypted = keyring.encrypt_bytes(report, recipients=['irc', 'max'])
+            signer = keyring.verify_bytes(signed_release)
+
+    The fingerprint checks :class:`keybase.KeybasePublicKey` makes are
+    made for every bundle. A bundle whose key doesn't have the fingerprint
+    Keybase gave for it, or that can't be parsed, is left out before the
+    import. If the import still brings in a key nobody asked for, the
+    keyring is thrown away and rebuilt from the bundles that pass when
+    they're checked one at a time. Either way, ``fingerprints`` maps the
+    label of every key that made it in to its fingerprint and ``rejected``
+    maps the label of every one that didn't to the reason why.
+
+    Like KeybasePublicKey, a keyring is safe to share between threads
+    and is removed when it's closed or garbage collected.
+    '''
+    def __init__(self, keys):
+        import threading
+        self.fingerprints = dict()
+        self.rejected = dict()
+        self.__lock = threading.Lock()
+        self.__busy = 0
+        self.__closed = False
+        self.__gpg = None
+        self.__tempdir = None
+        self.__homedir_lock = None
+        self.__labels = dict()
+        if isinstance(keys, dict):
+            items = list(keys.items())
+        else:
+            items = [(None, key) for key in keys]
+        candidates = list()
+        for (position, (label, key)) in enumerate(items):
+            (default_label, bundle, expected) = self.__key_data(key)
+            label = default_label if label is None else label
+            if label is None:
+                label = position
+            reason = self.__check_bundle(bundle, expected)
+            if reason is not None:
+                self.rejected[label] = reason
+                continue
+            if expected is None:
+                from keybase import openpgp
+                expected = openpgp.fingerprints(bundle)[0].lower()
+            candidates.append((label, bundle, expected))
+        imported = self.__import(candidates)
+        if not imported <= set(expected for (_, _, expected) in candidates):
+            self.__remove()
+            candidates = self.__isolate(candidates)
+            imported = self.__import(candidates)
+        for (label, _, expected) in candidates:
+            if expected in imported:
+                self.fingerprints[label] = expected
+                self.__labels.setdefault(expected, label)
+            else:
+                self.rejected[label] = 'not imported by gpg'
+
+    def __del__(self):
+        if getattr(self, '_KeybaseKeyring__closed', True) is False:
+            try:
+                self.close()
+            except ImportError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''
+        Removes the keyring. If other threads are using it, it's removed
+        when the last of them is done. Calling close() more than once is
+        harmless.
+        '''
+        with self.__lock:
+            self.__closed = True
+            if self.__busy:
+                return
+        self.__remove()
+
+    @property
+    def homedir(self):
+        '''
+        The path to the temporary gpg home directory holding the keyring,
+        or None once it's been closed.
+        '''
+        return self.__tempdir
+
+    @staticmethod
+    def __key_data(key):
+        '''
+        Returns a ``(label, bundle, fingerprint)`` tuple for one of the
+        ``keys`` given to the constructor. ``fingerprint`` is None for raw
+        bundles, which don't come with one.
+        '''
+        if isinstance(key, Keybase):
+            data = key._section('public_keys')['primary']
+            return (key.username, data['bundle'], data['key_fingerprint'].lower())
+        if isinstance(key, KeybasePublicKey):
+            return (key.key_fingerprint, key.bundle, key.key_fingerprint.lower())
+        return (None, key, None)
+
+    @staticmethod
+    def __check_bundle(bundle, expected):
+        '''
+        Returns why ``bundle`` can't go in the keyring or None if it can:
+        its primary key must be ``expected``, if that's given, and it has
+        to be an armored public key block.
+        '''
+        from keybase import openpgp
+        if not isinstance(bundle, str):
+            return 'bundle is not an armored public key block'
+        try:
+            prints = openpgp.fingerprints(bundle)
+        except openpgp.OpenPGPError as err:
+            return 'malformed bundle: {}'.format(err)
+        if not prints:
+            return 'bundle has no public key'
+        if expected is not None and prints[0].lower() != expected:
+            return 'fingerprint mismatch'
+        return None
+
+    def __import(self, candidates):
+        '''
+        Creates a fresh keyring, imports the bundles of ``candidates`` in
+        to it in one go and returns the set of fingerprints gpg imported.
+        '''
+        import gnupg
+        import shutil
+        import tempfile
+        keyring_janitor.startup_sweep()
+        tempdir = tempfile.mkdtemp(
+            prefix=KEYRING_PREFIX.format(os.getpid()),
+            suffix=KEYRING_SUFFIX)
+        homedir_lock = None
+        try:
+            homedir_lock = _lock_homedir(tempdir, create=True)
+            gpg_instance = gnupg.GPG(
+                binary=gpg(),
+                homedir=tempdir,
+                verbose=False,
+                use_agent=False)
+            imported = set()
+            if candidates:
+                import_result = gpg_instance.import_keys(
+                    '\n'.join(bundle for (_, bundle, _) in candidates))
+                imported = set(fprint.lower() for fprint in import_result.fingerprints if fprint)
+        except:
+            shutil.rmtree(tempdir, ignore_errors=True)
+            _unlock_homedir(homedir_lock)
+            raise
+        self.__gpg = gpg_instance
+        self.__tempdir = tempdir
+        self.__homedir_lock = homedir_lock
+        return imported
+
+    def __isolate(self, candidates):
+        '''
+        Imports every one of ``candidates`` in to a keyring of its own and
+        returns the ones that only brought in their own key. The others are
+        added to ``rejected``. This is the slow path, only taken when a
+        bulk import turned up keys that no bundle claimed to have.
+        '''
+        passed = list()
+        for (label, bundle, expected) in candidates:
+            try:
+                KeybasePublicKey(bundle=bundle, key_fingerprint=expected).close()
+                passed.append((label, bundle, expected))
+            except KeybasePublicKeyError:
+                self.rejected[label] = 'fingerprint mismatch'
+        return passed
+
+    def __remove(self):
+        '''
+        Removes the keyring's home directory.
+        '''
+        import shutil
+        tempdir = self.__tempdir
+        homedir_lock = self.__homedir_lock
+        self.__gpg = None
+        self.__tempdir = None
+        self.__homedir_lock = None
+        if tempdir:
+            shutil.rmtree(tempdir, ignore_errors=True)
+        _unlock_homedir(homedir_lock)
+
+    def __run_gpg(self, args, data=None, output=None):
+        '''
+        Runs gpg with ``args`` against the keyring, keeping it around while
+        gpg runs. See :func:`keybase._run_gpg` for the rest.
+        '''
+        with self.__lock:
+            if self.__closed:
+                raise KeybasePublicKeyError('Keyring has been closed')
+            self.__busy += 1
+            gpg_instance = self.__gpg
+        try:
+            return _run_gpg(_gpg_command(gpg_instance, args), data=data, output=output)
+        finally:
+            with self.__lock:
+                self.__busy -= 1
+                remove = self.__closed and not self.__busy
+            if remove:
+                self.__remove()
+
+    def encrypt_bytes(self, data, recipients=None, output=None, cipher_algo='AES256', compress_algo='ZIP'):
+        '''
+        Encrypts ``data`` so any one of ``recipients``, a list of labels,
+        or of everyone in the keyring if that's None, can decrypt it.
+        ``data``, ``output`` and the return value work like they do for
+        :func:`keybase.KeybasePublicKey.encrypt_bytes`. Raises a KeyError
+        for labels that aren't in ``fingerprints`` and a
+        KeybasePublicKeyEncryptError if gpg fails.
+        '''
+        if recipients is None:
+            recipients = list(self.fingerprints)
+        if not recipients:
+            raise KeybasePublicKeyEncryptError('no recipients to encrypt for')
+        args = ['--encrypt', '--always-trust', '--cipher-algo', cipher_algo, '--compress-algo', compress_algo]
+        for label in recipients:
+            args.extend(['--recipient', self.fingerprints[label]])
+        source = _fileno(data)
+        if source is None:
+            source = _bytes_view(data)
+        target = output
+        if output is not None and not isinstance(output, (bytearray, memoryview)):
+            target = _fileno(output)
+            if target is None:
+                target = output
+        elif output is not None:
+            target = _bytes_view(output)
+        try:
+            (returncode, result, _) = self.__run_gpg(args, data=source, output=target)
+        except BufferError:
+            raise KeybasePublicKeyEncryptError('output buffer too small for encrypted data')
+        if returncode != 0:
             raise KeybasePublicKeyEncryptError('unable to encrypt data')
-        if armor:
-            encrypted = str(encrypted)
-        return encrypted
+        return result
+
+    def verify_bytes(self, data, throw_error=False):
+        '''
+        Verifies the embedded or clear-text signature on ``data`` against
+        every key in the keyring. Returns the label of the key that made
+        the signature if it's valid, otherwise None or, with
+        ``throw_error=True``, raises a KeybasePublicKeyVerifyError with one
+        of the status messages described in
+        :func:`keybase.KeybasePublicKey.verify`.
+        '''
+        source = _fileno(data)
+        if source is None:
+            source = _bytes_view(data)
+        status = self.__run_gpg(['--verify'], data=source)[2]
+        (valid, message) = _verify_outcome(status)
+        if valid:
+            for (keyword, value) in status:
+                if keyword == 'VALIDSIG':
+                    fields = value.split()
+                    label = self.__labels.get(fields[-1].lower())
+                    if label is not None:
+                        return label
+            message = 'no public key'
+        if throw_error:
+            raise KeybasePublicKeyVerifyError(message)
+        return None
+
+class KeybaseRequestsTransport(object):
+    '''
+    Sends keybase.io API requests over a pool of kept-alive connections
+    held by one :py:class:`requests.Session`, so concurrent lookups reuse
+    connections instead of each paying for a new TCP and TLS handshake.
+    Install one with :func:`keybase.set_transport`.
+
+    Up to ``pool_size`` connections are kept open per host. Responses are
+    gzip or deflate compressed, and brotli compressed if the ``brotli``
+    package is installed; pass ``compress=False`` to ask for them
+    uncompressed.
+    '''
+    def __init__(self, pool_size=16, compress=True):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if not compress:
+            self.session.headers['Accept-Encoding'] = 'identity'
+
+    def request(self, method, url, params=None, stream=False, timeout=None):
+        '''
+        Sends a ``method`` (``'get'`` or ``'post'``) request to ``url`` and
+        returns the :py:class:`requests.Response`. ``timeout`` is a
+        ``(connect, read)`` tuple of seconds.
+        '''
+        return self.session.request(method.upper(), url, params=params, stream=stream, timeout=timeout)
+
+    def close(self):
+        '''
+        Closes the pooled connections.
+        '''
+        self.session.close()
+
+class KeybaseHTTPXTransport(object):
+    '''
+    Sends keybase.io API requests with an :py:class:`httpx.Client`. With
+    ``http2=True`` every request to keybase.io is multiplexed over a single
+    HTTP/2 connection, which needs ``httpx`` installed with its ``http2``
+    extra (``pip install httpx[http2]``); without it a KeybaseError is
+    raised. Install one with :func:`keybase.set_transport`.
+
+    Compression works like it does for
+    :class:`keybase.KeybaseRequestsTransport`. Network errors and timeouts
+    are raised as the :py:mod:`requests` exceptions the rest of the module
+    expects and error responses raise a :py:class:`requests.HTTPError`.
+    '''
+    def __init__(self, http2=True, max_connections=100, compress=True):
+        try:
+            import httpx
+            self.client = httpx.Client(
+                http2=http2,
+                limits=httpx.Limits(max_connections=max_connections),
+                headers=None if compress else {'Accept-Encoding': 'identity'})
+        except ImportError as err:
+            raise KeybaseError('KeybaseHTTPXTransport needs httpx[http2] installed: {}'.format(err))
+        self._httpx = httpx
+
+    def request(self, method, url, params=None, stream=False, timeout=None):
+        '''
+        Sends a ``method`` (``'get'`` or ``'post'``) request to ``url`` and
+        returns a response with the parts of the
+        :py:class:`requests.Response` interface this module uses.
+        ``timeout`` is a ``(connect, read)`` tuple of seconds.
+        '''
+        httpx = self._httpx
+        (connect, read) = timeout or (None, None)
+        with _httpx_errors(httpx):
+            request = self.client.build_request(
+                method.upper(), url, params=params, timeout=httpx.Timeout(read, connect=connect))
+            return _HTTPXResponse(self.client.send(request, stream=stream), httpx)
+
+    def close(self):
+        '''
+        Closes the client and its connections.
+        '''
+        self.client.close()
+
+class _HTTPXResponse(object):
+    '''
+    Wraps an :py:class:`httpx.Response` in the parts of the
+    :py:class:`requests.Response` interface this module uses.
+    '''
+    def __init__(self, response, httpx):
+        self.response = response
+        self.status_code = response.status_code
+        self.http_version = response.http_version
+        self.__httpx = httpx
+
+    @property
+    def content(self):
+        '''
+        The whole, decompressed, response body.
+        '''
+        with _httpx_errors(self.__httpx):
+            return self.response.read()
+
+    def iter_content(self, chunk_size=None):
+        '''
+        Yields the decompressed response body in chunks.
+        '''
+        with _httpx_errors(self.__httpx):
+            for chunk in self.response.iter_bytes(chunk_size):
+                yield chunk
+
+    def raise_for_status(self):
+        '''
+        Raises a :py:class:`requests.HTTPError` for 4xx and 5xx responses.
+        '''
+        import requests
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(
+                '{} Error for url: {}'.format(self.status_code, self.response.url), response=self)
+
+    def close(self):
+        '''
+        Lets go of the connection the response came in on.
+        '''
+        self.response.close()
+
+class KeybaseCircuitBreaker(object):
+    '''
+    Keeps track of whether the keybase.io API is healthy so calls to it
+    can fail fast when it isn't, rather than each one waiting out its own
+    timeout. Every API call in this module goes through
+    :data:`keybase.api_breaker`.
+
+    The breaker starts out ``closed`` and lets every call through. After
+    ``failure_threshold`` failures in a row it opens and refuses
+    calls, which raise a KeybaseUnavailableError instead; lookups fall
+    back on the user cache, expired entries included, if one is
+    installed. ``reset_timeout`` seconds later it goes ``half-open`` and
+    lets calls through again: the first one to succeed closes it and the
+    first one to fail opens it for another ``reset_timeout`` seconds.
+
+    >>> breaker = KeybaseCircuitBreaker(failure_threshold=2, reset_timeout=60)
+    >>> breaker.failure()
+    >>> breaker.allow()
+    True
+    >>> breaker.failure()
+    >>> (breaker.state, breaker.allow())
+    ('open', False)
+    >>> breaker.reset()
+    >>> breaker.state
+    'closed'
+    '''
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        import threading
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self.__state = 'closed'
+        self.__failures = 0
+        self.__opened_at = 0.0
+
+    @property
+    def state(self):
+        '''
+        The breaker's state: ``'closed'``, ``'open'`` or ``'half-open'``.
+        '''
+        import time
+        with self._lock:
+            if self.__state == 'open' and time.time() - self.__opened_at >= self.reset_timeout:
+                self.__state = 'half-open'
+            return self.__state
+
+    def allow(self):
+        '''
+        Returns True if a call may be made now and False, counting it as
+        rejected, if the breaker is open.
+        '''
+        if self.state != 'open':
+            return True
+        with self._lock:
+            self.rejected += 1
+        return False
+
+    def success(self):
+        '''
+        Records a call that got an answer from the API, closing the breaker.
+        '''
+        with self._lock:
+            self.__failures = 0
+            self.__state = 'closed'
+
+    def failure(self):
+        '''
+        Records a call that failed, opening the breaker if that's one too
+        many or if it was the trial call made while half-open.
+        '''
+        import time
+        with self._lock:
+            self.__failures += 1
+            if self.__state == 'half-open' or (
+                    self.__state == 'closed' and self.__failures >= self.failure_threshold):
+                self.__state = 'open'
+                self.__opened_at = time.time()
+                self.opened += 1
+
+    def reset(self):
+        '''
+        Closes the breaker and forgets the failures it has seen.
+        '''
+        with self._lock:
+            self.__failures = 0
+            self.__state = 'closed'
+
+    def stats(self):
+        '''
+        Returns a dictionary with the breaker's ``state``, the number of
+        consecutive ``failures``, how many times it has ``opened`` and how
+        many calls it has ``rejected``.
+        '''
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'failures': self.__failures,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
+
+class KeybaseHedger(object):
+    '''
+    Cuts the tail latency of keybase.io API calls by sending a second copy
+    of a GET request that's taking longer than usual and using whichever
+    answer comes back first. Install one with :func:`keybase.set_hedger`.
+
+    A request is hedged once it has taken longer than the ``percentile``
+    of the latencies of the last ``window`` requests, so about one in
+    twenty requests is sent twice with the default. Until ``min_samples``
+    latencies have been seen, or always if ``delay`` is given, a fixed
+    delay of ``delay`` seconds (one second by default) is used. The
+    requests are made by a pool of up to ``max_workers`` threads. The
+    delay is timed from when a request starts running, not from when it
+    was queued, so calls waiting for a free thread aren't hedged because
+    of the wait. A hedge that's still queued when the first copy answers
+    is never sent.
+
+    A request that fails before the hedge delay isn't hedged; its error
+    is raised straight away. Once both copies are in flight the first
+    success wins and the second error is only raised if both fail. The
+    slower copy is left to finish in the background and its answer is
+    thrown away.
+
+    >>> hedger = KeybaseHedger(delay=0.5)
+    >>> hedger.call(lambda: 42)
+    42
+    >>> hedger.stats()['hedged']
+    0
+    '''
+    def __init__(self, delay=None, percentile=0.95, window=200, min_samples=20, max_workers=8):
+        import collections
+        import threading
+        self.fixed_delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self.__latencies = collections.deque(maxlen=window)
+        self.__executor = None
+
+    def delay(self):
+        '''
+        Returns how many seconds a request runs for before it's hedged.
+        '''
+        with self._lock:
+            if self.fixed_delay is not None or len(self.__latencies) < self.min_samples:
+                return 1.0 if self.fixed_delay is None else self.fixed_delay
+            ordered = sorted(self.__latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    def call(self, func):
+        '''
+        Calls ``func``, a function that makes one request and returns its
+        response, hedging it if it's slow. Returns the first response.
+        '''
+        import threading
+        import time
+        from concurrent import futures
+        delay = self.delay()
+        executor = self.__pool()
+        started = threading.Event()
+        def primary():
+            started.set()
+            return func()
+        first = executor.submit(primary)
+        with self._lock:
+            self.requests += 1
+        started.wait()
+        start = time.time()
+        try:
+            result = first.result(timeout=delay)
+        except futures.TimeoutError:
+            pass
+        else:
+            self.__record(time.time() - start)
+            return result
+        second = executor.submit(func)
+        with self._lock:
+            self.hedged += 1
+        pending = set((first, second))
+        error = None
+        while pending:
+            (done, pending) = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                self.__record(time.time() - start)
+                if future is second:
+                    with self._lock:
+                        self.hedge_wins += 1
+                else:
+                    second.cancel()
+                return future.result()
+        raise error
+
+    def stats(self):
+        '''
+        Returns a dictionary with the number of ``requests`` made, how many
+        were ``hedged``, how many times the hedge answered first
+        (``hedge_wins``) and the current hedge ``delay`` in seconds.
+        '''
+        delay = self.delay()
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'delay': delay,
+            }
+
+    def close(self):
+        '''
+        Shuts down the thread pool once the requests in flight are done.
+        '''
+        with self._lock:
+            executor = self.__executor
+            self.__executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def __pool(self):
+        '''
+        Returns the thread pool, creating it the first time it's needed.
+        '''
+        from concurrent import futures
+        with self._lock:
+            if self.__executor is None:
+                self.__executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+            return self.__executor
+
+    def __record(self, latency):
+        '''
+        Adds the ``latency`` of a finished request to the window.
+        '''
+        with self._lock:
+            self.__latencies.append(latency)
+
+class KeybaseUserCache(object):
+    '''
+    An in-memory cache of Keybase user objects. Entries expire ``ttl``
+    seconds after they're added. Install one with
+    :func:`keybase.set_user_cache` to have lookups served from it.
+
+    >>> cache = KeybaseUserCache(ttl=60)
+    >>> cache.put('irc', {'basics': {'username': 'irc'}})
+    >>> cache.get('irc')['basics']['username']
+    'irc'
+    >>> cache.get('nobody') is None
+    True
+    >>> cache.stats() == {'hits': 1, 'misses': 1, 'stale_hits': 0, 'size': 1}
+    True
+    '''
+    def __init__(self, ttl=3600):
+        import threading
+        self.ttl = ttl
+        self._hits = 0
+        self._misses = 0
+        self._stale_hits = 0
+        self._lock = threading.Lock()
+        self.__entries = dict()
+
+    def get(self, username):
+        '''
+        Returns the cached user object for ``username`` or None if there
+        isn't a fresh one.
+        '''
+        user_object = self._load(username)
+        with self._lock:
+            if user_object is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return user_object
+
+    def get_stale(self, username):
+        '''
+        Returns the cached user object for ``username``, however long ago
+        it expired, or None if there isn't one. This is what lookups fall
+        back on while :data:`keybase.api_breaker` is open.
+        '''
+        user_object = self._load(username, stale=True)
+        if user_object is not None:
+            with self._lock:
+                self._stale_hits += 1
+        return user_object
+
+    def put(self, username, user_object):
+        '''
+        Adds or replaces the user object for ``username``.
+        '''
+        self._store(username, user_object)
+
+    def stats(self):
+        '''
+        Returns a dictionary with the ``hits``, ``misses``, ``stale_hits``
+        and ``size`` of the cache.
+        '''
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'stale_hits': self._stale_hits, 'size': self._size()}
+
+    def _load(self, username, stale=False):
+        '''
+        Returns the fresh user object stored for ``username`` or None. With
+        ``stale=True`` expired entries are returned too.
+        '''
+        import time
+        entry = self.__entries.get(username)
+        if entry is None or (not stale and entry[0] + self.ttl < time.time()):
+            return None
+        return entry[1]
+
+    def _store(self, username, user_object):
+        '''
+        Stores ``user_object`` for ``username``.
+        '''
+        import time
+        self.__entries[username] = (time.time(), user_object)
+
+    def _size(self):
+        '''
+        Returns the number of entries in the cache.
+        '''
+        return len(self.__entries)
+
+class KeybaseFileCache(KeybaseUserCache):
+    '''
+    A user cache that keeps one JSON file per user in ``directory`` so it
+    survives between runs and can be shared by several processes. Entries
+    expire ``ttl`` seconds after the file was written.
+
+    Files are written to a temporary name and renamed in to place, so
+    concurrent readers never see a half-written entry.
+    '''
+    def __init__(self, directory, ttl=86400):
+        super(KeybaseFileCache, self).__init__(ttl=ttl)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, username):
+        '''
+        Returns the path of the cache file for ``username``.
+        '''
+        import hashlib
+        digest = hashlib.sha1(username.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.json')
+
+    def _load(self, username, stale=False):
+        import json
+        import time
+        path = self._path(username)
+        try:
+            if not stale and os.path.getmtime(path) + self.ttl < time.time():
+                return None
+            with open(path, 'r') as fobj:
+                return json.load(fobj)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _store(self, username, user_object):
+        import json
+        import threading
+        path = self._path(username)
+        temppath = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+        with open(temppath, 'w') as fobj:
+            json.dump(user_object, fobj)
+        os.replace(temppath, path)
+
+    def _size(self):
+        return len([fname for fname in os.listdir(self.directory) if fname.endswith('.json')])
+
+class KeybaseNegativeCache(object):
+    '''
+    Remembers usernames and discovery IDs that don't exist on keybase.io so
+    asking for them again fails without a round trip. Install one with
+    :func:`keybase.set_negative_cache`.
+
+    >>> cache = KeybaseNegativeCache(ttl=60)
+    >>> cache.add('username:nobody')
+    >>> cache.contains('username:nobody')
+    True
+    >>> cache.contains('username:irc')
+    False
+    >>> cache.stats()['size']
+    1
+
+    Names are kept in Bloom filters rather than a set, so even millions of
+    them fit in a few megabytes: each filter holds up to ``capacity`` names
+    with a false positive rate of ``error_rate``. A false positive makes a
+    user that does exist look missing, so keep ``error_rate`` small; the
+    estimated current rate is reported by :func:`stats`.
+
+    A Bloom filter can't forget single names, so expiry works on whole
+    filters instead. New names go in to the current filter, which is
+    retired after ``ttl`` seconds, or sooner once it holds ``capacity``
+    names, and dropped when the filter that replaced it is retired in turn.
+    A name is therefore remembered for between ``ttl`` and twice ``ttl``
+    seconds unless the filters fill up faster than that.
+    '''
+    def __init__(self, ttl=3600, capacity=100000, error_rate=0.001):
+        import math
+        import threading
+        import time
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuilds = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self.__bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.__hashes = max(1, int(round(float(self.__bits) / capacity * math.log(2))))
+        self.__current = self.__new_filter()
+        self.__previous = None
+        self.__started = time.time()
+
+    def add(self, key):
+        '''
+        Remembers that ``key`` doesn't exist.
+        '''
+        positions = self.__positions(key)
+        with self._lock:
+            self.__expire()
+            if self.__test(self.__current, positions):
+                return
+            if self.__current['count'] >= self.capacity:
+                self.__rotate()
+            bits = self.__current['bits']
+            for position in positions:
+                mask = 1 << (position & 7)
+                if not bits[position >> 3] & mask:
+                    bits[position >> 3] |= mask
+                    self.__current['set'] += 1
+            self.__current['count'] += 1
+
+    def contains(self, key):
+        '''
+        Returns True if ``key`` is known not to exist.
+        '''
+        positions = self.__positions(key)
+        with self._lock:
+            self.__expire()
+            found = self.__test(self.__current, positions) or self.__test(self.__previous, positions)
+            if found:
+                self._hits += 1
+            else:
+                self._misses += 1
+            return found
+
+    def clear(self):
+        '''
+        Forgets every name.
+        '''
+        import time
+        with self._lock:
+            self.__current = self.__new_filter()
+            self.__previous = None
+            self.__started = time.time()
+
+    def stats(self):
+        '''
+        Returns a dictionary with the ``hits`` and ``misses`` of the cache,
+        its ``size`` in names, the ``bytes`` its filters use, how many
+        times filters have been retired as ``rebuilds`` and the estimated
+        ``false_positive_rate`` of a lookup right now.
+        '''
+        with self._lock:
+            self.__expire()
+            filters = [bloom for bloom in (self.__current, self.__previous) if bloom is not None]
+            negative = 1.0
+            for bloom in filters:
+                negative *= 1.0 - (float(bloom['set']) / self.__bits) ** self.__hashes
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'size': sum(bloom['count'] for bloom in filters),
+                'bytes': sum(len(bloom['bits']) for bloom in filters),
+                'rebuilds': self.rebuilds,
+                'false_positive_rate': 1.0 - negative,
+            }
+
+    def __new_filter(self):
+        '''
+        Returns a new, empty filter.
+        '''
+        return {'bits': bytearray((self.__bits + 7) // 8), 'count': 0, 'set': 0}
+
+    def __positions(self, key):
+        '''
+        Returns the bit positions for ``key``, using double hashing over a
+        single SHA-1 digest.
+        '''
+        import hashlib
+        digest = hashlib.sha1(key.encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        return [(first + i * second) % self.__bits for i in range(self.__hashes)]
+
+    @staticmethod
+    def __test(bloom, positions):
+        '''
+        Returns True if every bit at ``positions`` is set in ``bloom``.
+        '''
+        if bloom is None:
+            return False
+        bits = bloom['bits']
+        for position in positions:
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __rotate(self):
+        '''
+        Retires the current filter and starts a new one.
+        '''
+        import time
+        self.__previous = self.__current
+        self.__current = self.__new_filter()
+        self.__started = time.time()
+        self.rebuilds += 1
+
+    def __expire(self):
+        '''
+        Retires the current filter if it's older than ``ttl``, and drops
+        both filters if it's older than twice ``ttl``.
+        '''
+        import time
+        age = time.time() - self.__started
+        if age >= 2 * self.ttl:
+            self.__rotate()
+            self.__previous = None
+        elif age >= self.ttl:
+            self.__rotate()
+
+class KeybaseVerifyCache(object):
+    '''
+    A bounded, least recently used cache of signature verification
+    outcomes. Install one with :func:`keybase.set_verify_cache` and
+    verifying the same data and signature with the same key again costs a
+    SHA-256 of the input instead of a gpg process.
+
+    >>> cache = KeybaseVerifyCache(max_entries=2)
+    >>> cache.put('7cc0ce67', None, b'digest', (True, 'signature valid'))
+    >>> cache.get('7cc0ce67', None, b'digest')
+    (True, 'signature valid')
+    >>> cache.get('7cc0ce67', None, b'other') is None
+    True
+    >>> cache.stats()['hit_rate']
+    0.5
+
+    Entries are keyed by the key's fingerprint, its ``mtime`` and the
+    digest of the data and signature. Keybase bumps a key's ``mtime`` when
+    it changes, including when it's revoked, so keys built from fresh
+    Keybase data never see outcomes cached for an older copy of the key.
+    When gpg reports that a key has been revoked everything cached for
+    that key is dropped, and :func:`invalidate` does the same on demand.
+
+    Only outcomes for in-memory data and for files named in
+    :func:`keybase.KeybasePublicKey.verify_file` are cached. Data read from
+    an open file object or descriptor is streamed to gpg and can't be
+    hashed first.
+    '''
+    def __init__(self, max_entries=10000):
+        import collections
+        import threading
+        self.max_entries = max_entries
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self.__entries = collections.OrderedDict()
+
+    def get(self, fingerprint, mtime, digest):
+        '''
+        Returns the cached ``(valid, message)`` outcome or None.
+        '''
+        with self._lock:
+            outcome = self.__entries.get((fingerprint, mtime, digest))
+            if outcome is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self.__entries.move_to_end((fingerprint, mtime, digest))
+            return outcome
+
+    def put(self, fingerprint, mtime, digest, outcome):
+        '''
+        Stores the ``(valid, message)`` outcome of a verification,
+        evicting the least recently used entries to stay under
+        ``max_entries``.
+        '''
+        with self._lock:
+            self.__entries[(fingerprint, mtime, digest)] = outcome
+            self.__entries.move_to_end((fingerprint, mtime, digest))
+            while len(self.__entries) > max(1, self.max_entries):
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, fingerprint=None):
+        '''
+        Drops every outcome cached for the key with ``fingerprint``, or the
+        whole cache if ``fingerprint`` is None. Returns the number of
+        entries dropped.
+        '''
+        with self._lock:
+            if fingerprint is None:
+                dropped = len(self.__entries)
+                self.__entries.clear()
+                return dropped
+            stale = [key for key in self.__entries if key[0] == fingerprint]
+            for key in stale:
+                del self.__entries[key]
+            return len(stale)
+
+    def stats(self):
+        '''
+        Returns a dictionary with the ``hits``, ``misses``, ``hit_rate``
+        and ``size`` of the cache.
+        '''
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': float(self._hits) / lookups if lookups else 0.0,
+                'size': len(self.__entries),
+            }
+
+class KeybaseCompressionChooser(object):
+    '''
+    Picks the compression algorithm for ``compress_algo='auto'`` in
+    :func:`keybase.KeybasePublicKey.encrypt` and
+    :func:`keybase.KeybasePublicKey.encrypt_bytes`. Compressing images,
+    archives and anything else that's already compressed just burns CPU,
+    so a sample of the payload is compressed with zlib at its fastest
+    setting first and the ratio decides:
+
+    * At or above ``skip_ratio`` the payload is sent ``Uncompressed``.
+    * At or below ``bzip2_ratio`` and no bigger than ``bzip2_max_size``
+      bytes it gets ``BZIP2``, which is slow but squeezes very redundant
+      data noticeably harder than deflate.
+    * Everything else gets ``ZIP``.
+
+    If gpg doesn't support the pick, ``ZLIB`` (the same deflate as ``ZIP``
+    in a different wrapper) and then ``ZIP`` are tried in its place.
+
+    >>> chooser = KeybaseCompressionChooser()
+    >>> chooser.choose(os.urandom(4096), ('ZIP', 'Uncompressed'))
+    'Uncompressed'
+    >>> chooser.choose(b'Hello, world! ' * 1000, ('ZLIB', 'Uncompressed'))
+    'ZLIB'
+    >>> chooser.stats()['decisions']
+    {'Uncompressed': 1, 'ZLIB': 1}
+
+    The module-level :data:`keybase.compression_chooser` instance is the
+    one ``'auto'`` uses. Tune it and read its decisions with::
+
+        keybase.compression_chooser.skip_ratio = 0.8
+        keybase.compression_chooser.stats()
+    '''
+    def __init__(self, skip_ratio=0.9, bzip2_ratio=0.2, bzip2_max_size=1024 * 1024):
+        import collections
+        import threading
+        self.skip_ratio = skip_ratio
+        self.bzip2_ratio = bzip2_ratio
+        self.bzip2_max_size = bzip2_max_size
+        self._lock = threading.Lock()
+        self.__decisions = collections.Counter()
+        self.__samples = 0
+        self.__sampled_bytes = 0
+        self.__ratios = 0.0
+        self.__seconds = 0.0
+
+    def choose(self, sample, available, size=None):
+        '''
+        Returns the name of the algorithm from ``available`` to compress a
+        payload of ``size`` bytes, which may be None if it isn't known,
+        that ``sample`` came from. A ``sample`` of None means the payload
+        couldn't be sampled and gets ``ZIP``.
+        '''
+        import time
+        import zlib
+        ratio = None
+        algo = 'ZIP'
+        if sample is not None:
+            start = time.time()
+            ratio = len(zlib.compress(sample, 1)) / float(len(sample)) if len(sample) else 1.0
+            elapsed = time.time() - start
+            if ratio >= self.skip_ratio:
+                algo = 'Uncompressed'
+            elif ratio <= self.bzip2_ratio and size is not None and size <= self.bzip2_max_size:
+                algo = 'BZIP2'
+        for candidate in (algo, 'ZLIB', 'ZIP'):
+            if candidate in available:
+                algo = candidate
+                break
+        with self._lock:
+            self.__decisions[algo] += 1
+            if ratio is not None:
+                self.__samples += 1
+                self.__sampled_bytes += len(sample)
+                self.__ratios += ratio
+                self.__seconds += elapsed
+        return algo
+
+    def stats(self):
+        '''
+        Returns a dictionary with how many times each algorithm was picked
+        (``decisions``), how many payloads were sampled (``samples``), the
+        total ``sampled_bytes``, the ``mean_ratio`` the samples compressed
+        to and the ``seconds`` spent compressing them.
+        '''
+        with self._lock:
+            return {
+                'decisions': dict(self.__decisions),
+                'samples': self.__samples,
+                'sampled_bytes': self.__sampled_bytes,
+                'mean_ratio': self.__ratios / self.__samples if self.__samples else 0.0,
+                'seconds': self.__seconds,
+            }
+
+class KeybaseKeyringJanitor(object):
+    '''
+    Keeps the temporary gpg home directories created for KeybasePublicKey
+    keyrings under control.
+
+    * It caps the number of live home directories at ``max_homedirs``.
+      When a new keyring would go over the cap the keyring of the least
+      recently used key is removed. That key stays usable: its keyring is
+      quietly rebuilt the next time it's needed. Keys that are in the
+      middle of an operation are skipped, so the cap can be exceeded
+      briefly when every key is busy.
+    * The first time a keyring is created in a process it sweeps the
+      temporary directory for ``*.keybase`` home directories left behind
+      by processes that have died without cleaning up. Only directories
+      owned by the current user are considered. A live keyring's owner
+      holds an flock on the ``KEYRING_LOCK`` file inside it, so a
+      directory whose lock can be taken is an orphan, whichever process or
+      container made it. Directories without a lock file are removed once
+      they're older than ``orphan_age`` seconds.
+
+    The module-level :data:`keybase.keyring_janitor` instance is the one
+    KeybasePublicKey objects use::
+
+        keybase.keyring_janitor.max_homedirs = 64
+        keybase.keyring_janitor.stats()
+        {'live': 12, 'max_homedirs': 64, 'evicted': 0, 'reclaimed': 3}
+    '''
+    def __init__(self, max_homedirs=256, tempdir=None, orphan_age=86400):
+        import collections
+        import threading
+        self.max_homedirs = max_homedirs
+        self.tempdir = tempdir
+        self.orphan_age = orphan_age
+        self.evicted = 0
+        self.reclaimed = 0
+        self._lock = threading.RLock()
+        self.__swept = False
+        self.__live = collections.OrderedDict()
+
+    def register(self, pkey):
+        '''
+        Starts tracking the keyring of ``pkey``, evicting the keyrings of
+        the least recently used keys if that takes us over the cap.
+        '''
+        import weakref
+        with self._lock:
+            ident = id(pkey)
+            self.__live[ident] = weakref.ref(pkey, lambda _, ident=ident: self.__forget(ident))
+        self.__trim(pkey)
+
+    def idle(self, pkey):
+        '''
+        Called when the last operation using the keyring of ``pkey`` has
+        finished. Evicts keyrings that couldn't be evicted while they were
+        busy if we're still over the cap.
+        '''
+        if len(self.__live) > max(1, self.max_homedirs):
+            self.__trim(None)
+
+    def __trim(self, keep):
+        '''
+        Evicts the keyrings of the least recently used idle keys, other
+        than ``keep``, until we're back under the cap.
+        '''
+        victims = list()
+        with self._lock:
+            excess = len(self.__live) - max(1, self.max_homedirs)
+            for (victim_ident, ref) in list(self.__live.items()):
+                if excess <= 0:
+                    break
+                victim = ref()
+                if victim is None or victim is keep or victim.busy:
+                    continue
+                del self.__live[victim_ident]
+                victims.append((victim_ident, ref, victim))
+                excess -= 1
+        evicted = 0
+        for (victim_ident, ref, victim) in victims:
+            if victim._release_keyring():
+                evicted += 1
+            else:
+                # It got busy after we picked it; keep tracking it.
+                with self._lock:
+                    self.__live[victim_ident] = ref
+                    self.__live.move_to_end(victim_ident, last=False)
+        with self._lock:
+            self.evicted += evicted
+
+    def touch(self, pkey):
+        '''
+        Marks the keyring of ``pkey`` as the most recently used one.
+        '''
+        with self._lock:
+            if id(pkey) in self.__live:
+                self.__live.move_to_end(id(pkey))
+
+    def unregister(self, pkey):
+        '''
+        Stops tracking the keyring of ``pkey``.
+        '''
+        self.__forget(id(pkey))
+
+    def __forget(self, ident):
+        with self._lock:
+            self.__live.pop(ident, None)
+
+    def startup_sweep(self):
+        '''
+        Runs :func:`keybase.KeybaseKeyringJanitor.sweep` the first time
+        it's called and does nothing after that.
+        '''
+        with self._lock:
+            if self.__swept:
+                return 0
+            self.__swept = True
+        return self.sweep()
+
+    def sweep(self):
+        '''
+        Removes orphaned keyring home directories from the temporary
+        directory and returns how many were reclaimed. Directories whose
+        lock is held, by this process or any other, and directories owned
+        by other users are left alone.
+        '''
+        import shutil
+        import stat
+        import tempfile
+        import time
+        tempdir = self.tempdir or tempfile.gettempdir()
+        reclaimed = 0
+        try:
+            names = os.listdir(tempdir)
+        except OSError:
+            names = list()
+        for name in names:
+            path = os.path.join(tempdir, name)
+            if not name.endswith(KEYRING_SUFFIX):
+                continue
+            try:
+                info = os.lstat(path)
+            except OSError:
+                continue
+            if not stat.S_ISDIR(info.st_mode) or (hasattr(os, 'getuid') and info.st_uid != os.getuid()):
+                continue
+            try:
+                homedir_lock = _lock_homedir(path)
+                if homedir_lock is None:
+                    continue
+            except FileNotFoundError:
+                # Made before keyrings were locked, or its owner hasn't
+                # locked it yet.
+                if info.st_mtime + self.orphan_age > time.time():
+                    continue
+                homedir_lock = None
+            except OSError:
+                continue
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                _unlock_homedir(homedir_lock)
+            if not os.path.exists(path):
+                reclaimed += 1
+        with self._lock:
+            self.reclaimed += reclaimed
+        return reclaimed
+
+    def live(self):
+        '''
+        Returns the number of keyring home directories currently in use.
+        '''
+        with self._lock:
+            return len(self.__live)
+
+    def stats(self):
+        '''
+        Returns a dictionary with the number of ``live`` keyrings, the
+        ``max_homedirs`` cap, how many keyrings have been ``evicted`` to
+        stay under it and how many orphans have been ``reclaimed``.
+        '''
+        with self._lock:
+            return {
+                'live': len(self.__live),
+                'max_homedirs': self.max_homedirs,
+                'evicted': self.evicted,
+                'reclaimed': self.reclaimed,
+            }
+
+def _httpx_errors(httpx):
+    '''
+    Returns a context manager that turns httpx network errors in to the
+    :py:mod:`requests` exceptions the rest of the module handles.
+    '''
+    import contextlib
+    import requests
+    @contextlib.contextmanager
+    def translate():
+        try:
+            yield
+        except httpx.TimeoutException as err:
+            raise requests.exceptions.Timeout(str(err))
+        except httpx.TransportError as err:
+            raise requests.exceptions.ConnectionError(str(err))
+    return translate()
+
+def _lock_homedir(path, create=False):
+    '''
+    Takes an exclusive flock on the ``KEYRING_LOCK`` file in the keyring
+    home directory ``path``, creating the file if ``create`` is True, and
+    returns the file descriptor holding it. The lock lasts until the
+    descriptor is handed to :func:`keybase._unlock_homedir`.
+
+    Returns None if another open file holds the lock, or if there's no
+    fcntl module to lock with (on Windows); either way the directory must
+    be treated as live. Raises FileNotFoundError if there's no lock file.
+    '''
+    flags = os.O_RDWR | getattr(os, 'O_CLOEXEC', 0) | (os.O_CREAT if create else 0)
+    fd = os.open(os.path.join(path, KEYRING_LOCK), flags, 0o600)
+    try:
+        import fcntl
+    except ImportError:
+        os.close(fd)
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+def _unlock_homedir(fd):
+    '''
+    Lets go of a lock taken with :func:`keybase._lock_homedir`.
+    '''
+    if fd is not None:
+        os.close(fd)
+
+#: The janitor used by every KeybasePublicKey in this process.
+keyring_janitor = KeybaseKeyringJanitor()
+
+#: The chooser behind ``compress_algo='auto'`` for every KeybasePublicKey
+#: in this process.
+compression_chooser = KeybaseCompressionChooser()
+
+#: The circuit breaker every keybase.io API call in this process goes
+#: through.
+api_breaker = KeybaseCircuitBreaker()
 
 class KeybaseError(Exception):
     '''
@@ -889,6 +4575,14 @@ class KeybaseError(Exception):
     '''
     pass
 
+class KeybaseUnavailableError(KeybaseError):
+    '''
+    Thrown when a keybase.io API call isn't made because
+    :data:`keybase.api_breaker` is open, and the user cache can't stand in
+    for it.
+    '''
+    pass
+
 class KeybaseInvalidIdTypeError(Exception):
     '''
     Thrown when an invalid ID type is provided to a method that is expecting
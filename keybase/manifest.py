@@ -0,0 +1,303 @@
+'''
+.. module:: manifest
+   :platform: Unix, Windows
+   :synopsis: Verify whole directories of files against one signed checksum manifest.
+
+.. moduleauthor:: Ian Chesal <ian.chesal@gmail.com>
+
+Verifying a release one detached signature at a time costs a gpg run per
+file, which adds up fast when a release has thousands of them. A signed
+checksum manifest -- a ``SHA256SUMS`` file like the ones ``sha256sum``
+writes, signed by a Keybase user -- needs a single gpg run. After that
+every file listed in it only has to be hashed, which is done in parallel
+with large reads or memory maps::
+
+    from keybase import manifest
+
+    report = manifest.verify_manifest('irc', 'release/SHA256SUMS', 'release/SHA256SUMS.asc')
+    print(report.summary())
+    assert report.ok
+
+The manifest may have a detached signature or be clear-signed. Both the
+GNU (``<digest>  <name>``) and BSD (``SHA256 (<name>) = <digest>``) line
+formats are understood, with SHA-256 or SHA-512 digests.
+'''
+
+#pylint: disable=C0301
+
+import os
+import re
+import time
+
+from keybase import keybase
+
+# Files at least this big are hashed through a read-only memory map, so
+# the kernel pages them straight in to the hash without any copies. Smaller
+# files aren't worth the cost of setting up a map.
+MMAP_THRESHOLD = 1024 * 1024
+
+# Size of the buffer smaller files are read in to.
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Digest algorithms by the length of their hex digests.
+_ALGORITHMS = {64: 'sha256', 128: 'sha512'}
+
+_GNU_LINE = re.compile(r'^(\\?)([0-9a-fA-F]{64}|[0-9a-fA-F]{128}) [ *](.+)$')
+_BSD_LINE = re.compile(r'^(\\?)(SHA256|SHA512) ?\((.+)\) ?= ?([0-9a-fA-F]+)$')
+
+def verify_manifest(key, manifest, sigfname=None, root=None, jobs=None):
+    '''
+    Verifies the signature on the checksum ``manifest`` file and then
+    checks every file it lists. Returns a :class:`ManifestReport`.
+
+    ``key`` is who signed the manifest: a username, a
+    :class:`keybase.Keybase` or a :class:`keybase.KeybasePublicKey`.
+    ``sigfname`` is the detached signature for the manifest; leave it out
+    for a clear-signed manifest. File names in the manifest are relative
+    to ``root``, which defaults to the directory the manifest is in. Up to
+    ``jobs`` files are hashed at once, one per CPU by default.
+
+    The manifest is read once and the signature is verified on those bytes,
+    so it can't be swapped out between being verified and being used. A
+    bad signature raises a KeybasePublicKeyVerifyError and a manifest that
+    can't be parsed raises a ManifestFormatError; nothing is hashed in
+    either case.
+    '''
+    start = time.time()
+    with open(manifest, 'rb') as fobj:
+        signed = fobj.read()
+    if isinstance(key, str):
+        with keybase.Keybase(key) as kbase:
+            _verify_signature(kbase, signed, sigfname)
+    else:
+        _verify_signature(key, signed, sigfname)
+    if sigfname is None:
+        signed = cleartext(signed)
+    entries = parse_manifest(signed)
+    if root is None:
+        root = os.path.dirname(os.path.abspath(manifest))
+    report = ManifestReport(manifest)
+    _check_files(report, root, entries, jobs)
+    skip = set(os.path.abspath(fname) for fname in (manifest, sigfname) if fname)
+    report.extra = sorted(
+        name for name in _walk(root)
+        if name not in entries and os.path.abspath(os.path.join(root, name)) not in skip)
+    report.elapsed = time.time() - start
+    return report
+
+def _verify_signature(key, signed, sigfname):
+    '''
+    Verifies the signature on the manifest contents ``signed`` with ``key``
+    and raises a KeybasePublicKeyVerifyError if it isn't valid.
+    '''
+    if sigfname is None:
+        key.verify_bytes(signed, throw_error=True)
+        return
+    with open(sigfname, 'rb') as fobj:
+        signature = fobj.read()
+    key.verify_detached(signed, signature, throw_error=True)
+
+def cleartext(signed):
+    '''
+    Returns the signed text of the clear-signed message ``signed`` with the
+    dash-escaping undone and, since the signature doesn't cover it, trailing
+    whitespace removed. Anything outside of the signed part of the message
+    is dropped. Raises a ManifestFormatError if ``signed`` isn't a
+    clear-signed message.
+
+    >>> cleartext(b"""-----BEGIN PGP SIGNED MESSAGE-----
+    ... Hash: SHA256
+    ...
+    ... - --- a
+    ... b
+    ... -----BEGIN PGP SIGNATURE-----
+    ... """)
+    b'--- a\\nb\\n'
+    '''
+    lines = signed.splitlines()
+    try:
+        begin = [line.rstrip() for line in lines].index(b'-----BEGIN PGP SIGNED MESSAGE-----')
+        blank = lines.index(b'', begin)
+        end = [line.rstrip() for line in lines].index(b'-----BEGIN PGP SIGNATURE-----', blank)
+    except ValueError:
+        raise ManifestFormatError('manifest is not a clear-signed message')
+    text = [line[2:] if line.startswith(b'- ') else line for line in lines[blank + 1:end]]
+    return b''.join(line.rstrip(b' \t') + b'\n' for line in text)
+
+def parse_manifest(text):
+    '''
+    Parses the checksum manifest ``text`` and returns a dictionary mapping
+    the ``/``-separated file names in it to ``(algorithm, hexdigest)``
+    tuples. Raises a ManifestFormatError for lines it doesn't understand
+    and for file names that would reach outside of the manifest's
+    directory.
+
+    >>> parse_manifest(b'%s  a.txt\\n%s *dir/b.bin\\n' % (b'0' * 64, b'f' * 64))
+    {'a.txt': ('sha256', '0000000000000000000000000000000000000000000000000000000000000000'), 'dir/b.bin': ('sha256', 'ffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff')}
+    '''
+    entries = dict()
+    for (number, line) in enumerate(text.decode('utf-8').splitlines(), 1):
+        if not line.strip():
+            continue
+        match = _GNU_LINE.match(line)
+        if match:
+            (escaped, digest, name) = match.groups()
+        else:
+            match = _BSD_LINE.match(line)
+            if not match or len(match.group(4)) not in _ALGORITHMS:
+                raise ManifestFormatError('line {}: not a checksum line'.format(number))
+            (escaped, _, name, digest) = match.groups()
+        if escaped:
+            name = _unescape(name)
+        name = _safe_name(name, number)
+        entries[name] = (_ALGORITHMS[len(digest)], digest.lower())
+    return entries
+
+def _unescape(name):
+    '''
+    Undoes the escaping ``sha256sum`` applies to file names that have
+    backslashes or newlines in them.
+    '''
+    return re.sub(r'\\(.)', lambda match: '\n' if match.group(1) == 'n' else match.group(1), name)
+
+def _safe_name(name, number):
+    '''
+    Returns the manifest file name ``name`` normalized to ``/`` separators.
+    Raises a ManifestFormatError for names that are absolute or that climb
+    out of the manifest's directory.
+    '''
+    parts = [part for part in name.replace(os.sep, '/').split('/') if part not in ('', '.')]
+    if not parts or name.startswith('/') or '..' in parts or ':' in parts[0]:
+        raise ManifestFormatError('line {}: unsafe file name {!r}'.format(number, name))
+    return '/'.join(parts)
+
+def _check_files(report, root, entries, jobs):
+    '''
+    Hashes every file in ``entries`` under ``root`` in a thread pool and
+    sorts them in to ``report``. hashlib lets go of the GIL while it hashes,
+    so threads keep every core busy.
+    '''
+    from concurrent import futures
+    start = time.time()
+    names = sorted(entries)
+    with futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        results = executor.map(
+            lambda name: _hash_file(os.path.join(root, *name.split('/')), entries[name][0]),
+            names)
+        for (name, (digest, size, error)) in zip(names, results):
+            if error is not None:
+                if isinstance(error, (FileNotFoundError, NotADirectoryError)):
+                    report.missing.append(name)
+                else:
+                    report.errors[name] = str(error)
+                continue
+            report.bytes += size
+            if digest == entries[name][1]:
+                report.matched.append(name)
+            else:
+                report.mismatched.append(name)
+    report.hash_elapsed = time.time() - start
+
+def _hash_file(path, algorithm):
+    '''
+    Returns a ``(hexdigest, size, error)`` tuple for the file at ``path``.
+    ``error`` is the OSError that stopped the file from being read, if
+    there was one.
+    '''
+    import hashlib
+    digest = hashlib.new(algorithm)
+    try:
+        with open(path, 'rb', buffering=0) as fobj:
+            size = os.fstat(fobj.fileno()).st_size
+            if size >= MMAP_THRESHOLD:
+                import mmap
+                with mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest.update(mapped)
+            else:
+                size = 0
+                chunk = memoryview(bytearray(min(READ_CHUNK_SIZE, MMAP_THRESHOLD)))
+                while True:
+                    count = fobj.readinto(chunk)
+                    if not count:
+                        break
+                    digest.update(chunk[:count])
+                    size += count
+    except (IOError, OSError) as err:
+        return (None, 0, err)
+    return (digest.hexdigest(), size, None)
+
+def _walk(root):
+    '''
+    Yields the ``/``-separated names of all the files under ``root``.
+    '''
+    for (dirpath, _, filenames) in os.walk(root):
+        relative = os.path.relpath(dirpath, root)
+        for fname in filenames:
+            if relative == os.curdir:
+                yield fname
+            else:
+                yield '/'.join(relative.split(os.sep) + [fname])
+
+class ManifestReport(object):
+    '''
+    The outcome of :func:`verify_manifest`. The signature on the manifest
+    was good -- otherwise there wouldn't be a report -- and the files it
+    lists are sorted in to:
+
+    * ``matched`` -- files whose contents match the manifest.
+    * ``mismatched`` -- files whose contents don't.
+    * ``missing`` -- files that are listed but don't exist.
+    * ``extra`` -- files that exist but aren't listed.
+    * ``errors`` -- a dictionary of files that couldn't be read and why.
+
+    ``bytes`` is how much was hashed, ``elapsed`` how long the whole
+    verification took in seconds and ``hash_elapsed`` how much of that was
+    spent hashing.
+    '''
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.matched = list()
+        self.mismatched = list()
+        self.missing = list()
+        self.extra = list()
+        self.errors = dict()
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.hash_elapsed = 0.0
+
+    @property
+    def ok(self):
+        '''
+        True if every listed file matched and there were no other files.
+        '''
+        return not (self.mismatched or self.missing or self.extra or self.errors)
+
+    @property
+    def throughput(self):
+        '''
+        Hashing throughput in MB/s.
+        '''
+        if self.hash_elapsed <= 0:
+            return 0.0
+        return self.bytes / 1e6 / self.hash_elapsed
+
+    def summary(self):
+        '''
+        Returns a one line summary of the report.
+        '''
+        return '{}: {} matched, {} mismatched, {} missing, {} extra, {} unreadable; {:.1f} MB in {:.2f}s ({:.1f} MB/s)'.format(
+            self.manifest, len(self.matched), len(self.mismatched), len(self.missing),
+            len(self.extra), len(self.errors), self.bytes / 1e6, self.elapsed, self.throughput)
+
+class ManifestError(Exception):
+    '''
+    Base class for the errors raised by this module.
+    '''
+    pass
+
+class ManifestFormatError(ManifestError):
+    '''
+    Raised when a checksum manifest can't be parsed or lists file names it
+    has no business listing.
+    '''
+    pass
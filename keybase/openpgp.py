@@ -0,0 +1,794 @@
+'''
+.. module:: openpgp
+   :platform: Unix, Windows
+   :synopsis: Just enough OpenPGP parsing to turn away malformed input before gpg runs.
+
+.. moduleauthor:: Ian Chesal <ian.chesal@gmail.com>
+
+Starting a gpg process costs a few milliseconds no matter how obviously
+broken its input is, so anything that accepts signed messages from the
+outside world can be made to spend its time spawning gpg on garbage. The
+functions here look at the structure of a signed message in Python first:
+the ASCII armor and its CRC24 checksum, the OpenPGP packet framing
+(`RFC 4880 <https://tools.ietf.org/html/rfc4880>`_, section 4) and the
+issuer of the signature. They don't verify anything cryptographically;
+that's still gpg's job. They only reject input that gpg would reject too,
+and signatures by keys that had been revoked or had expired when the
+signature was made.
+
+:func:`keybase.openpgp.precheck_signature` is the entry point and is what
+:class:`keybase.KeybasePublicKey` uses before it verifies anything.
+:func:`keybase.openpgp.key_family` reads a public key bundle the same way
+so the key to encrypt to can be picked without asking gpg.
+'''
+
+#pylint: disable=C0301
+
+import binascii
+
+# Armored payloads larger than this don't have their CRC24 checked. The
+# checksum is computed in Python, so past this size it would cost more than
+# the gpg run it's meant to save. gpg checks it anyway.
+CRC24_CHECK_LIMIT = 64 * 1024
+
+# How much of a compressed data packet is inflated to find the issuer of
+# the signature in it. The one-pass signature packet, when there is one,
+# comes first.
+COMPRESSED_PREFIX_SIZE = 4096
+
+# The most literal_data() will inflate from a compressed message.
+LITERAL_DATA_LIMIT = 1024 * 1024
+
+# Packet tags.
+TAG_SIGNATURE = 2
+TAG_ONE_PASS_SIGNATURE = 4
+TAG_PUBLIC_KEY = 6
+TAG_COMPRESSED_DATA = 8
+TAG_MARKER = 10
+TAG_LITERAL_DATA = 11
+TAG_USER_ID = 13
+TAG_PUBLIC_SUBKEY = 14
+TAG_USER_ATTRIBUTE = 17
+
+# Signature types.
+SIG_CERTIFICATIONS = (0x10, 0x11, 0x12, 0x13)
+SIG_SUBKEY_BINDING = 0x18
+SIG_DIRECT_KEY = 0x1f
+SIG_KEY_REVOCATION = 0x20
+SIG_SUBKEY_REVOCATION = 0x28
+
+# Signature subpacket types.
+SUBPACKET_CREATION_TIME = 2
+SUBPACKET_KEY_EXPIRATION = 9
+SUBPACKET_ISSUER = 16
+SUBPACKET_KEY_FLAGS = 27
+SUBPACKET_ISSUER_FINGERPRINT = 33
+
+# Key flags, from the first octet of the key flags subpacket.
+KEY_FLAG_CERTIFY = 0x01
+KEY_FLAG_SIGN = 0x02
+KEY_FLAG_ENCRYPT_COMMUNICATIONS = 0x04
+KEY_FLAG_ENCRYPT_STORAGE = 0x08
+KEY_FLAG_AUTHENTICATE = 0x20
+
+# What a key can do, by public key algorithm, when no key flags say
+# otherwise: RSA (1), RSA encrypt-only (2), RSA sign-only (3), Elgamal (16),
+# DSA (17), ECDH (18), ECDSA (19), Elgamal encrypt-or-sign (20), EdDSA (22),
+# X25519 (25), X448 (26), Ed25519 (27) and Ed448 (28).
+_ALGORITHM_FLAGS = {
+    1: KEY_FLAG_CERTIFY | KEY_FLAG_SIGN | KEY_FLAG_ENCRYPT_COMMUNICATIONS | KEY_FLAG_ENCRYPT_STORAGE,
+    2: KEY_FLAG_ENCRYPT_COMMUNICATIONS | KEY_FLAG_ENCRYPT_STORAGE,
+    3: KEY_FLAG_CERTIFY | KEY_FLAG_SIGN,
+    16: KEY_FLAG_ENCRYPT_COMMUNICATIONS | KEY_FLAG_ENCRYPT_STORAGE,
+    17: KEY_FLAG_CERTIFY | KEY_FLAG_SIGN,
+    18: KEY_FLAG_ENCRYPT_COMMUNICATIONS | KEY_FLAG_ENCRYPT_STORAGE,
+    19: KEY_FLAG_CERTIFY | KEY_FLAG_SIGN,
+    20: KEY_FLAG_CERTIFY | KEY_FLAG_SIGN | KEY_FLAG_ENCRYPT_COMMUNICATIONS | KEY_FLAG_ENCRYPT_STORAGE,
+    22: KEY_FLAG_CERTIFY | KEY_FLAG_SIGN,
+    25: KEY_FLAG_ENCRYPT_COMMUNICATIONS | KEY_FLAG_ENCRYPT_STORAGE,
+    26: KEY_FLAG_ENCRYPT_COMMUNICATIONS | KEY_FLAG_ENCRYPT_STORAGE,
+    27: KEY_FLAG_CERTIFY | KEY_FLAG_SIGN,
+    28: KEY_FLAG_CERTIFY | KEY_FLAG_SIGN,
+}
+
+_CRC24_INIT = 0xb704ce
+_CRC24_POLY = 0x1864cfb
+
+def _crc24_table():
+    '''
+    Builds the byte-at-a-time lookup table for :func:`crc24`.
+    '''
+    table = list()
+    for byte in range(256):
+        crc = byte << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= _CRC24_POLY
+        table.append(crc & 0xffffff)
+    return tuple(table)
+
+_CRC24_TABLE = _crc24_table()
+
+def crc24(data):
+    '''
+    Returns the OpenPGP CRC24 checksum of ``data``, as used in ASCII armor.
+
+    >>> hex(crc24(b''))
+    '0xb704ce'
+    >>> hex(crc24(b'Hello, world!'))
+    '0x1bdf82'
+    '''
+    crc = _CRC24_INIT
+    table = _CRC24_TABLE
+    for byte in bytes(data):
+        crc = ((crc << 8) & 0xffffff) ^ table[(crc >> 16) ^ byte]
+    return crc
+
+def dearmor(data, label=None):
+    '''
+    Decodes the first ASCII armored block in ``data`` and returns a
+    ``(label, headers, payload)`` tuple: the label from the BEGIN line,
+    e.g. ``'PGP SIGNATURE'``, a dictionary of the armor headers and the
+    decoded binary payload.
+
+    >>> block = b"""-----BEGIN PGP MESSAGE-----
+    ... Version: example
+    ...
+    ... SGVsbG8sIHdvcmxkIQ==
+    ... =G9+C
+    ... -----END PGP MESSAGE-----
+    ... """
+    >>> dearmor(block)
+    ('PGP MESSAGE', {'Version': 'example'}, b'Hello, world!')
+
+    If ``label`` is given the block must carry that label. Anything before
+    the BEGIN line is ignored, like gpg does. An OpenPGPFormatError is
+    raised if there's no complete armored block, the base64 doesn't
+    decode or the checksum, when there is one, doesn't match.
+    '''
+    data = bytes(data)
+    begin = data.find(b'-----BEGIN PGP ')
+    if begin < 0:
+        raise OpenPGPFormatError('no armored data found')
+    line_end = data.find(b'\n', begin)
+    if line_end < 0:
+        raise OpenPGPFormatError('truncated armor header line')
+    begin_line = data[begin:line_end].strip()
+    if not begin_line.endswith(b'-----'):
+        raise OpenPGPFormatError('malformed armor header line')
+    found_label = begin_line[len(b'-----BEGIN '):-len(b'-----')].decode('ascii', 'replace')
+    if label is not None and found_label != label:
+        raise OpenPGPFormatError('expected {} armor, found {}'.format(label, found_label))
+    tail = '-----END {}-----'.format(found_label).encode('ascii')
+    end = data.find(tail, line_end)
+    if end < 0:
+        raise OpenPGPFormatError('missing armor tail line')
+    lines = [line.strip() for line in data[line_end + 1:end].split(b'\n')]
+    headers = dict()
+    # Armor headers run up to the first blank line. Be as forgiving as gpg
+    # is about the blank line being missing when there are no headers.
+    if lines and b':' in lines[0]:
+        while lines and lines[0]:
+            (key, separator, value) = lines.pop(0).partition(b':')
+            if not separator:
+                raise OpenPGPFormatError('malformed armor header')
+            headers[key.strip().decode('utf-8', 'replace')] = value.strip().decode('utf-8', 'replace')
+    lines = [line for line in lines if line]
+    checksum = None
+    if lines and lines[-1].startswith(b'='):
+        checksum = lines.pop()[1:]
+    try:
+        payload = binascii.a2b_base64(b''.join(lines))
+        if checksum is not None:
+            if len(checksum) != 4:
+                raise OpenPGPFormatError('malformed armor checksum')
+            checksum = int(binascii.hexlify(binascii.a2b_base64(checksum)), 16)
+    except (binascii.Error, ValueError):
+        raise OpenPGPFormatError('invalid base64 in armor')
+    if checksum is not None and len(payload) <= CRC24_CHECK_LIMIT and crc24(payload) != checksum:
+        raise OpenPGPFormatError('armor checksum mismatch')
+    return (found_label, headers, payload)
+
+def packets(data, partial=False):
+    '''
+    Walks the OpenPGP packets in the binary ``data`` and yields a ``(tag,
+    body)`` tuple for each of them. ``body`` is a memoryview in to
+    ``data`` unless the packet used partial body lengths, in which case
+    the pieces are joined in to a new ``bytes`` object.
+
+    >>> list((tag, bytes(body)) for (tag, body) in packets(b'\\xcb\\x03abc\\xa8\\x03PGP'))
+    [(11, b'abc'), (10, b'PGP')]
+
+    An OpenPGPFormatError is raised if the data isn't a well-formed
+    sequence of packets. With ``partial=True`` the walk stops quietly at a
+    packet that runs off the end of ``data`` instead, for looking at the
+    start of a longer stream.
+    '''
+    view = memoryview(data).cast('B')
+    pos = 0
+    size = len(view)
+    if size == 0:
+        raise OpenPGPFormatError('no OpenPGP data')
+    while pos < size:
+        ctb = view[pos]
+        if not ctb & 0x80:
+            raise OpenPGPFormatError('invalid packet header at offset {}'.format(pos))
+        pos += 1
+        chunks = None
+        if ctb & 0x40:
+            tag = ctb & 0x3f
+            (length, pos, more) = _new_length(view, pos)
+            if more:
+                chunks = list()
+                while more:
+                    if length is None or pos + length > size:
+                        break
+                    chunks.append(view[pos:pos + length])
+                    pos += length
+                    (length, pos, more) = _new_length(view, pos)
+        else:
+            tag = (ctb >> 2) & 0x0f
+            length_type = ctb & 0x03
+            if length_type == 3:
+                length = size - pos
+            else:
+                width = 1 << length_type
+                length = None if pos + width > size else int.from_bytes(view[pos:pos + width], 'big')
+                pos += width
+        if length is None or pos + length > size:
+            if partial:
+                return
+            raise OpenPGPFormatError('truncated packet at offset {}'.format(pos))
+        if tag == 0:
+            raise OpenPGPFormatError('reserved packet tag at offset {}'.format(pos))
+        body = view[pos:pos + length]
+        pos += length
+        if chunks is not None:
+            chunks.append(body)
+            body = b''.join(chunks)
+        yield (tag, body)
+
+def _new_length(view, pos):
+    '''
+    Reads a new format packet length at ``pos`` in ``view``. Returns the
+    ``(length, position after it, partial)`` tuple, with a length of None
+    if the length itself is truncated.
+    '''
+    if pos >= len(view):
+        return (None, pos, False)
+    first = view[pos]
+    if first < 192:
+        return (first, pos + 1, False)
+    if first < 224:
+        if pos + 2 > len(view):
+            return (None, pos, False)
+        return (((first - 192) << 8) + view[pos + 1] + 192, pos + 2, False)
+    if first == 255:
+        if pos + 5 > len(view):
+            return (None, pos, False)
+        return (int.from_bytes(view[pos + 1:pos + 5], 'big'), pos + 5, False)
+    return (1 << (first & 0x1f), pos + 1, True)
+
+def signature_issuers(body):
+    '''
+    Returns the key IDs, as 16 character upper case hex strings, that a
+    signature packet ``body`` names as its issuer. Version 3 signatures
+    carry one key ID; version 4 and 5 signatures carry it, or the issuer's
+    fingerprint, in their subpackets. An empty list comes back if the
+    signature doesn't say who made it.
+    '''
+    body = bytes(body)
+    if not body:
+        raise OpenPGPFormatError('empty signature packet')
+    version = body[0]
+    if version in (2, 3):
+        if len(body) < 19 or body[1] != 5:
+            raise OpenPGPFormatError('malformed version 3 signature packet')
+        return [_hex(body[7:15])]
+    issuers = list()
+    for area in _subpacket_areas(body):
+        issuers.extend(_subpacket_issuers(area))
+    return issuers
+
+def _subpacket_areas(body):
+    '''
+    Returns the hashed and unhashed subpacket areas of the version 4 or 5
+    signature packet ``body`` as a tuple of two ``bytes`` objects.
+    '''
+    if body[0] not in (4, 5):
+        raise OpenPGPFormatError('unsupported signature packet version {}'.format(body[0]))
+    areas = list()
+    pos = 4
+    for _ in range(2):
+        if pos + 2 > len(body):
+            raise OpenPGPFormatError('truncated signature packet')
+        length = int.from_bytes(body[pos:pos + 2], 'big')
+        pos += 2
+        if pos + length > len(body):
+            raise OpenPGPFormatError('truncated signature subpackets')
+        areas.append(body[pos:pos + length])
+        pos += length
+    return tuple(areas)
+
+def _subpackets(data):
+    '''
+    Yields a ``(type, value)`` tuple for each subpacket in the signature
+    subpacket area ``data``, with the critical bit masked off the type.
+    '''
+    pos = 0
+    while pos < len(data):
+        first = data[pos]
+        if first < 192:
+            (length, pos) = (first, pos + 1)
+        elif first < 255:
+            if pos + 2 > len(data):
+                raise OpenPGPFormatError('malformed signature subpacket')
+            (length, pos) = (((first - 192) << 8) + data[pos + 1] + 192, pos + 2)
+        else:
+            if pos + 5 > len(data):
+                raise OpenPGPFormatError('malformed signature subpacket')
+            (length, pos) = (int.from_bytes(data[pos + 1:pos + 5], 'big'), pos + 5)
+        if length == 0 or pos + length > len(data):
+            raise OpenPGPFormatError('malformed signature subpacket')
+        yield (data[pos] & 0x7f, data[pos + 1:pos + length])
+        pos += length
+
+def _subpacket_issuers(data):
+    '''
+    Returns the issuer key IDs found in the signature subpacket area
+    ``data``.
+    '''
+    issuers = list()
+    for (kind, value) in _subpackets(data):
+        if kind == SUBPACKET_ISSUER and len(value) == 8:
+            issuers.append(_hex(value))
+        elif kind == SUBPACKET_ISSUER_FINGERPRINT and len(value) == 21:
+            issuers.append(_hex(value[-8:] if value[0] == 4 else value[1:9]))
+        elif kind == SUBPACKET_ISSUER_FINGERPRINT and len(value) == 33:
+            issuers.append(_hex(value[1:9]))
+    return issuers
+
+def one_pass_issuer(body):
+    '''
+    Returns the key ID a one-pass signature packet ``body`` names.
+    '''
+    body = bytes(body)
+    if len(body) != 13 or body[0] != 3:
+        raise OpenPGPFormatError('malformed one-pass signature packet')
+    return _hex(body[4:12])
+
+def fingerprints(bundle):
+    '''
+    Returns the fingerprints of the primary key and every subkey in the
+    public key ``bundle``, armored or binary, as a tuple of upper case hex
+    strings with the primary key first: the SHA-1 fingerprint for version
+    4 keys and the SHA-256 fingerprint for version 5 keys. Version 3 keys
+    are skipped. Only the first armored block of an armored bundle is
+    looked at.
+    '''
+    prints = list()
+    for (tag, body) in packets(_binary_bundle(bundle)):
+        if tag in (TAG_PUBLIC_KEY, TAG_PUBLIC_SUBKEY):
+            fingerprint = _fingerprint(body)
+            if fingerprint is not None:
+                prints.append(fingerprint)
+    return tuple(prints)
+
+def _binary_bundle(bundle):
+    '''
+    Returns the public key ``bundle`` as binary packets, dearmoring it if
+    it's armored.
+    '''
+    if isinstance(bundle, str):
+        bundle = bundle.encode('utf-8')
+    bundle = bytes(bundle)
+    if not bundle[:1] or not bundle[0] & 0x80:
+        bundle = dearmor(bundle, 'PGP PUBLIC KEY BLOCK')[2]
+    return bundle
+
+def _fingerprint(body):
+    '''
+    Returns the fingerprint of the public key or subkey packet ``body``, or
+    None for a version 3 or unknown version key.
+    '''
+    import hashlib
+    body = bytes(body)
+    if body[:1] == b'\x04':
+        return _hex(hashlib.sha1(b'\x99' + len(body).to_bytes(2, 'big') + body).digest())
+    if body[:1] == b'\x05':
+        return _hex(hashlib.sha256(b'\x9a' + len(body).to_bytes(4, 'big') + body).digest())
+    return None
+
+def key_ids(bundle):
+    '''
+    Returns the key IDs of the primary key and every subkey in the public
+    key ``bundle``, armored or binary, as a tuple of 16 character upper
+    case hex strings with the primary key first. Keys are identified the
+    way gpg does it: a version 4 key's ID is the low 64 bits of its SHA-1
+    fingerprint and a version 5 key's is the high 64 bits of its SHA-256
+    fingerprint. Version 3 keys are skipped.
+    '''
+    return tuple(_key_id(fpr) for fpr in fingerprints(bundle))
+
+def _key_id(fingerprint):
+    '''
+    Returns the key ID for the hex ``fingerprint`` of a version 4 or 5 key.
+    '''
+    return fingerprint[-16:] if len(fingerprint) == 40 else fingerprint[:16]
+
+def key_family(bundle):
+    '''
+    Parses the first key in the public key ``bundle``, armored or binary,
+    in to a tuple of :class:`OpenPGPKey` objects: the primary key followed
+    by its subkeys. Each one knows what it can be used for, when it
+    expires and whether it has been revoked, from the newest self-signature
+    or binding signature the primary key made over it.
+
+    None of the signatures are checked cryptographically. A forged binding
+    can make a subkey look usable here but gpg still checks the binding
+    before it uses the key, so the worst that can come of it is gpg
+    refusing the key it was handed. Version 3 keys are skipped and an
+    OpenPGPFormatError is raised if there's no key at all.
+    '''
+    family = list()
+    current = None
+    for (tag, body) in packets(_binary_bundle(bundle)):
+        if tag == TAG_PUBLIC_KEY and family:
+            break
+        if tag in (TAG_PUBLIC_KEY, TAG_PUBLIC_SUBKEY):
+            current = _parse_key(body, tag == TAG_PUBLIC_KEY)
+            if current is not None and (family or current.primary):
+                family.append(current)
+            else:
+                current = None
+        elif tag in (TAG_USER_ID, TAG_USER_ATTRIBUTE):
+            current = family[0] if family else None
+        elif tag == TAG_SIGNATURE and current is not None:
+            _apply_self_signature(family[0], current, bytes(body))
+    if not family:
+        raise OpenPGPFormatError('no public key found')
+    return tuple(family)
+
+def _parse_key(body, primary):
+    '''
+    Returns an :class:`OpenPGPKey` for the public key or subkey packet
+    ``body``, or None if it's a version 3 or unknown version key.
+    '''
+    fingerprint = _fingerprint(body)
+    if fingerprint is None:
+        return None
+    if len(body) < 6:
+        raise OpenPGPFormatError('truncated public key packet')
+    return OpenPGPKey(fingerprint, body[5], int.from_bytes(body[1:5], 'big'), primary)
+
+def _apply_self_signature(primary, key, body):
+    '''
+    Updates ``key`` with what the signature packet ``body`` says about it,
+    if ``primary`` made the signature and it's a kind of signature that
+    has a say in the key's flags, expiration or revocation.
+    '''
+    if not body or body[0] not in (4, 5):
+        return
+    sigtype = body[1]
+    if key.primary:
+        if sigtype not in SIG_CERTIFICATIONS + (SIG_DIRECT_KEY, SIG_KEY_REVOCATION):
+            return
+    elif sigtype not in (SIG_SUBKEY_BINDING, SIG_SUBKEY_REVOCATION):
+        return
+    (hashed, unhashed) = _subpacket_areas(body)
+    issuers = _subpacket_issuers(hashed) + _subpacket_issuers(unhashed)
+    if issuers and primary.key_id not in issuers:
+        return
+    if sigtype in (SIG_KEY_REVOCATION, SIG_SUBKEY_REVOCATION):
+        key.revoked = True
+        return
+    (created, expiration, flags) = (0, 0, None)
+    for (kind, value) in _subpackets(hashed):
+        if kind == SUBPACKET_CREATION_TIME and len(value) == 4:
+            created = int.from_bytes(value, 'big')
+        elif kind == SUBPACKET_KEY_EXPIRATION and len(value) == 4:
+            expiration = int.from_bytes(value, 'big')
+        elif kind == SUBPACKET_KEY_FLAGS and value:
+            flags = value[0]
+    if created < key.signed:
+        return
+    key.signed = created
+    key.expires = key.created + expiration if expiration else None
+    if flags is not None:
+        key.flags = flags
+
+def encryption_key(family, now=None):
+    '''
+    Returns the key from the :func:`key_family` tuple ``family`` that data
+    should be encrypted to, the same one gpg would pick: the newest subkey
+    that can encrypt and is neither expired nor revoked at ``now``, a Unix
+    time that defaults to the current time. The primary key is only picked
+    if no subkey will do. Returns None if no key in the family can be
+    encrypted to, which is always the case once the primary key has
+    expired or been revoked.
+    '''
+    if not family or not family[0].usable(now):
+        return None
+    candidates = [key for key in family if key.can_encrypt and key.usable(now)]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda key: (not key.primary, key.created))
+
+def signing_key_ids(family):
+    '''
+    Returns the key IDs of the keys in the :func:`key_family` tuple
+    ``family`` that signatures can come from: the primary key and the
+    subkeys that are allowed to sign.
+    '''
+    return tuple(key.key_id for key in family if key.primary or key.can_sign)
+
+def check_signers(family, issuers, made=None):
+    '''
+    Checks that the signatures naming the key IDs in ``issuers``, made at
+    the Unix time ``made`` if it's known, could have been made by a key in
+    the :func:`key_family` tuple ``family`` that was in force at the time.
+
+    An OpenPGPRevokedError is raised if the primary key has been revoked,
+    or every key named has been. An OpenPGPExpiredError is raised if every
+    key named had expired, itself or through the primary key, by the time
+    the signature was made. A signature made before its key expired is
+    still good, as it is to gpg, so without ``made`` expiry isn't checked.
+    '''
+    primary = family[0]
+    if primary.revoked:
+        raise OpenPGPRevokedError('key {} has been revoked'.format(primary.key_id))
+    signers = [key for key in family if key.key_id in issuers]
+    if not signers:
+        return
+    if all(key.revoked for key in signers):
+        raise OpenPGPRevokedError('key {} has been revoked'.format(signers[0].key_id))
+    if made is not None and all(key.expired(made) or primary.expired(made) for key in signers):
+        raise OpenPGPExpiredError('key {} had expired when the signature was made'.format(signers[0].key_id))
+
+def signature_created(body):
+    '''
+    Returns the Unix time the signature packet ``body`` says it was made
+    at, or None if it doesn't say.
+    '''
+    body = bytes(body)
+    if len(body) >= 7 and body[0] in (2, 3):
+        return int.from_bytes(body[3:7], 'big')
+    for (kind, value) in _subpackets(_subpacket_areas(body)[0]):
+        if kind == SUBPACKET_CREATION_TIME and len(value) == 4:
+            return int.from_bytes(value, 'big')
+    return None
+
+def precheck_signature(data, allowed_ids=None, family=None):
+    '''
+    Checks that ``data`` is structurally a signed OpenPGP message or
+    signature: a clear-signed text, an armored message or signature, or
+    binary packets. Returns the list of issuer key IDs found.
+
+    Raises an OpenPGPFormatError if the armor, its checksum or the packet
+    framing is broken or there's no signature in it at all. If
+    ``allowed_ids`` is given and the signatures name issuers but none of
+    them are in ``allowed_ids`` an OpenPGPIssuerError is raised. If the
+    :func:`key_family` tuple ``family`` is given the issuers are checked
+    against it with :func:`check_signers`, using the newest creation time
+    of the signatures that could be read.
+
+    A message in a compressed data packet only has the start of the packet
+    inflated, enough to find its one-pass signature packet. The rest of it
+    is left to gpg.
+    '''
+    view = memoryview(data).cast('B')
+    start = 0
+    while start < len(view) and view[start] in b' \t\r\n':
+        start += 1
+    if start == len(view):
+        raise OpenPGPFormatError('no OpenPGP data')
+    if view[start] & 0x80:
+        binary = view[start:]
+    else:
+        text = bytes(view)
+        begin = text.find(b'-----BEGIN PGP SIGNED MESSAGE-----')
+        if begin >= 0:
+            signature = text.find(b'-----BEGIN PGP SIGNATURE-----', begin)
+            if signature < 0:
+                raise OpenPGPFormatError('clear-signed message without a signature')
+            binary = dearmor(text[signature:], 'PGP SIGNATURE')[2]
+        else:
+            (label, _, binary) = dearmor(text)
+            if label not in ('PGP MESSAGE', 'PGP SIGNATURE'):
+                raise OpenPGPFormatError('{} is not a signed message'.format(label))
+    issuers = list()
+    created = list()
+    signed = _collect_issuers(binary, issuers, created, partial=False)
+    if not signed:
+        raise OpenPGPFormatError('no signature found')
+    if allowed_ids is not None and issuers:
+        allowed = set(keyid.upper() for keyid in allowed_ids)
+        if not allowed.intersection(issuers):
+            raise OpenPGPIssuerError('signed by {}'.format(', '.join(issuers)))
+    if family:
+        check_signers(family, issuers, max(created) if created else None)
+    return issuers
+
+def _collect_issuers(data, issuers, created, partial):
+    '''
+    Adds the issuers of the signatures in the packets in ``data`` to
+    ``issuers``, and the times the signatures were made to ``created``,
+    looking inside compressed data packets. Returns True if there was at
+    least one signature or one-pass signature packet.
+    '''
+    signed = False
+    for (tag, body) in packets(data, partial=partial):
+        if tag == TAG_SIGNATURE:
+            signed = True
+            issuers.extend(signature_issuers(body))
+            when = signature_created(body)
+            if when is not None:
+                created.append(when)
+        elif tag == TAG_ONE_PASS_SIGNATURE:
+            signed = True
+            issuers.append(one_pass_issuer(body))
+        elif tag == TAG_COMPRESSED_DATA:
+            signed = _collect_issuers(_inflate_prefix(body), issuers, created, partial=True) or signed
+    return signed
+
+def literal_data(data, limit=LITERAL_DATA_LIMIT):
+    '''
+    Returns the contents of the literal data packet in the armored or
+    binary signed message ``data``: what was signed, without checking the
+    signature. Compressed messages are inflated, up to ``limit`` bytes.
+    Raises an OpenPGPFormatError if there's no literal data packet.
+
+    >>> literal_data(b'\\xcb\\x13b\\x00\\x00\\x00\\x00\\x00Hello, world!')
+    b'Hello, world!'
+    '''
+    view = memoryview(data).cast('B')
+    if len(view) and not view[0] & 0x80:
+        view = dearmor(view, 'PGP MESSAGE')[2]
+    return _find_literal(view, limit, partial=False)
+
+def _find_literal(data, limit, partial):
+    '''
+    Returns the contents of the first literal data packet in the packets in
+    ``data``, looking inside compressed data packets.
+    '''
+    for (tag, body) in packets(data, partial=partial):
+        if tag == TAG_LITERAL_DATA:
+            if len(body) < 2 or len(body) < 6 + body[1]:
+                raise OpenPGPFormatError('truncated literal data packet')
+            return bytes(body[6 + body[1]:])
+        if tag == TAG_COMPRESSED_DATA:
+            return _find_literal(_inflate_prefix(body, limit), limit, partial=True)
+    raise OpenPGPFormatError('no literal data found')
+
+def _inflate_prefix(body, limit=COMPRESSED_PREFIX_SIZE):
+    '''
+    Returns up to ``limit`` bytes of the decompressed contents of a
+    compressed data packet ``body``.
+    '''
+    import zlib
+    if not len(body):
+        raise OpenPGPFormatError('empty compressed data packet')
+    algorithm = body[0]
+    compressed = bytes(body[1:1 + limit * 4])
+    try:
+        if algorithm == 0:
+            return compressed[:limit]
+        if algorithm == 1:
+            return zlib.decompressobj(-15).decompress(compressed, limit)
+        if algorithm == 2:
+            return zlib.decompressobj().decompress(compressed, limit)
+        if algorithm == 3:
+            import bz2
+            return bz2.BZ2Decompressor().decompress(compressed, limit)
+    except (zlib.error, OSError, EOFError):
+        raise OpenPGPFormatError('corrupt compressed data packet')
+    raise OpenPGPFormatError('unknown compression algorithm {}'.format(algorithm))
+
+def _hex(data):
+    '''
+    Returns ``data`` as upper case hex.
+    '''
+    return binascii.hexlify(bytes(data)).decode('ascii').upper()
+
+class OpenPGPKey(object):
+    '''
+    One key in a key family parsed by :func:`key_family`: the primary key
+    or one of its subkeys.
+
+    ``fingerprint`` and ``key_id`` are upper case hex, ``algorithm`` is the
+    OpenPGP public key algorithm number and ``created`` and ``expires`` are
+    Unix times, with an ``expires`` of None for keys that don't expire.
+    ``flags`` are the key flags from the newest self-signature, or None if
+    it didn't have any, in which case ``usage`` falls back to what the
+    algorithm is capable of. ``signed`` is when that self-signature was
+    made.
+    '''
+    def __init__(self, fingerprint, algorithm, created, primary):
+        self.fingerprint = fingerprint
+        self.key_id = _key_id(fingerprint)
+        self.algorithm = algorithm
+        self.created = created
+        self.primary = primary
+        self.expires = None
+        self.flags = None
+        self.revoked = False
+        self.signed = -1
+
+    def __repr__(self):
+        return '<OpenPGPKey {} {}{}>'.format(
+            self.key_id, 'primary' if self.primary else 'subkey', ' revoked' if self.revoked else '')
+
+    @property
+    def usage(self):
+        '''
+        The key flags that say what this key can be used for.
+        '''
+        if self.flags is not None:
+            return self.flags
+        return _ALGORITHM_FLAGS.get(self.algorithm, 0)
+
+    @property
+    def can_encrypt(self):
+        '''
+        True if data can be encrypted to this key.
+        '''
+        return bool(self.usage & (KEY_FLAG_ENCRYPT_COMMUNICATIONS | KEY_FLAG_ENCRYPT_STORAGE))
+
+    @property
+    def can_sign(self):
+        '''
+        True if this key can make data signatures.
+        '''
+        return bool(self.usage & KEY_FLAG_SIGN)
+
+    def expired(self, now=None):
+        '''
+        True if the key has expired at ``now``, a Unix time that defaults to
+        the current time.
+        '''
+        if self.expires is None:
+            return False
+        if now is None:
+            import time
+            now = time.time()
+        return now >= self.expires
+
+    def usable(self, now=None):
+        '''
+        True if the key is neither revoked nor expired at ``now``.
+        '''
+        return not self.revoked and not self.expired(now)
+
+class OpenPGPError(Exception):
+    '''
+    The base class for the errors raised when input fails the structural
+    checks in :mod:`keybase.openpgp`.
+    '''
+    pass
+
+class OpenPGPFormatError(OpenPGPError):
+    '''
+    Thrown when input isn't well-formed ASCII armor or OpenPGP packets, or
+    isn't a signature at all.
+    '''
+    pass
+
+class OpenPGPIssuerError(OpenPGPError):
+    '''
+    Thrown when a signature was made by a key other than the one it's
+    being checked against.
+    '''
+    pass
+
+class OpenPGPRevokedError(OpenPGPError):
+    '''
+    Thrown when a signature was made by a key that has been revoked.
+    '''
+    pass
+
+class OpenPGPExpiredError(OpenPGPError):
+    '''
+    Thrown when a signature was made by a key that had already expired.
+    '''
+    pass
@@ -0,0 +1,347 @@
+'''
+.. module:: proofs
+   :platform: Unix, Windows
+   :synopsis: Check that the identity proofs of Keybase users are still live.
+
+.. moduleauthor:: Ian Chesal <ian.chesal@gmail.com>
+
+Keybase users prove they own accounts elsewhere -- on GitHub, Twitter, a
+web site and so on -- by posting a statement signed with their key where
+only the owner of that account could have put it. keybase.io lists the
+proofs in every user object but whether they're still there, and still
+say what they should, can only be found out by fetching them. One at a
+time that takes as long as the slowest web sites involved, so
+:class:`ProofChecker` fetches them concurrently, a bounded number at a
+time and only a few at a time from any one host::
+
+    from keybase import keybase, proofs
+
+    checker = proofs.ProofChecker()
+    for result in checker.check(keybase.discover(keybase.GITHUB, ['ianchesal'])):
+        print(result.username, result.proof_type, result.nametag, result.status)
+
+A proof passes when the page at its ``proof_url`` holds a signed
+statement that verifies with the user's key and binds that key and
+Keybase username to the account the proof is for. Results are cached for
+``PROOF_CACHE_TTL`` seconds.
+'''
+
+#pylint: disable=C0301
+
+import time
+
+from keybase import keybase
+
+# How long, in seconds, a proof check result is trusted by ProofCache.
+PROOF_CACHE_TTL = 3600
+
+# The most that's read of any one proof page.
+PROOF_MAX_SIZE = 1024 * 1024
+
+# Proofs that can't be checked over HTTP.
+_UNSUPPORTED = ('dns',)
+
+def user_proofs(kbase):
+    '''
+    Returns the proofs listed in the user object of the
+    :class:`keybase.Keybase` instance ``kbase``, as the dictionaries
+    keybase.io keeps under ``proofs_summary``. The section is fetched if
+    ``kbase`` was built without it.
+    '''
+    summary = kbase._section('proofs_summary') or dict()
+    return list(summary.get('all') or ())
+
+def statement_matches(statement, username, fingerprint, proof):
+    '''
+    Returns None if the decoded JSON Keybase ``statement`` binds the key
+    with ``fingerprint`` and the Keybase ``username`` to the account named
+    in ``proof``, or a status message saying why it doesn't: ``wrong key``
+    or ``wrong account``.
+
+    >>> statement = {'body': {'key': {'fingerprint': 'ABCD', 'username': 'irc'},
+    ...                       'service': {'name': 'github', 'username': 'ianchesal'}}}
+    >>> statement_matches(statement, 'irc', 'abcd', {'proof_type': 'github', 'nametag': 'IanChesal'}) is None
+    True
+    >>> statement_matches(statement, 'irc', 'abcd', {'proof_type': 'github', 'nametag': 'octocat'})
+    'wrong account'
+    '''
+    body = statement.get('body') if isinstance(statement, dict) else None
+    if not isinstance(body, dict):
+        return 'wrong account'
+    key = body.get('key') or dict()
+    if (key.get('fingerprint') or '').lower() != fingerprint.lower():
+        return 'wrong key'
+    if (key.get('username') or '').lower() != username.lower():
+        return 'wrong account'
+    service = body.get('service') or dict()
+    account = service.get('username') or service.get('hostname') or service.get('domain') or ''
+    if account.lower() != (proof.get('nametag') or '').lower():
+        return 'wrong account'
+    return None
+
+def signed_statement(page):
+    '''
+    Returns the first armored ``PGP MESSAGE`` block in the proof ``page``,
+    as bytes, or None if there isn't one. HTML escaping is undone first
+    since most proofs are posted on web pages.
+    '''
+    import html
+    text = html.unescape(page.decode('utf-8', 'replace'))
+    begin = text.find('-----BEGIN PGP MESSAGE-----')
+    end = text.find('-----END PGP MESSAGE-----', begin)
+    if begin < 0 or end < 0:
+        return None
+    lines = text[begin:end + len('-----END PGP MESSAGE-----')].splitlines()
+    return '\n'.join(line.strip() for line in lines).encode('ascii', 'replace') + b'\n'
+
+class ProofChecker(object):
+    '''
+    Checks the identity proofs of Keybase users. Up to ``max_workers``
+    proof pages are fetched at once and no more than ``per_host`` of them
+    from any one host, so a user with many proofs on one site, or many
+    users on the same site, don't hammer it. Results are kept in
+    ``cache``, a :class:`ProofCache` by default; pass None to check every
+    proof every time.
+
+    Pages are fetched with the transport installed with
+    :func:`keybase.set_transport`, if there is one, and the keybase.io API
+    timeouts. The checker can be used from several threads at once.
+    '''
+    def __init__(self, max_workers=16, per_host=4, cache=False):
+        import threading
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.cache = ProofCache() if cache is False else cache
+        self._lock = threading.Lock()
+        # Host -> [semaphore, fetches waiting for or holding a slot]. A host
+        # is dropped once no fetch needs it, so the table only ever holds
+        # the hosts being fetched from right now.
+        self.__hosts = dict()
+
+    def check(self, users):
+        '''
+        Checks every proof of every :class:`keybase.Keybase` in ``users``
+        and returns a list of :class:`ProofResult` objects, grouped by user
+        in the order the users came in.
+        '''
+        from concurrent import futures
+        work = list()
+        for kbase in users:
+            for proof in user_proofs(kbase):
+                work.append((kbase, proof))
+        if not work:
+            return list()
+        with futures.ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(work)))) as executor:
+            return list(executor.map(lambda item: self.check_proof(*item), work))
+
+    def check_proof(self, kbase, proof):
+        '''
+        Checks the single ``proof``, one of the dictionaries returned by
+        :func:`user_proofs`, of the :class:`keybase.Keybase` ``kbase`` and
+        returns a :class:`ProofResult`.
+        '''
+        key = (kbase.username, proof.get('sig_id') or proof.get('proof_url'))
+        if self.cache is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                return result
+        result = ProofResult(kbase.username, proof)
+        start = time.time()
+        result.status = self.__check(kbase, proof)
+        result.elapsed = time.time() - start
+        result.checked = time.time()
+        if self.cache is not None and result.status != 'unreachable':
+            self.cache.put(key, result)
+        return result
+
+    def __check(self, kbase, proof):
+        '''
+        Fetches and checks ``proof`` and returns the status of the result.
+        '''
+        import json
+        if proof.get('proof_type') in _UNSUPPORTED or not proof.get('proof_url'):
+            return 'unsupported'
+        try:
+            page = self.__fetch(proof['proof_url'])
+        except ProofFetchError as err:
+            return str(err)
+        statement = signed_statement(page)
+        if statement is None:
+            return 'no statement'
+        pkey = kbase.get_public_key()
+        if pkey is None:
+            return 'no key'
+        try:
+            pkey.verify_bytes(statement, throw_error=True)
+        except keybase.KeybasePublicKeyVerifyError:
+            return 'bad signature'
+        from keybase import openpgp
+        try:
+            decoded = json.loads(openpgp.literal_data(statement).decode('utf-8'))
+        except (openpgp.OpenPGPError, ValueError):
+            return 'bad statement'
+        return statement_matches(decoded, kbase.username, pkey.key_fingerprint, proof) or 'ok'
+
+    def __fetch(self, url):
+        '''
+        Returns up to ``PROOF_MAX_SIZE`` bytes of the page at ``url``,
+        holding one of the slots for its host while it's fetched. Raises a
+        ProofFetchError with the status to report if it can't be fetched.
+        '''
+        import requests
+        from urllib.parse import urlparse
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            entry = self.__hosts.get(host)
+            if entry is None:
+                import threading
+                entry = self.__hosts[host] = [threading.BoundedSemaphore(max(1, self.per_host)), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                try:
+                    resp = keybase._send('get', url, None, stream=True)
+                    try:
+                        if resp.status_code in (404, 410):
+                            raise ProofFetchError('not found')
+                        resp.raise_for_status()
+                        page = bytearray()
+                        for chunk in resp.iter_content(chunk_size=keybase.JSON_STREAM_CHUNK_SIZE):
+                            page.extend(chunk)
+                            if len(page) >= PROOF_MAX_SIZE:
+                                break
+                        return bytes(page[:PROOF_MAX_SIZE])
+                    finally:
+                        resp.close()
+                except requests.exceptions.RequestException:
+                    raise ProofFetchError('unreachable')
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.__hosts[host]
+
+class ProofResult(object):
+    '''
+    The outcome of checking one proof of ``username``. ``proof`` is the
+    proof as keybase.io lists it and ``status`` is one of:
+
+    * ``ok`` -- the proof is live and binds the user's key to the account.
+    * ``not found`` -- the proof has been taken down.
+    * ``unreachable`` -- the proof couldn't be fetched. These results
+      aren't cached.
+    * ``no statement`` -- there's no signed statement at the proof's URL.
+    * ``bad signature`` -- the statement isn't signed by the user's key.
+    * ``bad statement`` -- the signed statement can't be read.
+    * ``wrong key`` or ``wrong account`` -- the statement is signed by the
+      user but binds a different key or a different account.
+    * ``no key`` -- the user has no key to check the statement with.
+    * ``unsupported`` -- the proof can't be checked over HTTP, like DNS
+      proofs.
+
+    ``checked`` is when the check was done and ``elapsed`` how long it
+    took, in seconds.
+    '''
+    def __init__(self, username, proof):
+        self.username = username
+        self.proof = proof
+        self.status = None
+        self.checked = None
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return '<ProofResult {} {} {} {}>'.format(self.username, self.proof_type, self.nametag, self.status)
+
+    @property
+    def ok(self):
+        '''
+        True if the proof checked out.
+        '''
+        return self.status == 'ok'
+
+    @property
+    def proof_type(self):
+        '''
+        The kind of proof, e.g. ``github`` or ``generic_web_site``.
+        '''
+        return self.proof.get('proof_type')
+
+    @property
+    def nametag(self):
+        '''
+        The account the proof is for.
+        '''
+        return self.proof.get('nametag')
+
+    @property
+    def proof_url(self):
+        '''
+        Where the proof was fetched from.
+        '''
+        return self.proof.get('proof_url')
+
+class ProofCache(object):
+    '''
+    An in-memory cache of :class:`ProofResult` objects. Entries expire
+    ``ttl`` seconds after they're added.
+
+    >>> cache = ProofCache(ttl=60)
+    >>> cache.put(('irc', 'abc'), 'result')
+    >>> cache.get(('irc', 'abc'))
+    'result'
+    >>> cache.get(('irc', 'def')) is None
+    True
+    >>> cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+    True
+    '''
+    def __init__(self, ttl=PROOF_CACHE_TTL):
+        import threading
+        self.ttl = ttl
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self.__entries = dict()
+
+    def get(self, key):
+        '''
+        Returns the cached result for ``key`` or None if there isn't a
+        fresh one.
+        '''
+        with self._lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0] + self.ttl < time.time():
+                del self.__entries[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        '''
+        Adds or replaces the result for ``key``.
+        '''
+        with self._lock:
+            self.__entries[key] = (time.time(), result)
+
+    def stats(self):
+        '''
+        Returns a dictionary with the ``hits``, ``misses`` and ``size`` of
+        the cache.
+        '''
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'size': len(self.__entries)}
+
+class ProofError(Exception):
+    '''
+    Base class for the errors raised by this module.
+    '''
+    pass
+
+class ProofFetchError(ProofError):
+    '''
+    Raised when a proof page can't be fetched. The message is the status
+    reported for the proof.
+    '''
+    pass
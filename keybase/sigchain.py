@@ -0,0 +1,423 @@
+'''
+.. module:: sigchain
+   :platform: Unix, Windows
+   :synopsis: Keep local, verified copies of Keybase users' signature chains.
+
+.. moduleauthor:: Ian Chesal <ian.chesal@gmail.com>
+
+Every change a Keybase user makes to their identity -- adding a key,
+posting a proof, revoking one -- is a signed link appended to their
+signature chain. Each link holds its sequence number and the hash of the
+link before it, so a chain can be audited by checking the links in order.
+Re-downloading and re-checking whole chains every time gets slower as
+they grow, so :class:`Sigchain` keeps a copy of each chain in an
+append-only file and only asks keybase.io for the links after the last
+one it has, checking just those::
+
+    from keybase import sigchain
+
+    chain = sigchain.Sigchain('irc')
+    for link in chain.sync():
+        print(link['seqno'], link['sig_id'])
+
+    for result in sigchain.sync(['irc', 'chris'], max_workers=8):
+        print(result.username, result.seqno, len(result.new), result.unverified, result.error)
+
+Chains are kept in ``SIGCHAIN_DIR``, one file of JSON links per line for
+each user. Every new link must be made by one of the user's keys and PGP
+signatures are checked with the user's PGP keys. Links signed by the
+NaCl keys of Keybase devices can't be checked with gpg; they're stored
+but reported as unverified, or refused with ``require_signatures=True``.
+'''
+
+#pylint: disable=C0301
+
+import hashlib
+import json
+import os
+
+from keybase import keybase
+
+# Where chains are kept by default.
+SIGCHAIN_DIR = os.path.join(os.path.expanduser('~'), '.keybase-py', 'sigchains')
+
+# Appended to the username to name the file a chain is kept in.
+SIGCHAIN_SUFFIX = '.jsonl'
+
+# How much of the end of a chain file is read at a time while looking for
+# the last link.
+TAIL_BLOCK_SIZE = 16 * 1024
+
+# The characters Keybase allows in usernames, which are used in file names.
+_USERNAME_CHARS = frozenset('abcdefghijklmnopqrstuvwxyz0123456789_')
+
+def sync(users, directory=None, max_workers=8, require_signatures=False):
+    '''
+    Brings the stored chains of all of ``users``, usernames or
+    :class:`keybase.Keybase` instances, up to date with
+    :func:`Sigchain.sync`, ``max_workers`` users at a time, passing
+    ``require_signatures`` on. Returns a :class:`SyncResult` for every
+    user in the order they came in. Errors don't stop the other users from
+    being synced; they're reported in the results.
+    '''
+    from concurrent import futures
+    users = list(users)
+    if not users:
+        return list()
+    def _one(user):
+        kbase = user if isinstance(user, keybase.Keybase) else None
+        username = user.username if kbase is not None else user
+        return Sigchain(username, directory).sync_result(kbase, require_signatures)
+    with futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(users)))) as executor:
+        return list(executor.map(_one, users))
+
+def verify_link(link, seqno, prev, keys=None):
+    '''
+    Checks that ``link`` is the link that follows link number ``seqno``,
+    whose payload hash is ``prev``, in a chain. Start a chain with a
+    ``seqno`` of 0 and a ``prev`` of None. Returns a tuple of the payload
+    hash of ``link``, to pass as ``prev`` when checking the next one, and
+    whether its signature was checked. Raises a SigchainVerifyError if the
+    link doesn't belong there.
+
+    If the user's :class:`UserKeys` are given as ``keys`` the link must be
+    made by one of them. A PGP signed link must also be signed by one of
+    the user's PGP keys, over the link's payload. Other links, signed by
+    the NaCl keys of Keybase devices, can't be checked here and only have
+    their place in the chain checked.
+
+    >>> import hashlib, json
+    >>> payload = json.dumps({'seqno': 1, 'prev': None})
+    >>> link = {'seqno': 1, 'payload_json': payload, 'sig': 'g6Rib2R5'}
+    >>> verify_link(link, 0, None) == (hashlib.sha256(payload.encode('utf-8')).hexdigest(), False)
+    True
+    >>> verify_link(link, 1, None)
+    Traceback (most recent call last):
+    ...
+    keybase.sigchain.SigchainVerifyError: link 1 is out of sequence
+    '''
+    payload = link.get('payload_json')
+    if not isinstance(payload, str):
+        raise SigchainVerifyError('link {} has no payload'.format(link.get('seqno')))
+    payload = payload.encode('utf-8')
+    payload_hash = hashlib.sha256(payload).hexdigest()
+    if link.get('payload_hash', payload_hash) != payload_hash:
+        raise SigchainVerifyError('link {} does not match its payload hash'.format(link.get('seqno')))
+    try:
+        body = json.loads(payload.decode('utf-8'))
+    except ValueError:
+        raise SigchainVerifyError('link {} has a malformed payload'.format(link.get('seqno')))
+    if not isinstance(body, dict) or link.get('seqno') != seqno + 1 or body.get('seqno') != seqno + 1:
+        raise SigchainVerifyError('link {} is out of sequence'.format(link.get('seqno')))
+    if body.get('prev') != prev:
+        raise SigchainVerifyError('link {} does not follow link {}'.format(seqno + 1, seqno))
+    if keys is None:
+        return (payload_hash, False)
+    if link.get('kid') not in keys.kids:
+        raise SigchainVerifyError('link {} is signed by a key that is not one of the user\'s'.format(seqno + 1))
+    if not _pgp_signed(link):
+        return (payload_hash, False)
+    from keybase import openpgp
+    signature = link['sig'].encode('ascii', 'replace')
+    pkey = keys.signer(signature)
+    if pkey is None:
+        raise SigchainVerifyError('link {} is signed by a PGP key that is not one of the user\'s'.format(seqno + 1))
+    if not pkey.verify_bytes(signature):
+        raise SigchainVerifyError('link {} has a bad signature'.format(seqno + 1))
+    try:
+        signed = openpgp.literal_data(signature)
+    except openpgp.OpenPGPError:
+        signed = None
+    if signed != payload:
+        raise SigchainVerifyError('link {} is not signed over its payload'.format(seqno + 1))
+    return (payload_hash, True)
+
+def _pgp_signed(link):
+    '''
+    True if ``link`` carries an armored PGP signature.
+    '''
+    return isinstance(link.get('sig'), str) and link['sig'].lstrip().startswith('-----BEGIN PGP')
+
+def _fetch_links(username, low):
+    '''
+    Returns the links of ``username``'s chain from number ``low`` on, in
+    order, with a single sig/get.json request.
+    '''
+    jresponse = keybase._get_json_from_url(
+        keybase._build_url('sig/get.json'), {'username': username, 'low': low}, method='get')
+    if jresponse['status']['name'] != 'OK':
+        raise SigchainError('Unable to fetch the sigchain of {}: {}'.format(username, jresponse['status']['name']))
+    links = jresponse.get('sigs')
+    if not isinstance(links, list) or not all(isinstance(link, dict) for link in links):
+        raise SigchainError('Malformed API response to sig/get.json request')
+    return sorted(links, key=lambda link: link.get('seqno') or 0)
+
+def _tail(path):
+    '''
+    Returns the last complete line of the file at ``path``, without its
+    newline, and the size of the file up to the end of that line. Only the
+    end of the file is read. Returns ``(None, 0)`` if there's no complete
+    line.
+    '''
+    try:
+        fobj = open(path, 'rb')
+    except FileNotFoundError:
+        return (None, 0)
+    with fobj:
+        pos = fobj.seek(0, os.SEEK_END)
+        block = b''
+        while pos > 0:
+            step = min(TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            fobj.seek(pos)
+            block = fobj.read(step) + block
+            end = block.rfind(b'\n')
+            if end < 0:
+                continue
+            start = block.rfind(b'\n', 0, end)
+            if start < 0 and pos > 0:
+                continue
+            return (block[start + 1:end], pos + end + 1)
+    return (None, 0)
+
+class Sigchain(object):
+    '''
+    The signature chain of the Keybase user ``username``, kept in a file
+    in ``directory``, ``SIGCHAIN_DIR`` by default.
+
+    The file is only ever appended to, one JSON link per line, and only
+    links that were checked with :func:`verify_link` are added. Finding
+    where the stored chain ends only reads the end of the file, so syncing
+    costs the same however long the chain is. A link that was half
+    written when a process died is dropped on the next sync.
+
+    An instance can be used from several threads at once but only one
+    process should sync a given user's chain at a time.
+    '''
+    def __init__(self, username, directory=None):
+        import threading
+        if not username or not set(username.lower()) <= _USERNAME_CHARS:
+            raise SigchainError('Invalid Keybase username: {!r}'.format(username))
+        self.username = username
+        self.directory = directory or SIGCHAIN_DIR
+        self.path = os.path.join(self.directory, username.lower() + SIGCHAIN_SUFFIX)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Sigchain {} {}>'.format(self.username, self.seqno)
+
+    @property
+    def seqno(self):
+        '''
+        The number of the last stored link, or 0 if none are stored yet.
+        '''
+        return self.__last()[0]
+
+    def links(self):
+        '''
+        Yields the stored links in order, as dictionaries.
+        '''
+        decode = keybase._json_decoder()
+        try:
+            fobj = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with fobj:
+            for line in fobj:
+                if line.endswith(b'\n'):
+                    yield decode(line)
+
+    def sync(self, kbase=None, require_signatures=False):
+        '''
+        Fetches the links added to the chain since the last sync, checks
+        them with :func:`verify_link` against the keys of the
+        :class:`keybase.Keybase` ``kbase`` and stores them. Returns the new
+        links in order; an empty list if there weren't any. If ``kbase``
+        isn't given the user is looked up, but only if there are new links.
+
+        Raises a SigchainVerifyError, and stores none of the new links, if
+        any of them don't check out, or, with ``require_signatures=True``,
+        if any of them aren't PGP signed so their signatures can't be
+        checked. :func:`Sigchain.sync_result` reports those links instead.
+        '''
+        return self.__sync(kbase, require_signatures)[0]
+
+    def sync_result(self, kbase=None, require_signatures=False):
+        '''
+        Like :func:`Sigchain.sync` but returns a :class:`SyncResult`
+        rather than raising an error if the sync fails. The result lists
+        the new links whose signatures couldn't be checked.
+        '''
+        import requests
+        result = SyncResult(self.username)
+        try:
+            (result.new, result.unverified) = self.__sync(kbase, require_signatures)
+        except (SigchainError, keybase.KeybaseError, keybase.KeybaseUserNotFound,
+                requests.exceptions.RequestException, OSError) as err:
+            result.error = str(err) or type(err).__name__
+        result.seqno = self.seqno
+        return result
+
+    def __sync(self, kbase, require_signatures):
+        '''
+        Does the work of :func:`Sigchain.sync`. Returns the new links and
+        the numbers of the ones whose signatures weren't checked.
+        '''
+        with self._lock:
+            (seqno, prev, size) = self.__last()
+            links = [link for link in _fetch_links(self.username, seqno + 1) if (link.get('seqno') or 0) > seqno]
+            if not links:
+                return (list(), list())
+            owned = None
+            if kbase is None:
+                kbase = owned = keybase.Keybase(self.username)
+            keys = UserKeys(kbase)
+            unverified = list()
+            try:
+                for link in links:
+                    (prev, verified) = verify_link(link, seqno, prev, keys)
+                    seqno += 1
+                    if not verified:
+                        if require_signatures:
+                            raise SigchainVerifyError('link {} is not PGP signed so its signature can\'t be checked'.format(seqno))
+                        unverified.append(seqno)
+            finally:
+                keys.close()
+                if owned is not None:
+                    owned.close()
+            self.__append(links, size)
+            return (links, unverified)
+
+    def __last(self):
+        '''
+        Returns the number and payload hash of the last stored link and
+        the size of the file up to the end of it.
+        '''
+        (line, size) = _tail(self.path)
+        if line is None:
+            return (0, None, 0)
+        try:
+            link = keybase._json_decoder()(line)
+            return (link['seqno'], hashlib.sha256(link['payload_json'].encode('utf-8')).hexdigest(), size)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise SigchainError('Corrupt sigchain file: {}'.format(self.path))
+
+    def __append(self, links, size):
+        '''
+        Appends ``links`` to the chain file in one write, first dropping
+        anything after the first ``size`` bytes left by a write that didn't
+        finish.
+        '''
+        dump = keybase._serializer('json')[0]
+        data = memoryview(b''.join(dump(link) + b'\n' for link in links))
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            if os.fstat(fd).st_size > size:
+                os.ftruncate(fd, size)
+            while len(data):
+                data = data[os.write(fd, data):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+class UserKeys(object):
+    '''
+    The keys that can make links in the chain of the :class:`keybase.Keybase`
+    user ``kbase``, from the ``public_keys`` section of their user object.
+    ``kids`` is the set of Keybase key IDs of the primary key, the eldest
+    key and all of the user's sibkeys and subkeys. The PGP keys are the
+    primary key and every bundle under ``all_bundles`` and
+    ``pgp_public_keys``, so links made with a key other than the current
+    primary still verify.
+    '''
+    def __init__(self, kbase):
+        section = kbase._section('public_keys') or dict()
+        primary = section.get('primary') or dict()
+        kids = [primary.get('kid'), section.get('eldest_kid')]
+        kids.extend(section.get('sibkeys') or ())
+        kids.extend(section.get('subkeys') or ())
+        self.kids = set(kid for kid in kids if isinstance(kid, str) and kid)
+        bundles = [primary.get('bundle')]
+        bundles.extend(section.get('all_bundles') or ())
+        bundles.extend(section.get('pgp_public_keys') or ())
+        self.__bundles = list()
+        for bundle in bundles:
+            if isinstance(bundle, str) and bundle and bundle not in self.__bundles:
+                self.__bundles.append(bundle)
+        self.__by_id = None
+        self.__keys = dict()
+
+    def signer(self, signature):
+        '''
+        Returns a :class:`keybase.KeybasePublicKey` for the user's PGP key
+        that made the armored ``signature``, going by the issuer the
+        signature names, or None if it wasn't made by one of them.
+        '''
+        from keybase import openpgp
+        try:
+            issuers = openpgp.precheck_signature(signature)
+        except openpgp.OpenPGPError:
+            return None
+        if self.__by_id is None:
+            self.__by_id = dict()
+            for bundle in self.__bundles:
+                try:
+                    prints = openpgp.fingerprints(bundle)
+                except openpgp.OpenPGPError:
+                    continue
+                for fingerprint in prints:
+                    self.__by_id.setdefault(openpgp._key_id(fingerprint), (bundle, prints[0].lower()))
+        for issuer in issuers:
+            found = self.__by_id.get(issuer.upper())
+            if found is None:
+                continue
+            if found not in self.__keys:
+                self.__keys[found] = keybase.KeybasePublicKey(bundle=found[0], key_fingerprint=found[1])
+            return self.__keys[found]
+        return None
+
+    def close(self):
+        '''
+        Closes the keys made by :func:`UserKeys.signer`.
+        '''
+        for pkey in self.__keys.values():
+            pkey.close()
+        self.__keys = dict()
+
+class SyncResult(object):
+    '''
+    The outcome of syncing the chain of ``username`` with :func:`sync`.
+    ``new`` is the list of links that were added, ``unverified`` the
+    numbers of the new links whose signatures couldn't be checked,
+    ``seqno`` the number of the last stored link afterwards and ``error``
+    why the sync failed, or None if it didn't.
+    '''
+    def __init__(self, username):
+        self.username = username
+        self.new = list()
+        self.unverified = list()
+        self.seqno = 0
+        self.error = None
+
+    def __repr__(self):
+        return '<SyncResult {} {} +{}>'.format(self.username, self.seqno, len(self.new))
+
+    @property
+    def ok(self):
+        '''
+        True if the chain was synced.
+        '''
+        return self.error is None
+
+class SigchainError(Exception):
+    '''
+    Base class for the errors raised by this module.
+    '''
+    pass
+
+class SigchainVerifyError(SigchainError):
+    '''
+    Raised when a link fetched from keybase.io doesn't check out.
+    '''
+    pass
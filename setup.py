@@ -69,17 +69,24 @@ setup(
         'scrypt>=0.6.1',
         'Sphinx>=1.2.2',
         'sphinx_rtd_theme>=0.1.6',
-        'wsgiref>=0.1.2',
     ],
     author_email = 'ian.chesal@gmail.com',
     description = 'A Python implementation of the keybase.io API',
     long_description = long_description,
     packages = ['keybase'],
+    entry_points = {
+        'console_scripts': [
+            'keybase-py = keybase.cli:main',
+        ],
+    },
     include_package_data = True,
     platforms = 'any',
+    python_requires = '>=3.5',
     test_suite = 'nose.collector',
     classifiers = [
         'Programming Language :: Python',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: Apache Software License',
@@ -90,5 +97,7 @@ setup(
         ],
     extras_require = {
         'testing': ['pytest'],
+        'http2': ['httpx[http2]', 'brotli'],
+        'msgpack': ['msgpack'],
     }
 )
@@ -0,0 +1,182 @@
+'''
+Fixtures shared by the tests.
+'''
+
+import os
+import shutil
+import socketserver
+import subprocess
+import tempfile
+import threading
+from http.server import HTTPServer
+
+import pytest
+
+from keybase import keybase
+
+class Golden(object):
+    '''
+    The golden files in ``test/golden``: the irc user's public key and a
+    file signed and encrypted with it. ``fingerprint`` is the fingerprint
+    of that key.
+    '''
+    fingerprint = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+
+    def __init__(self):
+        self.directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+    def path(self, fname):
+        '''
+        Returns the path to the golden file ``fname``.
+        '''
+        return os.path.join(self.directory, fname)
+
+    def read(self, fname, mode='rb'):
+        '''
+        Returns the contents of the golden file ``fname``.
+        '''
+        with open(self.path(fname), mode) as fobj:
+            return fobj.read()
+
+@pytest.fixture(scope='session')
+def golden():
+    '''
+    The golden files.
+    '''
+    return Golden()
+
+@pytest.fixture
+def make_key(golden):
+    '''
+    Returns a KeybasePublicKey built from the golden public key every time
+    it's called. Keys still open when the test is done are closed.
+    '''
+    keys = []
+    def make():
+        keys.append(keybase.KeybasePublicKey(bundle=golden.read('irc.public.key', 'r'), key_fingerprint=golden.fingerprint))
+        return keys[-1]
+    try:
+        yield make
+    finally:
+        for pkey in keys:
+            pkey.close()
+
+@pytest.fixture
+def irc_user_object(golden):
+    '''
+    Returns a fresh user object for the irc user built from the golden
+    public key every time it's called.
+    '''
+    def make():
+        return {
+            'basics': {'username': 'irc'},
+            'profile': {'full_name': 'Ian Chesal', 'location': 'Bay Area, California'},
+            'public_keys': {'primary': {'bundle': golden.read('irc.public.key', 'r'), 'key_fingerprint': golden.fingerprint}},
+            'pictures': {'primary': {'url': 'https://example.com/irc.jpg'}},
+        }
+    return make
+
+class Keypair(object):
+    '''
+    A throwaway gpg keypair with a signing primary key and an encryption
+    subkey, for tests that need to sign or decrypt things the golden key
+    can't.
+    '''
+    def __init__(self, homedir):
+        self.homedir = homedir
+        self.gpg(['--passphrase', '', '--quick-gen-key', 'Keybase Test <test@example.com>', 'ed25519', 'sign,cert', 'never'])
+        for line in self.gpg(['--with-colons', '--list-keys']).decode('ascii').splitlines():
+            if line.startswith('fpr:'):
+                self.fingerprint = line.split(':')[9].lower()
+                break
+        self.gpg(['--passphrase', '', '--quick-add-key', self.fingerprint, 'cv25519', 'encr', 'never'])
+        self.bundle = self.gpg(['--armor', '--export', self.fingerprint]).decode('ascii')
+
+    def gpg(self, args, data=None):
+        '''
+        Runs gpg with ``args`` against the throwaway keyring, feeding it
+        ``data``, and returns its output.
+        '''
+        return subprocess.run(
+            [keybase.gpg(), '--homedir', self.homedir, '--batch', '--yes'] + args,
+            input=data, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+
+    def sign(self, fname, detach=True):
+        '''
+        Signs the file ``fname``, writing an armored detached signature to
+        ``fname + '.asc'`` or, if ``detach`` is False, a clear-signed copy
+        to ``fname + '.asc'``. Returns the name of the file written.
+        '''
+        output = fname + '.asc'
+        self.gpg(['--armor', '--detach-sign' if detach else '--clearsign', '-o', output, fname])
+        return output
+
+    def decrypt(self, data):
+        '''
+        Returns ``data`` decrypted with the throwaway private key.
+        '''
+        return self.gpg(['--decrypt'], data=bytes(data))
+
+    def public_key(self):
+        '''
+        Returns a KeybasePublicKey for the throwaway key.
+        '''
+        return keybase.KeybasePublicKey(bundle=self.bundle, key_fingerprint=self.fingerprint)
+
+@pytest.fixture(scope='session')
+def keypair():
+    '''
+    A throwaway keypair that lives for the whole test session.
+    '''
+    homedir = tempfile.mkdtemp(prefix='keybase-test-')
+    try:
+        yield Keypair(homedir)
+    finally:
+        try:
+            subprocess.call(['gpgconf', '--homedir', homedir, '--kill', 'all'], stderr=subprocess.DEVNULL)
+        except OSError:
+            pass
+        shutil.rmtree(homedir, ignore_errors=True)
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    '''
+    An HTTP server that handles every request in a thread of its own.
+    http.server.ThreadingHTTPServer only arrived in Python 3.7.
+    '''
+    daemon_threads = True
+
+class LocalServer(object):
+    '''
+    Serves requests on localhost from a background thread with ``handler``,
+    a :py:class:`http.server.BaseHTTPRequestHandler` subclass. ``url`` is
+    where it's listening.
+    '''
+    def __init__(self, handler):
+        self.server = _Server(('127.0.0.1', 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def close(self):
+        '''
+        Stops the server.
+        '''
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def serve():
+    '''
+    Starts a LocalServer for the handler class it's called with. Every
+    server started is stopped when the test is done.
+    '''
+    servers = []
+    def start(handler):
+        servers.append(LocalServer(handler))
+        return servers[-1]
+    try:
+        yield start
+    finally:
+        for server in servers:
+            server.close()
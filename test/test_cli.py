@@ -0,0 +1,140 @@
+'''
+Tests for the keybase-py command line tool.
+
+These run against users served from an in-memory user cache or a faked
+API so they don't need network access.
+'''
+
+import json
+import os
+
+import pytest
+
+from keybase import cli
+from keybase import keybase
+
+def output_records(capsys):
+    '''
+    Returns the JSON records written to stdout.
+    '''
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+def test_verify_files(capsys, golden, irc_user_object):
+    '''
+    Verifies embedded and detached signatures on the golden files in
+    parallel.
+    '''
+    cache = keybase.KeybaseUserCache()
+    cache.put('irc', irc_user_object())
+    previous = keybase.set_user_cache(cache)
+    try:
+        status = cli.main(['--jobs', '2', 'verify', '--user', 'irc', golden.path('helloworld.txt.gpg')])
+        assert status == 0
+        assert output_records(capsys) == [
+            {'file': golden.path('helloworld.txt.gpg'), 'valid': True, 'status': None}]
+        status = cli.main(['verify', '--user', 'irc', '--sig-suffix', '.sig',
+                           golden.path('helloworld.txt'), golden.path('missing.txt')])
+        assert status == 1
+        records = output_records(capsys)
+        assert records[0]['valid']
+        assert not records[1]['valid']
+        assert records[1]['status'].startswith('error: ')
+    finally:
+        keybase.set_user_cache(previous)
+
+def test_lookup_batches(monkeypatch, capsys, golden, irc_user_object):
+    '''
+    Looks up users from stdin in batches and reports the ones that don't
+    exist.
+    '''
+    requests = []
+    def fake_get_json_from_url(url, params, method='get'):
+        names = params['usernames'].split(',')
+        requests.append(names)
+        if 'nobody' in names:
+            return {'status': {'code': 205, 'name': 'NOT_FOUND'}}
+        return {'status': {'code': 0, 'name': 'OK'},
+                'them': [irc_user_object() for _ in names]}
+    monkeypatch.setattr(keybase, '_get_json_from_url', fake_get_json_from_url)
+    monkeypatch.setattr('sys.stdin', iter(['irc\n', 'nobody\n', '\n', 'irc\n']))
+    status = cli.main(['--jobs', '1', '--stats', 'lookup', '--batch-size', '3'])
+    assert status == 1
+    records = output_records(capsys)
+    assert [record['found'] for record in records] == [True, False, True]
+    assert records[0]['key_fingerprint'] == golden.fingerprint
+    assert requests == [['irc', 'nobody'], ['irc'], ['nobody']]
+
+def test_calibrate_gpg(tmpdir, monkeypatch, capsys, golden):
+    '''
+    Calibration times every option set, saves the fastest one that works
+    and later runs that load the saved choice use it for the gpg commands
+    they run. Saved choices with options or binaries calibration wouldn't
+    pick are refused.
+    '''
+    path = str(tmpdir.join('gpg.json'))
+    monkeypatch.setattr(keybase, 'GPG_OPTION_SETS', ((), ('--no-auto-check-trustdb',), ('--no-such-option',)))
+    previous = keybase.set_gpg_calibration(None)
+    try:
+        assert cli.main(['calibrate-gpg', '--rounds', '2', '--output', path, 'gpg']) == 0
+        records = output_records(capsys)
+        assert [record['passed'] for record in records] == [True, True, False]
+        assert sum(record['chosen'] for record in records) == 1
+        with open(path, 'r') as fobj:
+            saved = json.load(fobj)
+        assert saved['options'] in ([], ['--no-auto-check-trustdb'])
+        keybase.set_gpg_calibration(None)
+        monkeypatch.setattr(keybase, 'GPG_CALIBRATION_FILE', path)
+        for (key, value) in (('options', ['--trust-model', 'always', '--keyring', path]), ('binary', '/bin/sh')):
+            tampered = str(tmpdir.join('tampered.json'))
+            with open(tampered, 'w') as fobj:
+                json.dump(dict(saved, **{key: value}), fobj)
+            with pytest.raises(keybase.KeybaseError):
+                keybase.load_gpg_calibration(tampered)
+            with pytest.raises(SystemExit):
+                cli.main(['--gpg-calibration', tampered, 'lookup', 'irc'])
+        assert keybase.load_gpg_calibration(str(tmpdir.join('missing.json'))) is None
+        assert keybase.set_gpg_calibration(None) is None
+        assert keybase.load_gpg_calibration()['options'] == saved['options']
+        assert keybase.gpg() == saved['binary']
+        with keybase.KeybasePublicKey(bundle=golden.read('irc.public.key', 'r'), key_fingerprint=golden.fingerprint) as pkey:
+            commands = []
+            run_gpg = keybase._run_gpg
+            def recording_run_gpg(command, **kwargs):
+                commands.append(command)
+                return run_gpg(command, **kwargs)
+            monkeypatch.setattr(keybase, '_run_gpg', recording_run_gpg)
+            with open(golden.path('helloworld.txt.gpg'), 'rb') as fobj:
+                assert pkey.verify_bytes(fobj.read())
+            assert commands[0][0] == saved['binary']
+            assert commands[0][-len(saved['options']) - 1:-1] == saved['options']
+    finally:
+        keybase.set_gpg_calibration(previous)
+
+def test_encrypt_failures(tmpdir, monkeypatch, capsys, irc_user_object):
+    '''
+    An unknown user is reported without a traceback and files that can't
+    be encrypted leave no output behind.
+    '''
+    monkeypatch.setattr(keybase, '_get_json_from_url', lambda url, params, method='get': {
+        'status': {'code': 205, 'name': 'NOT_FOUND'}})
+    monkeypatch.setattr(keybase, '_NEGATIVE_CACHE', None)
+    fname = str(tmpdir.join('secret.txt'))
+    with open(fname, 'w') as fobj:
+        fobj.write('secret\n')
+    assert cli.main(['encrypt', '--user', 'nobody', fname]) == 1
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'User nobody not found' in captured.err
+    def failing_encrypt_bytes(self, data, output=None, **kwargs):
+        output.write(b'-----BEGIN PGP')
+        raise keybase.KeybasePublicKeyEncryptError('unable to encrypt data')
+    monkeypatch.setattr(keybase.KeybasePublicKey, 'encrypt_bytes', failing_encrypt_bytes)
+    cache = keybase.KeybaseUserCache()
+    cache.put('irc', irc_user_object())
+    previous = keybase.set_user_cache(cache)
+    try:
+        assert cli.main(['encrypt', '--user', 'irc', fname]) == 1
+        assert output_records(capsys)[0]['error'] == 'unable to encrypt data'
+        assert os.listdir(str(tmpdir)) == ['secret.txt']
+    finally:
+        keybase.set_user_cache(previous)
@@ -0,0 +1,116 @@
+'''
+Tests for chunked, seekable encrypted containers.
+'''
+
+import io
+import os
+import struct
+
+import pytest
+
+from keybase import container
+
+def write_container(keypair, data, chunk_size, writes=1):
+    '''
+    Returns ``data`` written to an in-memory container for ``keypair`` in
+    ``writes`` roughly equal pieces.
+    '''
+    output = io.BytesIO()
+    step = max(1, -(-len(data) // writes))
+    with keypair.public_key() as pkey:
+        with container.ContainerWriter(pkey, output, chunk_size=chunk_size, jobs=4) as writer:
+            for start in range(0, len(data), step):
+                writer.write(data[start:start + step])
+    return output.getvalue()
+
+@pytest.mark.parametrize('size', [0, 1, 4096, 4097, 10000])
+def test_round_trip(keypair, size):
+    '''
+    Whatever goes in comes back out, read whole, in pieces and by range.
+    '''
+    data = os.urandom(size // 2) + b'text ' * (size // 10)
+    data = data[:size].ljust(size, b'.')
+    encrypted = write_container(keypair, data, 4096, writes=3)
+    with container.ContainerReader(io.BytesIO(encrypted), keypair.decrypt) as reader:
+        assert reader.size == size
+        assert reader.chunks == max(1, -(-size // 4096))
+        assert reader.read() == data
+        assert b''.join(reader.iter_chunks()) == data
+        for (offset, length) in [(0, 10), (4090, 20), (size - 5, 100), (size + 10, 10)]:
+            assert reader.read_range(max(0, offset), length) == data[max(0, offset):max(0, offset) + length]
+        back = min(7, size)
+        reader.seek(-back, os.SEEK_END)
+        assert reader.read(3) == data[size - back:size - back + 3]
+        assert reader.tell() == size - back + min(3, back)
+
+def test_only_needed_chunks_are_decrypted(keypair):
+    '''
+    Reading a small range decrypts only the chunks that cover it.
+    '''
+    data = os.urandom(64 * 1024)
+    encrypted = write_container(keypair, data, 1024)
+    decrypted = []
+    def decrypt(chunk):
+        decrypted.append(chunk)
+        return keypair.decrypt(chunk)
+    with container.ContainerReader(io.BytesIO(encrypted), decrypt) as reader:
+        assert reader.read_range(40000, 100) == data[40000:40100]
+        assert len(decrypted) == 1
+        assert reader.read_range(40100, 2000) == data[40100:42100]
+        assert len(decrypted) == 3
+
+def test_tampering_is_detected(keypair):
+    '''
+    Swapping chunks around or truncating the container is caught.
+    '''
+    data = b'a' * 1024 + b'b' * 1024 + b'c' * 10
+    encrypted = write_container(keypair, data, 1024)
+    with container.ContainerReader(io.BytesIO(encrypted), keypair.decrypt) as reader:
+        offsets = reader._ContainerReader__offsets
+        lengths = reader._ContainerReader__lengths
+    chunks = [encrypted[offset:offset + length] for (offset, length) in zip(offsets, lengths)]
+    (index_offset, index_length, magic) = struct.unpack('>QQ8s', encrypted[-24:])
+    swapped = b''.join([
+        container.MAGIC, chunks[1], chunks[0], chunks[2],
+        encrypted[index_offset:index_offset + index_length],
+        struct.pack('>III', lengths[1], lengths[0], lengths[2]),
+        encrypted[-24:]])
+    with container.ContainerReader(io.BytesIO(swapped), keypair.decrypt) as reader:
+        with pytest.raises(container.ContainerFormatError):
+            reader.read_range(0, 10)
+    with pytest.raises(container.ContainerFormatError):
+        container.ContainerReader(io.BytesIO(encrypted[:-1]), keypair.decrypt)
+    with pytest.raises(container.ContainerFormatError):
+        container.ContainerReader(io.BytesIO(b'not a container at all, no'), keypair.decrypt)
+
+@pytest.mark.parametrize('change', [
+    {'chunk_size': 0}, {'chunk_size': -1024}, {'size': -1}, {'chunks': 0}, {'version': 2}, {'version': None}])
+def test_corrupt_index_is_detected(keypair, change):
+    '''
+    An index with an impossible chunk size, size or chunk count, or from
+    another version of the format, is rejected rather than misread.
+    '''
+    import json
+    encrypted = write_container(keypair, b'a' * 2048, 1024)
+    (index_offset, index_length, magic) = struct.unpack('>QQ8s', encrypted[-24:])
+    index = json.loads(encrypted[index_offset:index_offset + index_length].decode('utf-8'))
+    index.update(change)
+    index = json.dumps(index, sort_keys=True).encode('utf-8')
+    corrupt = b''.join([
+        encrypted[:index_offset], index,
+        encrypted[index_offset + index_length:-24],
+        struct.pack('>QQ8s', index_offset, len(index), magic)])
+    with pytest.raises(container.ContainerFormatError):
+        container.ContainerReader(io.BytesIO(corrupt), keypair.decrypt)
+
+def test_gpg_decrypter(keypair):
+    '''
+    The gpg decrypter decrypts with the keys in a gpg home directory and
+    fails cleanly without them.
+    '''
+    encrypted = write_container(keypair, b'hello', 1024)
+    with container.ContainerReader(io.BytesIO(encrypted), container.gpg_decrypter(keypair.homedir)) as reader:
+        assert reader.read() == b'hello'
+    with container.ContainerReader(io.BytesIO(encrypted), container.gpg_decrypter(os.devnull)) as reader:
+        with pytest.raises(container.ContainerDecryptError):
+            reader.read()
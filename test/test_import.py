@@ -0,0 +1,24 @@
+'''
+Tests for the import-time behaviour of the keybase module.
+'''
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+def test_import_is_lazy():
+    '''
+    Importing the module must not drag in gnupg, requests or any of the
+    process and filesystem helpers. Those are only needed once a lookup or
+    a gpg operation actually happens.
+    '''
+    probe = (
+        'import sys\n'
+        'sys.path.insert(0, {0!r})\n'
+        'from keybase import keybase\n'
+        'print(sorted(m for m in ("gnupg", "requests", "subprocess", "shutil", "tempfile") if m in sys.modules))\n'
+    ).format(ROOT)
+    output = subprocess.check_output([sys.executable, '-S', '-c', probe])
+    assert output.decode('utf-8').strip() == '[]'
@@ -0,0 +1,76 @@
+'''
+Tests for JSON decoding of API responses.
+'''
+
+import json
+
+import pytest
+
+from keybase import keybase
+
+DOCUMENT = {
+    'status': {'code': 0, 'name': 'OK', 'desc': 'a "quoted" [status], {with} \\\\ stuff'},
+    'them': [
+        {'basics': {'username': 'irc'}, 'bundle': '-----BEGIN PGP-----\n"]}\\\\"\né☃'},
+        None,
+        [1, [2, {'3': [4]}]],
+        'a string, with a comma',
+        12.5,
+        {},
+    ],
+    'csrf_token': 'them',
+}
+
+def stream(document, chunk_size, key='them'):
+    '''
+    Feeds ``document`` to a _JSONArrayStream ``chunk_size`` bytes at a time
+    and returns the items and the rest of the document.
+    '''
+    body = json.dumps(document, ensure_ascii=False).encode('utf-8')
+    parser = keybase._JSONArrayStream(key, keybase._stdlib_json_decoder)
+    items = list()
+    for start in range(0, len(body), chunk_size):
+        items.extend(parser.feed(body[start:start + chunk_size]))
+    return (items, parser.close())
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64, 1 << 20])
+def test_array_stream_matches_json(chunk_size):
+    '''
+    Streaming gives the same items as decoding the whole document, however
+    it's split up.
+    '''
+    (items, rest) = stream(DOCUMENT, chunk_size)
+    assert items == DOCUMENT['them']
+    assert rest == dict(DOCUMENT, them=[])
+
+def test_array_stream_without_key():
+    '''
+    A document without the array, like an error response, comes back whole
+    from close().
+    '''
+    document = {'status': {'code': 205, 'name': 'NOT_FOUND'}, 'matches': [1, 2]}
+    assert stream(document, 3) == ([], document)
+
+def test_array_stream_truncated():
+    '''
+    A document that stops part way through is an error.
+    '''
+    parser = keybase._JSONArrayStream('them', keybase._stdlib_json_decoder)
+    assert parser.feed(b'{"them": [{"a": 1}, {"b": "}]') == [{'a': 1}]
+    with pytest.raises(keybase.KeybaseError):
+        parser.close()
+
+def test_set_json_decoder():
+    '''
+    An installed decoder is used until it's uninstalled again.
+    '''
+    calls = []
+    def decoder(body):
+        calls.append(body)
+        return keybase._stdlib_json_decoder(body)
+    previous = keybase.set_json_decoder(decoder)
+    try:
+        assert keybase._json_decoder() is decoder
+    finally:
+        assert keybase.set_json_decoder(previous) is decoder
+    assert keybase._json_decoder() is not decoder
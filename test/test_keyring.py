@@ -0,0 +1,58 @@
+'''
+Tests for building one keyring out of many Keybase key bundles.
+'''
+
+import os
+
+import pytest
+
+from keybase import keybase
+
+def test_keyring_maps_and_rejects(keypair, monkeypatch, golden):
+    '''
+    Good keys are imported with one gpg run and mapped to their labels,
+    bad bundles are rejected with a reason and the keyring can encrypt and
+    verify with what's in it.
+    '''
+    irc = golden.read('irc.public.key', 'r')
+    imports = []
+    import_keys = keybase.KeybaseKeyring._KeybaseKeyring__import
+    def counting_import(self, candidates):
+        imports.append(len(candidates))
+        return import_keys(self, candidates)
+    monkeypatch.setattr(keybase.KeybaseKeyring, '_KeybaseKeyring__import', counting_import)
+    with keypair.public_key() as pkey:
+        keys = {
+            'irc': keybase.KeybasePublicKey(bundle=irc, key_fingerprint=golden.fingerprint),
+            'test': pkey,
+            'raw': irc,
+            'liar': keybase.Keybase._from_user_object('liar', {
+                'public_keys': {'primary': {'bundle': irc, 'key_fingerprint': keypair.fingerprint}}}),
+            'junk': '-----BEGIN PGP PUBLIC KEY BLOCK-----\n\nnope\n-----END PGP PUBLIC KEY BLOCK-----\n',
+        }
+        with keybase.KeybaseKeyring(keys) as keyring:
+            assert imports == [3]
+            assert keyring.fingerprints == {'irc': golden.fingerprint, 'test': keypair.fingerprint, 'raw': golden.fingerprint}
+            assert keyring.rejected['liar'] == 'fingerprint mismatch'
+            assert keyring.rejected['junk'].startswith('malformed bundle')
+            assert keyring.verify_bytes(golden.read('helloworld.txt.gpg')) in ('irc', 'raw')
+            assert keyring.verify_bytes(b'\x00' * 64) is None
+            encrypted = keyring.encrypt_bytes(b'for test', recipients=['test'])
+            assert keypair.decrypt(encrypted) == b'for test'
+            homedir = keyring.homedir
+        assert not os.path.exists(homedir)
+        for key in keys.values():
+            if isinstance(key, keybase.KeybasePublicKey):
+                key.close()
+
+def test_keyring_catches_smuggled_keys(keypair, golden):
+    '''
+    A bundle that carries a second key block gets the keyring rebuilt
+    without it.
+    '''
+    smuggler = keypair.bundle + '\n' + golden.read('irc.public.key', 'r')
+    with keybase.KeybaseKeyring({'test': keypair.bundle, 'smuggler': smuggler}) as keyring:
+        assert keyring.fingerprints == {'test': keypair.fingerprint}
+        assert keyring.rejected == {'smuggler': 'fingerprint mismatch'}
+        with pytest.raises(keybase.KeybasePublicKeyVerifyError):
+            keyring.verify_bytes(golden.read('helloworld.txt.gpg'), throw_error=True)
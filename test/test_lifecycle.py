@@ -0,0 +1,146 @@
+'''
+Tests for the lifecycle of the temporary gpg keyrings behind
+KeybasePublicKey objects.
+'''
+
+import os
+import shutil
+import tempfile
+
+from keybase import keybase
+
+def test_close_removes_keyring(make_key):
+    '''
+    Closing a key, directly or through a with block, removes its keyring
+    and makes it unusable.
+    '''
+    with make_key() as pkey:
+        homedir = pkey.homedir
+        assert os.path.isdir(homedir)
+        assert os.path.basename(homedir).startswith('keybase-{}-'.format(os.getpid()))
+    assert pkey.closed
+    assert not os.path.exists(homedir)
+    try:
+        pkey.encrypt_bytes(b'Hello, world!')
+    except keybase.KeybasePublicKeyError:
+        pass
+    else:
+        assert False, 'expected a KeybasePublicKeyError'
+    pkey.close()
+
+def test_janitor_caps_live_keyrings(make_key):
+    '''
+    Going over the cap evicts the least recently used keyring. The evicted
+    key rebuilds its keyring the next time it's used.
+    '''
+    original = keybase.keyring_janitor.max_homedirs
+    keybase.keyring_janitor.max_homedirs = 1
+    try:
+        first = make_key()
+        first_homedir = first.homedir
+        second = make_key()
+        assert first.homedir is None
+        assert not os.path.exists(first_homedir)
+        assert os.path.isdir(second.homedir)
+        assert keybase.keyring_janitor.live() == 1
+        assert first.encrypt_bytes(b'Hello, world!')
+        assert os.path.isdir(first.homedir)
+        assert second.homedir is None
+        first.close()
+        second.close()
+    finally:
+        keybase.keyring_janitor.max_homedirs = original
+
+def test_janitor_sweeps_orphans():
+    '''
+    Keyrings whose lock can be taken are reclaimed, whatever pid they were
+    made by. Locked keyrings, recent keyrings without a lock file and
+    unrelated directories are not.
+    '''
+    tempdir = tempfile.mkdtemp(suffix='.keybase-test')
+    janitor = keybase.KeybaseKeyringJanitor(tempdir=tempdir)
+    orphan = os.path.join(tempdir, 'keybase-{}-abc.keybase'.format(os.getpid()))
+    live = os.path.join(tempdir, 'keybase-{}-def.keybase'.format(4194304 + 1))
+    unlocked = os.path.join(tempdir, 'keybase-{}-ghi.keybase'.format(os.getpid()))
+    stale = os.path.join(tempdir, 'keybase-old.keybase')
+    unrelated = os.path.join(tempdir, 'something-else')
+    for path in (orphan, live, unlocked, stale, unrelated):
+        os.mkdir(path)
+    keybase._unlock_homedir(keybase._lock_homedir(orphan, create=True))
+    held = keybase._lock_homedir(live, create=True)
+    os.utime(stale, (0, 0))
+    try:
+        assert janitor.startup_sweep() == 2
+        assert janitor.startup_sweep() == 0
+        assert not os.path.exists(orphan)
+        assert not os.path.exists(stale)
+        assert os.path.isdir(live)
+        assert os.path.isdir(unlocked)
+        assert os.path.isdir(unrelated)
+        assert janitor.stats()['reclaimed'] == 2
+    finally:
+        keybase._unlock_homedir(held)
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+def test_live_keyrings_are_locked(make_key):
+    '''
+    A key's keyring is locked while it's open, so sweeps leave it alone.
+    '''
+    with make_key() as pkey:
+        assert pkey.encrypt_bytes(b'Hello, world!')
+        assert keybase._lock_homedir(pkey.homedir) is None
+        janitor = keybase.KeybaseKeyringJanitor(tempdir=os.path.dirname(pkey.homedir))
+        janitor.sweep()
+        assert os.path.isdir(pkey.homedir)
+
+def use_in_worker(pkey):
+    '''
+    Encrypts with ``pkey`` in a worker process, noting whether it arrived
+    without a keyring.
+    '''
+    return (pkey.key_fingerprint, pkey.homedir is None, bool(pkey.encrypt_bytes(b'Hello, world!')))
+
+def test_pickled_key_builds_keyring_lazily(golden, make_key):
+    '''
+    A pickled key carries only its record. The copy builds its own keyring
+    the first time it's used, in this process or in a worker process.
+    '''
+    import multiprocessing
+    import pickle
+    with make_key() as pkey:
+        data = pickle.dumps(pkey)
+        assert len(data) < len(pkey.bundle) + 1024
+        copy = pickle.loads(data)
+        assert copy.homedir is None
+        assert copy.key_ids == pkey.key_ids
+        assert copy.encrypt_bytes(b'Hello, world!')
+        assert os.path.isdir(copy.homedir)
+        assert copy.homedir != pkey.homedir
+        copy.close()
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            assert pool.apply(use_in_worker, (pkey,)) == (golden.fingerprint, True, True)
+
+def test_rebuilding_keys_runs_no_gpg(monkeypatch, make_key):
+    '''
+    Unpickling or loading a key in a fresh process doesn't run gpg; the
+    algorithms gpg supports are only asked for when they're needed.
+    '''
+    import pickle
+    import subprocess
+    with make_key() as pkey:
+        pickled = pickle.dumps(pkey)
+        dumped = keybase.dumps(pkey)
+        record = pkey.to_dict()
+    monkeypatch.setattr(keybase, '_GPG_CONFIG_CACHE', dict())
+    commands = []
+    popen = subprocess.Popen
+    def recording_popen(args, *rest, **kwargs):
+        commands.append(args)
+        return popen(args, *rest, **kwargs)
+    monkeypatch.setattr(subprocess, 'Popen', recording_popen)
+    copies = [pickle.loads(pickled), keybase.loads(dumped), keybase.KeybasePublicKey.from_dict(record)]
+    assert commands == []
+    assert 'AES256' in copies[0].cipher_algos
+    assert len(commands) == 1
+    for copy in copies:
+        copy.close()
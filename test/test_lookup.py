@@ -0,0 +1,306 @@
+'''
+Tests for field-selective user lookups.
+
+The keybase.io API is faked so these don't need network access.
+'''
+
+import json
+import time
+
+import pytest
+
+from keybase import keybase
+
+@pytest.fixture
+def fake_api(monkeypatch, irc_user_object):
+    '''
+    Serves user/lookup.json from irc_user_object(), honouring the fields
+    parameter, and returns the list of parameters of every request made.
+    '''
+    requests = []
+    def fake_get_json_from_url(url, params, method='get'):
+        requests.append(dict(params))
+        them = irc_user_object()
+        if 'fields' in params:
+            fields = params['fields'].split(',')
+            them = dict((key, value) for (key, value) in them.items() if key in fields)
+        if 'usernames' in params:
+            them = [them for _ in params['usernames'].split(',')]
+        return {'status': {'code': 0, 'name': 'OK'}, 'them': them}
+    monkeypatch.setattr(keybase, '_get_json_from_url', fake_get_json_from_url)
+    return requests
+
+def test_fields_fetched_on_demand(fake_api, golden):
+    '''
+    Only the named sections are requested up front and the others are
+    fetched the first time a property needs them.
+    '''
+    kbase = keybase.Keybase('irc', fields='public_keys')
+    assert fake_api == [{'username': 'irc', 'fields': 'public_keys'}]
+    assert 'profile' not in kbase._user_object
+    assert kbase.public_keys == ('primary',)
+    assert kbase.get_public_key().key_fingerprint == golden.fingerprint
+    assert len(fake_api) == 1
+    assert kbase.name == 'Ian Chesal'
+    assert kbase.location == 'Bay Area, California'
+    assert fake_api[1:] == [{'username': 'irc', 'fields': 'profile'}]
+    kbase.close()
+
+def test_lookup_with_fields_skips_cache(fake_api, irc_user_object):
+    '''
+    Batched lookups pass fields along and partial user objects aren't
+    cached, while complete cached users satisfy any fields request.
+    '''
+    cache = keybase.KeybaseUserCache()
+    previous = keybase.set_user_cache(cache)
+    try:
+        (kbase,) = keybase.lookup(['irc'], fields=('public_keys', 'profile'))
+        assert fake_api == [{'usernames': 'irc', 'fields': 'profile,public_keys'}]
+        assert cache.get('irc') is None
+        assert kbase.name == 'Ian Chesal'
+        assert kbase._section_getter('pictures', 'primary')['url'].endswith('irc.jpg')
+        assert fake_api[1:] == [{'username': 'irc', 'fields': 'pictures'}]
+        cache.put('irc', irc_user_object())
+        del fake_api[:]
+        (kbase,) = keybase.lookup(['irc'], fields=('public_keys',))
+        assert kbase.name == 'Ian Chesal'
+        assert fake_api == []
+    finally:
+        keybase.set_user_cache(previous)
+
+def test_iter_lookup_streams(monkeypatch, golden, irc_user_object):
+    '''
+    iter_lookup hands out users in input order from streamed responses and
+    splits batches with unknown users in them.
+    '''
+    requests = []
+    def fake_iter_json_from_url(url, params, key, jresponse):
+        names = params['usernames'].split(',')
+        requests.append(names)
+        if 'nobody' in names:
+            document = {'status': {'code': 205, 'name': 'NOT_FOUND'}}
+        else:
+            document = {'status': {'code': 0, 'name': 'OK'},
+                        'them': [irc_user_object() for _ in names]}
+        body = json.dumps(document).encode('utf-8')
+        parser = keybase._JSONArrayStream(key, keybase._json_decoder())
+        for start in range(0, len(body), 512):
+            for item in parser.feed(body[start:start + 512]):
+                yield item
+        jresponse.update(parser.close())
+    monkeypatch.setattr(keybase, '_iter_json_from_url', fake_iter_json_from_url)
+    users = list(keybase.iter_lookup(['irc', 'nobody', 'irc', 'irc'], batch_size=3))
+    assert [user and user.username for user in users] == ['irc', None, 'irc', 'irc']
+    assert users[3].get_public_key().key_fingerprint == golden.fingerprint
+    assert requests == [['irc', 'nobody'], ['irc'], ['nobody'], ['irc']]
+    users[3].close()
+
+def test_negative_cache_fails_fast(fake_api, monkeypatch):
+    '''
+    Users that weren't found are answered from the negative cache without
+    a request until it's uninstalled.
+    '''
+    def not_found(url, params, method='get'):
+        fake_api.append(dict(params))
+        if 'usernames_only' in params:
+            return {'status': {'code': 0, 'name': 'OK'}, 'matches': []}
+        return {'status': {'code': 205, 'name': 'NOT_FOUND'}}
+    monkeypatch.setattr(keybase, '_get_json_from_url', not_found)
+    cache = keybase.KeybaseNegativeCache(ttl=60)
+    previous = keybase.set_negative_cache(cache)
+    try:
+        with pytest.raises(keybase.KeybaseUserNotFound):
+            keybase.Keybase('nobody')
+        with pytest.raises(keybase.KeybaseUserNotFound):
+            keybase.Keybase('nobody')
+        assert keybase.lookup(['nobody', 'nobody']) == (None, None)
+        assert keybase.discover(keybase.GITHUB, ['nobody']) == ()
+        assert keybase.discover(keybase.GITHUB, ['nobody']) == ()
+        assert [params.get('username', params.get('github')) for params in fake_api] == ['nobody', 'nobody']
+        stats = cache.stats()
+        assert stats['hits'] == 3 and stats['size'] == 2
+        assert stats['false_positive_rate'] < cache.error_rate
+    finally:
+        keybase.set_negative_cache(previous)
+
+def test_negative_cache_bloom_filter(monkeypatch):
+    '''
+    The Bloom filters stay near their error rate when full and are retired
+    once they're too full or too old.
+    '''
+    cache = keybase.KeybaseNegativeCache(ttl=60, capacity=2000, error_rate=0.01)
+    for i in range(2000):
+        cache.add('username:missing{}'.format(i))
+    assert all(cache.contains('username:missing{}'.format(i)) for i in range(2000))
+    false_positives = sum(cache.contains('username:user{}'.format(i)) for i in range(20000))
+    assert false_positives / 20000.0 < 0.02
+    assert 0.005 < cache.stats()['false_positive_rate'] < 0.02
+    for i in range(20):
+        cache.add('username:overflow{}'.format(i))
+    assert cache.stats()['rebuilds'] == 1
+    assert cache.contains('username:missing0') and cache.contains('username:overflow19')
+    now = time.time()
+    monkeypatch.setattr('time.time', lambda: now + 61)
+    assert cache.contains('username:overflow19')
+    assert not cache.contains('username:missing0')
+    monkeypatch.setattr('time.time', lambda: now + 200)
+    assert not cache.contains('username:overflow19')
+    assert cache.stats()['size'] == 0
+
+def test_circuit_breaker_serves_stale_users(monkeypatch, golden, irc_user_object):
+    '''
+    Failing calls open the breaker, after which lookups are served from
+    expired cache entries without going to the network and users that
+    aren't cached fail fast.
+    '''
+    import requests
+    calls = []
+    def unreachable(url, params=None, **kwargs):
+        calls.append(kwargs)
+        raise requests.exceptions.ConnectTimeout('too slow')
+    monkeypatch.setattr(requests, 'get', unreachable)
+    monkeypatch.setattr(keybase, 'api_breaker', keybase.KeybaseCircuitBreaker(failure_threshold=2, reset_timeout=60))
+    cache = keybase.KeybaseUserCache(ttl=-1)
+    cache.put('irc', irc_user_object())
+    previous = keybase.set_user_cache(cache)
+    try:
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.ConnectTimeout):
+                keybase.Keybase('irc')
+        assert calls[0]['timeout'] == (keybase.API_CONNECT_TIMEOUT, keybase.API_READ_TIMEOUT)
+        assert keybase.api_breaker.state == 'open'
+        with keybase.Keybase('irc') as kbase:
+            assert kbase.get_public_key().key_fingerprint == golden.fingerprint
+        assert [user.username for user in keybase.lookup(['irc', 'irc'])] == ['irc', 'irc']
+        assert [user.username for user in keybase.iter_lookup(['irc'])] == ['irc']
+        with pytest.raises(keybase.KeybaseUnavailableError):
+            keybase.Keybase('nobody')
+        with pytest.raises(keybase.KeybaseUnavailableError):
+            keybase.discover(keybase.GITHUB, ['ianchesal'])
+        assert len(calls) == 2
+        assert cache.stats()['stale_hits'] == 3
+        stats = keybase.api_breaker.stats()
+        assert (stats['state'], stats['opened'], stats['rejected']) == ('open', 1, 5)
+        now = time.time()
+        monkeypatch.setattr('time.time', lambda: now + 61)
+        assert keybase.api_breaker.state == 'half-open'
+        monkeypatch.setattr(requests, 'get', lambda url, params=None, **kwargs: FakeResponse({
+            'status': {'code': 0, 'name': 'OK'}, 'them': irc_user_object()}))
+        keybase.Keybase('irc').close()
+        assert keybase.api_breaker.state == 'closed'
+    finally:
+        keybase.set_user_cache(previous)
+
+class FakeResponse(object):
+    '''
+    Just enough of a requests response for _get_json_from_url.
+    '''
+    def __init__(self, document, status_code=200):
+        self.content = json.dumps(document).encode('utf-8')
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        pass
+
+def test_hedged_requests(monkeypatch):
+    '''
+    A request that's slower than the hedge delay is sent again and the
+    first answer wins.
+    '''
+    import requests
+    import threading
+    calls = []
+    lock = threading.Lock()
+    def slow_first(url, params=None, **kwargs):
+        with lock:
+            calls.append(url)
+            first = len(calls) == 1
+        if first:
+            time.sleep(1.0)
+        return FakeResponse({'status': {'code': 0, 'name': 'OK'}, 'salt': 'first' if first else 'hedge'})
+    monkeypatch.setattr(requests, 'get', slow_first)
+    monkeypatch.setattr(keybase, 'api_breaker', keybase.KeybaseCircuitBreaker())
+    hedger = keybase.KeybaseHedger(delay=0.05)
+    previous = keybase.set_hedger(hedger)
+    try:
+        start = time.time()
+        assert keybase._get_json_from_url('http://example.com/getsalt.json', {})['salt'] == 'hedge'
+        assert time.time() - start < 0.5
+        assert keybase._get_json_from_url('http://example.com/getsalt.json', {})['salt'] == 'hedge'
+        stats = hedger.stats()
+        assert (stats['requests'], stats['hedged'], stats['hedge_wins']) == (2, 1, 1)
+    finally:
+        keybase.set_hedger(previous)
+        hedger.close()
+    adaptive = keybase.KeybaseHedger(min_samples=3)
+    assert adaptive.delay() == 1.0
+    for _ in range(3):
+        adaptive.call(lambda: None)
+    assert adaptive.delay() < 0.1
+    adaptive.close()
+
+def test_queued_requests_are_not_hedged():
+    '''
+    Calls waiting for a free thread in a busy hedger aren't hedged because
+    of the time they spent queued.
+    '''
+    from concurrent import futures
+    hedger = keybase.KeybaseHedger(delay=0.15, max_workers=2)
+    def request():
+        time.sleep(0.1)
+        return 'ok'
+    try:
+        with futures.ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: hedger.call(request), range(8)))
+        assert results == ['ok'] * 8
+        assert hedger.stats()['hedged'] == 0
+    finally:
+        hedger.close()
+
+def test_transport_carries_requests(monkeypatch, irc_user_object):
+    '''
+    An installed transport sends every API request, streamed or not.
+    '''
+    monkeypatch.setattr(keybase, 'api_breaker', keybase.KeybaseCircuitBreaker())
+    class Transport(object):
+        def __init__(self):
+            self.requests = []
+
+        def request(self, method, url, params=None, stream=False, timeout=None):
+            self.requests.append((method, url.rsplit('/', 1)[-1], stream, timeout))
+            response = FakeResponse({'status': {'code': 0, 'name': 'OK'}, 'them': [irc_user_object()]})
+            response.iter_content = lambda chunk_size: iter([response.content])
+            response.close = lambda: None
+            return response
+    transport = Transport()
+    previous = keybase.set_transport(transport)
+    try:
+        assert [user.username for user in keybase.lookup(['irc'])] == ['irc']
+        assert [user.username for user in keybase.iter_lookup(['irc'])] == ['irc']
+    finally:
+        assert keybase.set_transport(previous) is transport
+    timeout = (keybase.API_CONNECT_TIMEOUT, keybase.API_READ_TIMEOUT)
+    assert transport.requests == [('get', 'lookup.json', False, timeout), ('get', 'lookup.json', True, timeout)]
+
+def test_serialized_users_and_keys(fake_api, golden, irc_user_object):
+    '''
+    Users and keys survive pickle and dumps() round trips without going
+    back to the API, and keep the sections they were fetched with.
+    '''
+    import pickle
+    kbase = keybase.Keybase('irc', fields=('profile', 'public_keys'))
+    for copy in (pickle.loads(pickle.dumps(kbase)), keybase.loads(keybase.dumps(kbase))):
+        assert copy.username == 'irc'
+        assert copy.name == 'Ian Chesal'
+        assert copy.to_dict() == kbase.to_dict()
+        assert copy.get_public_key().key_fingerprint == golden.fingerprint
+        copy.close()
+    assert len(fake_api) == 1
+    pkey = keybase.loads(keybase.dumps(kbase.get_public_key()))
+    assert pkey.homedir is None
+    assert pkey.to_dict() == irc_user_object()['public_keys']['primary']
+    with pytest.raises(keybase.KeybaseError):
+        keybase.dumps(kbase, serializer='yaml')
+    with pytest.raises(keybase.KeybaseError):
+        keybase.loads(b'{"neither": 1}')
+    kbase.close()
@@ -0,0 +1,86 @@
+'''
+Tests for verifying directories against signed checksum manifests.
+'''
+
+import hashlib
+import os
+
+import pytest
+
+from keybase import keybase
+from keybase import manifest
+
+def make_release(root, files):
+    '''
+    Writes ``files``, a dictionary of names to contents, under ``root`` and
+    a SHA256SUMS manifest for them. Returns the name of the manifest.
+    '''
+    lines = []
+    for (name, content) in sorted(files.items()):
+        path = os.path.join(str(root), *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fobj:
+            fobj.write(content)
+        lines.append('{}  {}\n'.format(hashlib.sha256(content).hexdigest(), name))
+    sums = os.path.join(str(root), 'SHA256SUMS')
+    with open(sums, 'w') as fobj:
+        fobj.write(''.join(lines))
+    return sums
+
+def test_verify_manifest(tmpdir, keypair, monkeypatch):
+    '''
+    A detached-signed manifest reports matching, mismatched, missing and
+    extra files, hashing big files through a memory map.
+    '''
+    monkeypatch.setattr(manifest, 'MMAP_THRESHOLD', 4096)
+    files = {
+        'a.txt': b'hello\n',
+        'dir/big.bin': os.urandom(64 * 1024),
+        'dir/sub/c.txt': b'',
+        'gone.txt': b'bye\n',
+        'tampered.txt': b'original\n',
+    }
+    sums = make_release(tmpdir, files)
+    sig = keypair.sign(sums)
+    os.remove(os.path.join(str(tmpdir), 'gone.txt'))
+    tmpdir.join('tampered.txt').write(b'changed\n', mode='wb')
+    tmpdir.join('dir', 'extra.txt').write(b'?')
+    with keypair.public_key() as pkey:
+        report = manifest.verify_manifest(pkey, sums, sig, jobs=4)
+    assert report.matched == ['a.txt', 'dir/big.bin', 'dir/sub/c.txt']
+    assert report.mismatched == ['tampered.txt']
+    assert report.missing == ['gone.txt']
+    assert report.extra == ['dir/extra.txt']
+    assert not report.ok
+    assert report.bytes == 6 + 64 * 1024 + len(b'changed\n')
+    assert 'MB/s' in report.summary()
+
+def test_verify_clear_signed_manifest(tmpdir, keypair):
+    '''
+    A clear-signed manifest in a different directory to the files it lists
+    verifies, and one that's been edited after signing doesn't.
+    '''
+    release = tmpdir.mkdir('release')
+    sums = make_release(release, {'a.txt': b'a', 'b/c.txt': b'c'})
+    signed = keypair.sign(sums, detach=False)
+    os.remove(sums)
+    with keypair.public_key() as pkey:
+        report = manifest.verify_manifest(pkey, signed, root=str(release))
+        assert report.ok
+        assert report.matched == ['a.txt', 'b/c.txt']
+        with open(signed, 'rb') as fobj:
+            text = fobj.read()
+        tmpdir.join('forged.asc').write(text.replace(b'a.txt', b'A.txt'), mode='wb')
+        with pytest.raises(keybase.KeybasePublicKeyVerifyError):
+            manifest.verify_manifest(pkey, str(tmpdir.join('forged.asc')), root=str(release))
+
+def test_parse_manifest_rejects_unsafe_names():
+    '''
+    Names that would reach outside of the manifest's directory and lines
+    that aren't checksums are rejected.
+    '''
+    digest = '0' * 64
+    assert manifest.parse_manifest('SHA256 (x/y) = {}\n'.format(digest).encode()) == {'x/y': ('sha256', digest)}
+    for line in ('{}  ../etc/passwd', '{}  /etc/passwd', '{}  a/../../b', 'not a checksum {}'):
+        with pytest.raises(manifest.ManifestFormatError):
+            manifest.parse_manifest(line.format(digest).encode())
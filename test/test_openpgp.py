@@ -0,0 +1,282 @@
+'''
+Tests for the structural OpenPGP checks in keybase.openpgp and their use
+before gpg runs.
+'''
+
+import base64
+import os
+
+import pytest
+
+from keybase import keybase
+from keybase import openpgp
+
+def armor(label, payload, checksum=None):
+    '''
+    Returns ``payload`` ASCII armored with ``label``.
+    '''
+    if checksum is None:
+        checksum = openpgp.crc24(payload)
+    return b''.join([
+        '-----BEGIN {}-----\nVersion: test\n\n'.format(label).encode('ascii'),
+        base64.encodebytes(payload),
+        b'=', base64.b64encode(checksum.to_bytes(3, 'big')), b'\n',
+        '-----END {}-----\n'.format(label).encode('ascii')])
+
+def test_key_ids(golden):
+    '''
+    Key IDs are derived from the bundle's primary key and subkey.
+    '''
+    assert openpgp.key_ids(golden.read('irc.public.key', 'r')) == ('F56B7A6F0A32A0B9', 'EEF332670C1CC080')
+
+def test_precheck_accepts_golden_signatures(golden):
+    '''
+    Binary, armored and clear-signed messages all pass and name the
+    subkey that signed them.
+    '''
+    sig = golden.read('helloworld.txt.sig')
+    assert openpgp.precheck_signature(golden.read('helloworld.txt.gpg'))[0] == 'EEF332670C1CC080'
+    assert openpgp.precheck_signature(sig) == ['EEF332670C1CC080']
+    assert openpgp.precheck_signature(armor('PGP SIGNATURE', sig)) == ['EEF332670C1CC080']
+    clearsigned = (b'-----BEGIN PGP SIGNED MESSAGE-----\nHash: SHA1\n\nHello, world!\n' +
+                   armor('PGP SIGNATURE', sig))
+    assert openpgp.precheck_signature(clearsigned, ['eef332670c1cc080']) == ['EEF332670C1CC080']
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'Hello, world!',
+    b'-----BEGIN PGP SIGNATURE-----\n\nnot base64!\n-----END PGP SIGNATURE-----\n',
+    b'-----BEGIN PGP SIGNATURE-----\n\niQEc\n',
+    b'-----BEGIN PGP PUBLIC KEY BLOCK-----\n\nxsFN\n-----END PGP PUBLIC KEY BLOCK-----\n',
+    b'\xcb\x03abc',
+    b'\x89\x01\x1c\x04\x00',
+    bytes(range(128, 256)),
+])
+def test_precheck_rejects_garbage(data):
+    '''
+    Input that isn't a well-formed signature is rejected.
+    '''
+    with pytest.raises(openpgp.OpenPGPFormatError):
+        openpgp.precheck_signature(data)
+
+def test_precheck_checks_crc_and_issuer(golden):
+    '''
+    A bad armor checksum and a signature by another key are caught.
+    '''
+    sig = golden.read('helloworld.txt.sig')
+    with pytest.raises(openpgp.OpenPGPFormatError):
+        openpgp.precheck_signature(armor('PGP SIGNATURE', sig, checksum=0x123456))
+    with pytest.raises(openpgp.OpenPGPIssuerError):
+        openpgp.precheck_signature(sig, ['F56B7A6F0A32A0B9'])
+
+def test_verify_skips_gpg_for_garbage(monkeypatch, golden):
+    '''
+    Rejected input fails with gpg's status messages without running gpg.
+    '''
+    pkey = keybase.KeybasePublicKey(bundle=golden.read('irc.public.key', 'r'), key_fingerprint=golden.fingerprint)
+    runs = []
+    run_gpg = keybase._run_gpg
+    def counting_run_gpg(command, **kwargs):
+        runs.append(command)
+        return run_gpg(command, **kwargs)
+    monkeypatch.setattr(keybase, '_run_gpg', counting_run_gpg)
+    try:
+        with pytest.raises(keybase.KeybasePublicKeyVerifyError) as err:
+            pkey.verify_bytes(b'\x00' * 1024, throw_error=True)
+        assert str(err.value) == 'signature error'
+        monkeypatch.setattr(keybase.KeybasePublicKey, 'key_ids', ('F56B7A6F0A32A0B9',))
+        with pytest.raises(keybase.KeybasePublicKeyVerifyError) as err:
+            pkey.verify_bytes(golden.read('helloworld.txt.gpg'), throw_error=True)
+        assert str(err.value) == 'no public key'
+        assert runs == []
+        monkeypatch.undo()
+        assert pkey.verify_bytes(golden.read('helloworld.txt.gpg'))
+    finally:
+        pkey.close()
+
+def packet(tag, body):
+    '''
+    Returns a new format OpenPGP packet with ``tag`` and ``body``.
+    '''
+    return bytes([0xc0 | tag, len(body)]) + body
+
+def key_packet(algorithm, created):
+    '''
+    Returns the body of a version 4 key packet with made up key material.
+    '''
+    return b'\x04' + created.to_bytes(4, 'big') + bytes([algorithm]) + bytes([created % 256]) * 8
+
+def self_signature(sigtype, issuer, created, flags=None, expiration=None):
+    '''
+    Returns a version 4 signature packet by ``issuer`` with the given
+    hashed subpackets and no actual signature in it.
+    '''
+    hashed = b'\x05\x02' + created.to_bytes(4, 'big')
+    if flags is not None:
+        hashed += b'\x02\x1b' + bytes([flags])
+    if expiration is not None:
+        hashed += b'\x05\x09' + expiration.to_bytes(4, 'big')
+    unhashed = b'\x09\x10' + bytes.fromhex(issuer)
+    body = bytes([4, sigtype, 22, 8]) + len(hashed).to_bytes(2, 'big') + hashed + len(unhashed).to_bytes(2, 'big') + unhashed + b'\x00\x00'
+    return packet(openpgp.TAG_SIGNATURE, body)
+
+def test_key_family_golden(golden):
+    '''
+    The golden key's subkey expired in 2022, after which the primary key is
+    the one to encrypt to, just like gpg decides.
+    '''
+    family = openpgp.key_family(golden.read('irc.public.key', 'r'))
+    assert [(key.key_id, key.primary) for key in family] == [('F56B7A6F0A32A0B9', True), ('EEF332670C1CC080', False)]
+    assert family[0].fingerprint == golden.fingerprint.upper()
+    assert family[0].expires is None
+    assert family[1].expires == 1648691140
+    assert openpgp.encryption_key(family, now=1500000000) is family[1]
+    assert openpgp.encryption_key(family) is family[0]
+    assert openpgp.signing_key_ids(family) == ('F56B7A6F0A32A0B9', 'EEF332670C1CC080')
+
+def test_key_family_flags_and_revocation():
+    '''
+    Key flags, expiration and revocation come from the primary key's own
+    signatures; other people's signatures are ignored.
+    '''
+    primary = key_packet(22, 1000)
+    primary_id = openpgp.key_ids(packet(openpgp.TAG_PUBLIC_KEY, primary))[0]
+    bundle = b''.join([
+        packet(openpgp.TAG_PUBLIC_KEY, primary),
+        packet(openpgp.TAG_USER_ID, b'Test <test@example.com>'),
+        self_signature(0x13, primary_id, 1000, flags=0x03),
+        self_signature(0x13, primary_id, 2000, flags=0x01, expiration=10000),
+        self_signature(0x10, '0123456789ABCDEF', 3000, flags=0x0c),
+        packet(openpgp.TAG_PUBLIC_SUBKEY, key_packet(18, 1100)),
+        self_signature(0x18, primary_id, 1100, flags=0x0c),
+        packet(openpgp.TAG_PUBLIC_SUBKEY, key_packet(18, 1200)),
+        self_signature(0x18, primary_id, 1200, flags=0x0c),
+        self_signature(0x28, primary_id, 1300),
+        packet(openpgp.TAG_PUBLIC_SUBKEY, key_packet(22, 1300)),
+        self_signature(0x18, primary_id, 1300, flags=0x02, expiration=100),
+        packet(openpgp.TAG_PUBLIC_SUBKEY, key_packet(18, 1400)),
+        self_signature(0x18, '0123456789ABCDEF', 1400, flags=0x0c),
+    ])
+    (main, older, revoked, signer, foreign) = openpgp.key_family(armor('PGP PUBLIC KEY BLOCK', bundle))
+    assert (main.flags, main.expires, main.can_sign, main.can_encrypt) == (0x01, 11000, False, False)
+    assert main.expired(11000) and not main.expired(10999)
+    assert older.can_encrypt and not older.revoked
+    assert revoked.revoked and not revoked.usable(0)
+    assert signer.can_sign and not signer.can_encrypt and signer.expires == 1400
+    assert foreign.flags is None and foreign.can_encrypt
+    family = (main, older, revoked, signer, foreign)
+    assert openpgp.encryption_key(family, now=5000) is foreign
+    assert openpgp.encryption_key((main, older, revoked), now=5000) is older
+    assert openpgp.encryption_key((main, revoked), now=5000) is None
+    assert openpgp.signing_key_ids(family) == (main.key_id, signer.key_id)
+
+def test_encrypt_picks_key_without_listing(keypair, monkeypatch):
+    '''
+    Encryption hands gpg the encryption subkey picked from the bundle and
+    never asks gpg to list its keys.
+    '''
+    import gnupg
+    def no_listing(*args, **kwargs):
+        raise AssertionError('list_keys called')
+    monkeypatch.setattr(gnupg.GPG, 'list_keys', no_listing)
+    pkey = keypair.public_key()
+    try:
+        subkey = pkey.key_family[1]
+        assert pkey.encryption_key() is subkey
+        assert pkey.signing_key_ids == (pkey.key_ids[0],)
+        for encrypted in (pkey.encrypt_bytes(b'Hello, world!'), pkey.encrypt(b'Hello, world!', armor=False).data):
+            assert keypair.decrypt(encrypted) == b'Hello, world!'
+            recipients = keypair.gpg(['--list-packets', '--list-only'], data=encrypted).decode('ascii')
+            assert 'keyid {}'.format(subkey.key_id) in recipients
+    finally:
+        pkey.close()
+
+def test_check_signers():
+    '''
+    Signatures by revoked keys fail, and so do ones made after the key
+    that made them, or its primary key, had expired.
+    '''
+    primary = openpgp.OpenPGPKey('A' * 40, 22, 1000, True)
+    signer = openpgp.OpenPGPKey('B' * 40, 22, 1000, False)
+    signer.expires = 5000
+    family = (primary, signer)
+    openpgp.check_signers(family, [signer.key_id], made=4999)
+    openpgp.check_signers(family, [signer.key_id])
+    with pytest.raises(openpgp.OpenPGPExpiredError):
+        openpgp.check_signers(family, [signer.key_id], made=5000)
+    primary.expires = 3000
+    with pytest.raises(openpgp.OpenPGPExpiredError):
+        openpgp.check_signers(family, [primary.key_id, signer.key_id], made=4000)
+    signer.revoked = True
+    with pytest.raises(openpgp.OpenPGPRevokedError):
+        openpgp.check_signers(family, [signer.key_id])
+    openpgp.check_signers(family, ['0123456789ABCDEF'])
+    primary.revoked = True
+    with pytest.raises(openpgp.OpenPGPRevokedError):
+        openpgp.check_signers(family, [])
+
+def make_dated_key(homedir, when, expire):
+    '''
+    Makes a key with an encryption subkey in the gpg home directory
+    ``homedir`` as if it were ``when``, clear-signs a message with it and
+    returns ``(fingerprint, signed message)``.
+    '''
+    import subprocess
+    def gpg(*args):
+        return subprocess.run(
+            [keybase.gpg(), '--homedir', homedir, '--batch', '--yes', '--pinentry-mode', 'loopback',
+             '--passphrase', '', '--faked-system-time', when] + list(args),
+            input=b'Hello, world!\n', stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    gpg('--quick-gen-key', 'Keybase Test <test@example.com>', 'ed25519', 'sign,cert', expire)
+    fingerprint = [line.split(':')[9] for line in gpg('--with-colons', '--list-keys').decode('ascii').splitlines() if line.startswith('fpr:')][0]
+    gpg('--quick-add-key', fingerprint, 'cv25519', 'encr', expire)
+    return (fingerprint, gpg('--armor', '--clearsign'))
+
+def test_unusable_keys_fail_fast(tmpdir, monkeypatch, golden):
+    '''
+    Expired and revoked keys are turned away by encrypt and revoked ones
+    by verify before any gpg work, and usable_keys() filters them out.
+    '''
+    import subprocess
+    def export(homedir, fingerprint):
+        bundle = subprocess.run([keybase.gpg(), '--homedir', homedir, '--armor', '--export', fingerprint],
+                                stdout=subprocess.PIPE, check=True).stdout.decode('ascii')
+        return {'bundle': bundle, 'key_fingerprint': fingerprint.lower()}
+    homedirs = [str(tmpdir.mkdir(name)) for name in ('expired', 'revoked')]
+    for homedir in homedirs:
+        os.chmod(homedir, 0o700)
+    (expired_fpr, expired_message) = make_dated_key(homedirs[0], '20200101T000000', '1y')
+    (revoked_fpr, revoked_message) = make_dated_key(homedirs[1], '20200101T000000', 'never')
+    with open(os.path.join(homedirs[1], 'openpgp-revocs.d', revoked_fpr + '.rev'), 'r') as fobj:
+        certificate = fobj.read().replace('\n:-----BEGIN', '\n-----BEGIN')
+    subprocess.run([keybase.gpg(), '--homedir', homedirs[1], '--batch', '--import'],
+                   input=certificate.encode('ascii'), stderr=subprocess.DEVNULL, check=True)
+    expired = keybase.KeybasePublicKey.from_dict(export(homedirs[0], expired_fpr))
+    revoked = keybase.KeybasePublicKey.from_dict(export(homedirs[1], revoked_fpr))
+    golden_key = keybase.KeybasePublicKey.from_dict({'bundle': golden.read('irc.public.key', 'r'), 'key_fingerprint': golden.fingerprint})
+    assert expired.expires.year == 2020 and expired.expired() and not expired.revoked
+    assert revoked.revoked and revoked.expires is None
+    def no_gpg(*args, **kwargs):
+        raise AssertionError('gpg run')
+    monkeypatch.setattr(keybase, '_run_gpg', no_gpg)
+    for (pkey, status) in ((expired, 'key exp'), (revoked, 'key rev')):
+        for encrypt in (pkey.encrypt, pkey.encrypt_bytes):
+            with pytest.raises(keybase.KeybasePublicKeyEncryptError) as err:
+                encrypt(b'Hello, world!')
+            assert str(err.value) == status
+    with pytest.raises(keybase.KeybasePublicKeyVerifyError) as err:
+        revoked.verify_bytes(revoked_message, throw_error=True)
+    assert str(err.value) == 'key rev'
+    assert (expired.homedir, revoked.homedir) == (None, None)
+    monkeypatch.undo()
+    assert expired.verify_bytes(expired_message)
+    assert keybase.usable_keys([expired, revoked, golden_key]) == [golden_key]
+    assert keybase.usable_keys([expired, revoked, golden_key], purpose='verify') == [expired, golden_key]
+    assert keybase.usable_keys([expired], now=1590000000) == [expired]
+    kbase = keybase.Keybase._from_user_object('expired', {'public_keys': {'primary': expired.to_dict()}})
+    monkeypatch.setattr(keybase, '_GPG_CONFIG_CACHE', dict())
+    monkeypatch.setattr(subprocess, 'Popen', no_gpg)
+    assert keybase.usable_keys([kbase]) == []
+    monkeypatch.undo()
+    for pkey in (expired, revoked, golden_key):
+        pkey.close()
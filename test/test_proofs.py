@@ -0,0 +1,110 @@
+'''
+Tests for checking identity proofs against a local stand-in web server.
+'''
+
+import json
+import threading
+import time
+
+from keybase import keybase
+from keybase import proofs
+
+class ProofServer(object):
+    '''
+    Serves ``pages``, a dictionary of paths to page bodies, from localhost
+    with the ``serve`` fixture and keeps track of the requests made and
+    how many were in flight at once.
+    '''
+    def __init__(self, serve, pages, delay=0.05):
+        from http.server import BaseHTTPRequestHandler
+        server = self
+        self.requests = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests.append(self.path)
+                    server.active += 1
+                    server.peak = max(server.peak, server.active)
+                try:
+                    time.sleep(delay)
+                    body = pages.get(self.path)
+                    self.send_response(404 if body is None else 200)
+                    self.send_header('Content-Type', 'text/html')
+                    self.send_header('Content-Length', str(len(body or b'')))
+                    self.end_headers()
+                    self.wfile.write(body or b'')
+                finally:
+                    with server.lock:
+                        server.active -= 1
+
+            def log_message(self, *args):
+                pass
+        self.base_url = serve(Handler).url
+
+def statement(keypair, username, account):
+    '''
+    Returns an armored Keybase proof statement binding ``keypair`` and
+    ``username`` to the GitHub ``account``, signed by ``keypair``.
+    '''
+    body = {'body': {
+        'key': {'fingerprint': keypair.fingerprint, 'username': username},
+        'service': {'name': 'github', 'username': account},
+        'type': 'web_service_binding',
+        'version': 1}}
+    return keypair.gpg(['--armor', '--sign'], data=json.dumps(body).encode('utf-8'))
+
+def test_check_proofs(keypair, serve):
+    '''
+    Live proofs pass and proofs that were taken down, never signed or
+    signed for another account fail. No more than per_host pages are
+    fetched from one host at once, hosts are forgotten once nothing is
+    being fetched from them and results come from the cache the second
+    time.
+    '''
+    good = statement(keypair, 'tester', 'tester-gh')
+    pages = {
+        '/good': b'<html><pre>' + good.replace(b'+', b'&#43;') + b'</pre></html>',
+        '/other': statement(keypair, 'tester', 'someone-else'),
+        '/unsigned': b'<html>I am tester on Keybase.</html>',
+    }
+    for index in range(6):
+        pages['/more{}'.format(index)] = good
+    server = ProofServer(serve, pages)
+    def proof(path):
+        return {'proof_type': 'github', 'nametag': 'tester-gh', 'proof_url': server.base_url + path, 'sig_id': path}
+    all_proofs = [proof('/good'), proof('/other'), proof('/unsigned'), proof('/gone'),
+                  {'proof_type': 'dns', 'nametag': 'example.com', 'sig_id': 'dns'}]
+    all_proofs.extend(proof('/more{}'.format(index)) for index in range(6))
+    user = keybase.Keybase._from_user_object('tester', {
+        'basics': {'username': 'tester'},
+        'public_keys': {'primary': {'bundle': keypair.bundle, 'key_fingerprint': keypair.fingerprint}},
+        'proofs_summary': {'all': all_proofs},
+    })
+    checker = proofs.ProofChecker(max_workers=8, per_host=2)
+    try:
+        results = checker.check([user])
+        assert [result.status for result in results[:5]] == [
+            'ok', 'wrong account', 'no statement', 'not found', 'unsupported']
+        assert all(result.ok for result in results[5:])
+        assert server.peak == 2
+        assert len(server.requests) == 10
+        assert checker._ProofChecker__hosts == {}
+        assert [result.status for result in checker.check([user])] == [result.status for result in results]
+        assert len(server.requests) == 10
+        assert checker.cache.stats()['hits'] == len(all_proofs)
+    finally:
+        user.close()
+
+def test_unreachable_proofs_are_not_cached():
+    '''
+    Proofs on hosts that can't be reached are reported and checked again
+    next time.
+    '''
+    user = keybase.Keybase._from_user_object('tester', {'proofs_summary': {'all': [
+        {'proof_type': 'generic_web_site', 'nametag': 'example.com', 'proof_url': 'http://127.0.0.1:1/keybase.txt'}]}})
+    checker = proofs.ProofChecker()
+    assert [result.status for result in checker.check([user])] == ['unreachable']
+    assert checker.cache.stats()['size'] == 0
@@ -247,6 +247,104 @@ def test_discover():
     assert not encrypted2.isspace()
     assert encrypted2 != instring
 
+def test_verify_bytes_embedded_sig():
+    '''
+    Verifies the signature on the binary, embedded-signature golden file
+    handed over as bytes, as a bytearray, as a memoryview and as an open
+    file object.
+    '''
+    key_fingerprint = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+    pkey = keybase.KeybasePublicKey(bundle=GPG_KEY_DATA, key_fingerprint=key_fingerprint)
+    fname = os.path.join(os.getcwd(), 'test', 'golden', 'helloworld.txt.gpg')
+    with open(fname, 'rb') as fobj:
+        signed = fobj.read()
+    assert pkey.verify_bytes(signed, throw_error=True)
+    assert pkey.verify_bytes(bytearray(signed))
+    assert pkey.verify_bytes(memoryview(signed))
+    with open(fname, 'rb') as fobj:
+        assert pkey.verify_bytes(fobj)
+    corrupted = bytearray(signed)
+    corrupted[-40] ^= 0xff
+    assert not pkey.verify_bytes(corrupted)
+
+def test_encrypt_bytes_outputs():
+    '''
+    Verifies that binary encryption works when returning bytes, when
+    writing in to a caller-supplied buffer and when writing to a file.
+    '''
+    key_fingerprint = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+    pkey = keybase.KeybasePublicKey(bundle=GPG_KEY_DATA, key_fingerprint=key_fingerprint)
+    indata = b'Hello, world!' * 100
+    encrypted = pkey.encrypt_bytes(memoryview(indata))
+    assert isinstance(encrypted, bytes)
+    assert not encrypted.startswith(b'-----BEGIN PGP MESSAGE-----')
+    assert indata not in encrypted
+    buf = bytearray(len(encrypted) + 1024)
+    count = pkey.encrypt_bytes(indata, output=buf)
+    assert 0 < count <= len(buf)
+    try:
+        pkey.encrypt_bytes(indata, output=bytearray(16))
+    except keybase.KeybasePublicKeyEncryptError:
+        pass
+    else:
+        assert False, 'expected a KeybasePublicKeyEncryptError'
+    with tempfile.TemporaryFile() as fobj:
+        count = pkey.encrypt_bytes(bytearray(indata), output=fobj)
+        fobj.seek(0)
+        assert len(fobj.read()) == count
+
+def test_verify_detached():
+    '''
+    Verifies the detached golden signature with the data and the signature
+    handed over in memory, as file objects and as file-like objects that
+    aren't backed by a file.
+    '''
+    import io
+    key_fingerprint = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+    pkey = keybase.KeybasePublicKey(bundle=GPG_KEY_DATA, key_fingerprint=key_fingerprint)
+    golden = os.path.join(os.getcwd(), 'test', 'golden')
+    with open(os.path.join(golden, 'helloworld.txt'), 'rb') as fobj:
+        data = fobj.read()
+    with open(os.path.join(golden, 'helloworld.txt.sig'), 'rb') as fobj:
+        signature = fobj.read()
+    assert pkey.verify_detached(data, signature, throw_error=True)
+    assert pkey.verify_detached(memoryview(data), bytearray(signature))
+    assert pkey.verify_detached(io.BytesIO(data), io.BytesIO(signature))
+    with open(os.path.join(golden, 'helloworld.txt'), 'rb') as fobj:
+        assert pkey.verify_detached(fobj, signature)
+    try:
+        pkey.verify_detached(data + b'!', signature, throw_error=True)
+    except keybase.KeybasePublicKeyVerifyError as err:
+        assert str(err) == 'signature bad'
+    else:
+        assert False, 'expected a KeybasePublicKeyVerifyError'
+    assert not pkey.verify_detached(data, signature[:-10])
+    pkey.close()
+
+def test_encrypt_auto_compression():
+    '''
+    compress_algo='auto' skips compression for random data, compresses
+    text and samples files without moving their position.
+    '''
+    key_fingerprint = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+    pkey = keybase.KeybasePublicKey(bundle=GPG_KEY_DATA, key_fingerprint=key_fingerprint)
+    chooser = keybase.compression_chooser
+    before = chooser.stats()['decisions']
+    noise = os.urandom(256 * 1024)
+    text = b'Hello, world! ' * 20000
+    assert len(pkey.encrypt_bytes(noise, compress_algo='auto')) > len(noise)
+    assert len(pkey.encrypt_bytes(text, compress_algo='auto')) < len(text) // 10
+    assert pkey.encrypt(text.decode('ascii'), compress_algo='auto')
+    with tempfile.TemporaryFile() as fobj:
+        fobj.write(noise)
+        fobj.seek(1024)
+        encrypted = pkey.encrypt_bytes(fobj, compress_algo='auto')
+        assert len(noise) - 1024 < len(encrypted) < len(noise)
+    decisions = chooser.stats()['decisions']
+    assert decisions.get('Uncompressed', 0) - before.get('Uncompressed', 0) == 2
+    assert decisions.get('BZIP2', 0) - before.get('BZIP2', 0) == 1
+    pkey.close()
+
 # You can use this stuff for debugging interactively:
 #import logging
 #logging.basicConfig(level=logging.DEBUG)
@@ -256,3 +354,75 @@ def test_discover():
 #test_verify_file_detached_sig()
 #test_discover()
 
+
+def test_verify_cache():
+    '''
+    Repeated verifications are answered from the verification cache, which
+    is keyed on the key's mtime and can be invalidated per key.
+    '''
+    key_fingerprint = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+    pkey = keybase.KeybasePublicKey(bundle=GPG_KEY_DATA, key_fingerprint=key_fingerprint, mtime=1000)
+    golden = os.path.join(os.getcwd(), 'test', 'golden')
+    with open(os.path.join(golden, 'helloworld.txt.gpg'), 'rb') as fobj:
+        signed = fobj.read()
+    corrupted = bytearray(signed)
+    corrupted[-40] ^= 0xff
+    runs = []
+    run_gpg = keybase._run_gpg
+    def counting_run_gpg(command, **kwargs):
+        runs.append(command)
+        return run_gpg(command, **kwargs)
+    cache = keybase.KeybaseVerifyCache(max_entries=3)
+    previous = keybase.set_verify_cache(cache)
+    keybase._run_gpg = counting_run_gpg
+    try:
+        for _ in range(3):
+            assert pkey.verify_bytes(signed)
+            assert not pkey.verify_bytes(corrupted)
+            assert pkey.verify_file(os.path.join(golden, 'helloworld.txt'),
+                                    os.path.join(golden, 'helloworld.txt.sig'))
+        try:
+            pkey.verify_bytes(corrupted, throw_error=True)
+        except keybase.KeybasePublicKeyVerifyError as err:
+            assert str(err) == 'signature bad'
+        else:
+            assert False, 'expected a KeybasePublicKeyVerifyError'
+        assert len(runs) == 3
+        assert cache.stats() == {'hits': 7, 'misses': 3, 'hit_rate': 0.7, 'size': 3}
+        updated = keybase.KeybasePublicKey(bundle=GPG_KEY_DATA, key_fingerprint=key_fingerprint, mtime=2000)
+        assert updated.verify_bytes(signed)
+        assert len(runs) == 4
+        assert cache.invalidate(key_fingerprint) == 3
+        assert pkey.verify_bytes(signed)
+        assert len(runs) == 5
+        keybase._run_gpg = lambda command, **kwargs: (0, b'', [('NEWSIG', ''), ('REVKEYSIG', 'EEF332670C1CC080 irc')])
+        assert not pkey.verify_bytes(corrupted)
+        assert cache.stats()['size'] == 0
+        updated.close()
+    finally:
+        keybase._run_gpg = run_gpg
+        keybase.set_verify_cache(previous)
+        pkey.close()
+
+def test_verify_file_with_cache(tmpdir, monkeypatch):
+    '''
+    With the verification cache on, a file rewritten after a successful
+    verification is checked again rather than answered from the cache.
+    Signature file names that look like options work with or without it.
+    '''
+    key_fingerprint = '7cc0ce678c37fc27da3ce494f56b7a6f0a32a0b9'
+    pkey = keybase.KeybasePublicKey(bundle=GPG_KEY_DATA, key_fingerprint=key_fingerprint)
+    golden = os.path.join(os.getcwd(), 'test', 'golden')
+    monkeypatch.chdir(str(tmpdir))
+    shutil.copy(os.path.join(golden, 'helloworld.txt'), 'helloworld.txt')
+    shutil.copy(os.path.join(golden, 'helloworld.txt.sig'), '-helloworld.txt.sig')
+    assert pkey.verify_file('helloworld.txt', '-helloworld.txt.sig', throw_error=True)
+    previous = keybase.set_verify_cache(keybase.KeybaseVerifyCache())
+    try:
+        assert pkey.verify_file('helloworld.txt', '-helloworld.txt.sig', throw_error=True)
+        with open('helloworld.txt', 'ab') as fobj:
+            fobj.write(b'!')
+        assert not pkey.verify_file('helloworld.txt', '-helloworld.txt.sig')
+    finally:
+        keybase.set_verify_cache(previous)
+        pkey.close()
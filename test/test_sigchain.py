@@ -0,0 +1,230 @@
+'''
+Tests for syncing sigchains from a local stand-in for the keybase.io API.
+'''
+
+import hashlib
+import json
+import os
+import threading
+
+import pytest
+
+from keybase import keybase
+from keybase import openpgp
+from keybase import sigchain
+
+# The Keybase key ID the links made by extend() carry.
+KID = 'test-kid'
+
+class SigchainAPI(object):
+    '''
+    Serves sig/get.json from localhost with the ``serve`` fixture for the
+    chains in ``chains``, a dictionary of usernames to lists of links, and
+    records the ``low`` asked for in every request.
+    '''
+    def __init__(self, serve, chains):
+        from http.server import BaseHTTPRequestHandler
+        from urllib.parse import parse_qs, urlparse
+        api = self
+        self.chains = chains
+        self.requests = []
+        self.lock = threading.Lock()
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = parse_qs(urlparse(self.path).query)
+                username = params['username'][0]
+                low = int(params['low'][0])
+                with api.lock:
+                    api.requests.append((username, low))
+                if username in api.chains:
+                    body = {'status': {'code': 0, 'name': 'OK'},
+                            'sigs': [link for link in api.chains[username] if link['seqno'] >= low]}
+                else:
+                    body = {'status': {'code': 205, 'name': 'NOT_FOUND'}}
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+        self.base_url = serve(Handler).url + '/_/api/'
+
+@pytest.fixture
+def api(monkeypatch, serve):
+    '''
+    A SigchainAPI with no chains, installed as the keybase.io API.
+    '''
+    server = SigchainAPI(serve, dict())
+    monkeypatch.setattr(keybase, 'KEYBASE_BASE_URL', server.base_url)
+    monkeypatch.setattr(keybase, 'api_breaker', keybase.KeybaseCircuitBreaker())
+    return server
+
+def extend(chain, keypair, count, kid=KID):
+    '''
+    Appends ``count`` links signed by ``keypair`` to ``chain``, saying
+    they're by the key ``kid``. Without a ``keypair`` the links get a
+    stand-in for the NaCl signature of a Keybase device.
+    '''
+    for _ in range(count):
+        prev = hashlib.sha256(chain[-1]['payload_json'].encode('utf-8')).hexdigest() if chain else None
+        seqno = len(chain) + 1
+        payload = json.dumps({'seqno': seqno, 'prev': prev, 'body': {'type': 'track', 'version': 1}})
+        if keypair is None:
+            sig = 'g6Rib2R5hqhkZXRhY2hlZMM='
+        else:
+            sig = keypair.gpg(['--armor', '--sign'], data=payload.encode('utf-8')).decode('ascii')
+        chain.append({
+            'seqno': seqno,
+            'sig_id': 'sig{}'.format(seqno),
+            'kid': kid,
+            'payload_json': payload,
+            'payload_hash': hashlib.sha256(payload.encode('utf-8')).hexdigest(),
+            'sig': sig,
+        })
+    return chain
+
+def user(keypair, username='tester', public_keys=None):
+    '''
+    Returns a Keybase user whose primary key is ``keypair``, with the kid
+    the links made by extend() carry. ``public_keys`` replaces the
+    ``public_keys`` section of the user object if it's given.
+    '''
+    if public_keys is None:
+        public_keys = {'primary': {'bundle': keypair.bundle, 'key_fingerprint': keypair.fingerprint, 'kid': KID}}
+    return keybase.Keybase._from_user_object(username, {
+        'basics': {'username': username},
+        'public_keys': public_keys,
+    })
+
+def test_incremental_sync(api, keypair, tmpdir):
+    '''
+    Only links newer than the stored ones are fetched, checked and
+    appended.
+    '''
+    api.chains['tester'] = extend([], keypair, 3)
+    chain = sigchain.Sigchain('tester', str(tmpdir))
+    kbase = user(keypair)
+    try:
+        assert [link['seqno'] for link in chain.sync(kbase)] == [1, 2, 3]
+        assert chain.sync(kbase) == []
+        extend(api.chains['tester'], keypair, 2)
+        assert [link['seqno'] for link in chain.sync(kbase)] == [4, 5]
+        assert [low for (_, low) in api.requests] == [1, 4, 4]
+        assert [link['sig_id'] for link in chain.links()] == ['sig{}'.format(seqno) for seqno in range(1, 6)]
+        assert chain.seqno == 5
+        with open(chain.path, 'rb') as fobj:
+            assert len(fobj.read().splitlines()) == 5
+    finally:
+        kbase.close()
+
+def test_bad_links_are_not_stored(api, keypair, tmpdir):
+    '''
+    A batch of new links with a forged one in it is rejected as a whole and
+    a half written link left behind is dropped on the next sync.
+    '''
+    api.chains['tester'] = extend([], keypair, 2)
+    chain = sigchain.Sigchain('tester', str(tmpdir))
+    kbase = user(keypair)
+    try:
+        chain.sync(kbase)
+        extend(api.chains['tester'], keypair, 2)
+        forged = dict(api.chains['tester'][3])
+        forged['payload_json'] = forged['payload_json'].replace('track', 'untrack')
+        del forged['payload_hash']
+        api.chains['tester'][3] = forged
+        with pytest.raises(sigchain.SigchainVerifyError):
+            chain.sync(kbase)
+        assert chain.seqno == 2
+        api.chains['tester'] = api.chains['tester'][:3]
+        with open(chain.path, 'ab') as fobj:
+            fobj.write(b'{"seqno": 3, "payl')
+        assert [link['seqno'] for link in chain.sync(kbase)] == [3]
+        assert [link['seqno'] for link in chain.links()] == [1, 2, 3]
+    finally:
+        kbase.close()
+
+def test_sync_many(api, keypair, tmpdir):
+    '''
+    Chains are synced concurrently and failures are reported per user.
+    '''
+    for username in ('alice', 'bob', 'carol'):
+        api.chains[username] = extend([], keypair, 2)
+    users = [user(keypair, username) for username in ('alice', 'bob', 'carol')]
+    try:
+        results = sigchain.sync(users + ['nobody'], directory=str(tmpdir), max_workers=4)
+        assert [(result.username, result.seqno, len(result.new), result.ok) for result in results] == [
+            ('alice', 2, 2, True), ('bob', 2, 2, True), ('carol', 2, 2, True), ('nobody', 0, 0, False)]
+        assert sorted(os.listdir(str(tmpdir))) == ['alice.jsonl', 'bob.jsonl', 'carol.jsonl']
+    finally:
+        for kbase in users:
+            kbase.close()
+
+def test_links_by_other_keys_are_refused(api, keypair, tmpdir, golden):
+    '''
+    A new link whose kid isn't one of the user's keys fails even though it
+    fits the chain, and so does a PGP signed link with one of the user's
+    kids but a signature by a PGP key the user doesn't have.
+    '''
+    api.chains['tester'] = extend([], keypair, 2)
+    chain = sigchain.Sigchain('tester', str(tmpdir))
+    kbase = user(keypair)
+    try:
+        chain.sync(kbase)
+        extend(api.chains['tester'], keypair, 1, kid='0120' + 'ab' * 32 + '0a')
+        with pytest.raises(sigchain.SigchainVerifyError) as excinfo:
+            chain.sync(kbase)
+        assert 'not one of the user' in str(excinfo.value)
+        assert chain.seqno == 2
+    finally:
+        kbase.close()
+    bundle = golden.read('irc.public.key', 'r')
+    stranger = user(keypair, public_keys={
+        'primary': {'bundle': bundle, 'key_fingerprint': openpgp.fingerprints(bundle)[0].lower(), 'kid': KID}})
+    api.chains['tester'] = api.chains['tester'][:2]
+    extend(api.chains['tester'], keypair, 1)
+    try:
+        with pytest.raises(sigchain.SigchainVerifyError) as excinfo:
+            chain.sync(stranger)
+        assert 'PGP key that is not one of the user' in str(excinfo.value)
+        assert chain.seqno == 2
+    finally:
+        stranger.close()
+
+def test_links_by_older_keys(api, keypair, tmpdir, golden):
+    '''
+    Links signed by a PGP key that is no longer the user's primary key
+    check out against the user's other bundles and sibkeys.
+    '''
+    bundle = golden.read('irc.public.key', 'r')
+    api.chains['tester'] = extend([], keypair, 2)
+    kbase = user(keypair, public_keys={
+        'primary': {'bundle': bundle, 'key_fingerprint': openpgp.fingerprints(bundle)[0].lower(), 'kid': 'irc-kid'},
+        'all_bundles': [bundle, keypair.bundle],
+        'sibkeys': ['irc-kid', KID],
+    })
+    try:
+        result = sigchain.Sigchain('tester', str(tmpdir)).sync_result(kbase)
+        assert (result.ok, result.seqno, len(result.new), result.unverified) == (True, 2, 2, [])
+    finally:
+        kbase.close()
+
+def test_unsigned_links_are_reported(api, keypair, tmpdir):
+    '''
+    Links signed by a device's NaCl key can't be checked, so they're stored
+    and reported as unverified, or refused if signatures are required.
+    '''
+    api.chains['tester'] = extend([], keypair, 1)
+    extend(api.chains['tester'], None, 2)
+    kbase = user(keypair)
+    try:
+        strict = sigchain.Sigchain('tester', str(tmpdir.mkdir('strict')))
+        result = strict.sync_result(kbase, require_signatures=True)
+        assert (result.ok, result.seqno, result.new) == (False, 0, [])
+        assert 'link 2' in result.error
+        result = sigchain.Sigchain('tester', str(tmpdir)).sync_result(kbase)
+        assert (result.ok, result.seqno, len(result.new), result.unverified) == (True, 3, 3, [2, 3])
+    finally:
+        kbase.close()
@@ -0,0 +1,100 @@
+'''
+Stress tests for sharing Keybase and KeybasePublicKey objects between
+threads.
+'''
+
+import os
+import threading
+
+from keybase import keybase
+
+THREADS = 16
+ROUNDS = 8
+
+def hammer(func):
+    '''
+    Runs ``func(thread, round)`` ROUNDS times in each of THREADS threads,
+    all started at once, and returns the exceptions they raised.
+    '''
+    barrier = threading.Barrier(THREADS)
+    errors = []
+    def worker(thread):
+        barrier.wait()
+        for rnd in range(ROUNDS):
+            try:
+                func(thread, rnd)
+            except Exception as err:  # pylint: disable=W0703
+                errors.append(err)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+def test_one_key_many_threads(golden, make_key):
+    '''
+    Every kind of operation can run on one key from many threads at once,
+    while the janitor keeps evicting its keyring to make room for another
+    key.
+    '''
+    with open(golden.path('helloworld.txt.gpg'), 'rb') as fobj:
+        signed = fobj.read()
+    original = keybase.keyring_janitor.max_homedirs
+    keybase.keyring_janitor.max_homedirs = 1
+    pkey = make_key()
+    other = make_key()
+    try:
+        def operation(thread, rnd):
+            kind = (thread + rnd) % 5
+            if kind == 0:
+                assert pkey.verify_bytes(signed, throw_error=True)
+            elif kind == 1:
+                assert pkey.verify_file(golden.path('helloworld.txt'), golden.path('helloworld.txt.sig'), throw_error=True)
+            elif kind == 2:
+                assert pkey.encrypt_bytes(b'x' * 4096).startswith(b'\x85')
+            elif kind == 3:
+                assert pkey.encrypt('Hello, world!').startswith('-----BEGIN PGP MESSAGE-----')
+            else:
+                assert other.verify_bytes(signed, throw_error=True)
+        assert hammer(operation) == []
+        assert not pkey.busy and not other.busy
+        assert keybase.keyring_janitor.live() == 1
+    finally:
+        keybase.keyring_janitor.max_homedirs = original
+        pkey.close()
+        other.close()
+
+def test_close_while_busy(golden, make_key):
+    '''
+    Closing a key other threads are using fails their later calls cleanly
+    and removes the keyring once the running calls are done.
+    '''
+    with open(golden.path('helloworld.txt.gpg'), 'rb') as fobj:
+        signed = fobj.read()
+    pkey = make_key()
+    homedir = pkey.homedir
+    def operation(thread, rnd):
+        if thread == 0 and rnd == 1:
+            pkey.close()
+            return
+        try:
+            assert pkey.verify_bytes(signed, throw_error=True)
+        except keybase.KeybasePublicKeyError:
+            assert pkey.closed
+    assert hammer(operation) == []
+    assert not pkey.busy
+    assert not os.path.exists(homedir)
+
+def test_shared_keybase_builds_key_once(golden):
+    '''
+    Threads asking a shared Keybase object for the same key all get the
+    same KeybasePublicKey.
+    '''
+    bundle = golden.read('irc.public.key', 'r')
+    user_object = {'public_keys': {'primary': {'bundle': bundle, 'key_fingerprint': golden.fingerprint}}}
+    kbase = keybase.Keybase._from_user_object('irc', user_object)
+    keys = []
+    assert hammer(lambda thread, rnd: keys.append(kbase.get_public_key())) == []
+    assert len(set(id(key) for key in keys)) == 1
+    kbase.close()